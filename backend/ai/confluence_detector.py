@@ -1,7 +1,7 @@
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Tuple, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 import logging
 
@@ -9,6 +9,7 @@ from .elliott_waves import ElliottWaveAnalyzer
 from .chart_patterns import ChartPatternDetector
 from .fibonacci import FibonacciAnalyzer
 from database.models import TechnicalAnalysis, Signal, SignalType, AnalysisType
+from monitoring.metrics import stage_timer
 
 @dataclass
 class ConfluencePoint:
@@ -18,6 +19,19 @@ class ConfluencePoint:
     analyses: List[str] 
     description: str
 
+@dataclass
+class SharedAnalysis:
+    """Análisis que no dependen del usuario para un (símbolo, timeframe) en una vela"""
+    symbol: str
+    timeframe: str
+    df: pd.DataFrame
+    base_analyses: List[Tuple[AnalysisType, Dict]]
+    strategy_results: Dict[str, Optional[Dict]] = field(default_factory=dict)
+    
+    @property
+    def bar_time(self):
+        return self.df.index[-1]
+
 class TradingStrategyComponent:
     """Componente base para estrategias de trading"""
     
@@ -31,6 +45,20 @@ class TradingStrategyComponent:
         """Método base para análisis de estrategia"""
         raise NotImplementedError("Subclasses must implement analyze method")
     
+    def signal_series(self, df: pd.DataFrame, config=None) -> pd.Series:
+        """
+        Señal de entrada para cada vela del histórico en una sola pasada
+        (1 = compra, -1 = venta, 0 = sin señal). En la última vela coincide
+        con lo que detecta analyze().
+        """
+        raise NotImplementedError("Subclasses must implement signal_series method")
+    
+    @staticmethod
+    def _combine_signals(index: pd.Index, buy: pd.Series, sell: pd.Series) -> pd.Series:
+        """Combina máscaras de compra/venta en una serie de señales int8"""
+        values = np.where(buy.to_numpy(dtype=bool), 1, np.where(sell.to_numpy(dtype=bool), -1, 0))
+        return pd.Series(values.astype(np.int8), index=index, name="signal")
+    
     def get_weight_multiplier(self, timeframe: str) -> float:
         """Obtener multiplicador de peso según temporalidad"""
         if timeframe in self.timeframes:
@@ -94,6 +122,15 @@ class MaletaStrategy(TradingStrategyComponent):
             self.logger.error(f"Error en análisis Maleta: {e}")
             return None
     
+    def signal_series(self, df: pd.DataFrame, config=None) -> pd.Series:
+        """Salidas de sobreventa/sobrecompra del Stochastic Maleta en cada vela"""
+        stoch_k, stoch_d = self._calculate_maleta_stochastic(df)
+        prev_k = stoch_k.shift(1)
+        
+        buy = (stoch_k > 20) & (prev_k <= 20) & (stoch_k > stoch_d)
+        sell = (stoch_k < 80) & (prev_k >= 80) & (stoch_k < stoch_d)
+        return self._combine_signals(df.index, buy, sell)
+    
     def _calculate_maleta_stochastic(self, df: pd.DataFrame, k_period=14, d_period=3) -> Tuple[pd.Series, pd.Series]:
         """Calcular Stochastic personalizado para estrategia Maleta"""
         high = df['High']
@@ -175,6 +212,18 @@ class SwingTradingStrategy(TradingStrategyComponent):
             self.logger.error(f"Error en análisis Swing Trading: {e}")
             return None
     
+    def signal_series(self, df: pd.DataFrame, config=None) -> pd.Series:
+        """Tendencia confirmada por medias y RSI en cada vela"""
+        close = df['Close']
+        ma_20 = close.rolling(window=20).mean()
+        ma_50 = close.rolling(window=50).mean()
+        rsi = self._calculate_rsi(close)
+        rsi_neutral = (rsi > 30) & (rsi < 70)
+        
+        buy = (ma_20 > ma_50) & (close > ma_20) & rsi_neutral
+        sell = (ma_20 < ma_50) & (close < ma_20) & rsi_neutral
+        return self._combine_signals(df.index, buy, sell)
+    
     def _calculate_rsi(self, prices: pd.Series, period=14) -> pd.Series:
         """Calcular RSI"""
         delta = prices.diff()
@@ -250,6 +299,17 @@ class ScalpingStrategy(TradingStrategyComponent):
             self.logger.error(f"Error en análisis Scalping: {e}")
             return None
     
+    def signal_series(self, df: pd.DataFrame, config=None) -> pd.Series:
+        """Momentum de EMAs rápidas y MACD en cada vela"""
+        close = df['Close']
+        ema_5 = close.ewm(span=5).mean()
+        ema_10 = close.ewm(span=10).mean()
+        macd_line, macd_signal, _ = self._calculate_macd(close)
+        
+        buy = (ema_5 > ema_10) & (macd_line > macd_signal) & (macd_line > 0)
+        sell = (ema_5 < ema_10) & (macd_line < macd_signal) & (macd_line < 0)
+        return self._combine_signals(df.index, buy, sell)
+    
     def _calculate_macd(self, prices: pd.Series, fast=12, slow=26, signal=9):
         """Calcular MACD"""
         ema_fast = prices.ewm(span=fast).mean()
@@ -324,6 +384,17 @@ class PositionTradingStrategy(TradingStrategyComponent):
             self.logger.error(f"Error en análisis Position Trading: {e}")
             return None
     
+    def signal_series(self, df: pd.DataFrame, config=None) -> pd.Series:
+        """Tendencia de largo plazo con ADX fuerte en cada vela"""
+        close = df['Close']
+        ma_50 = close.rolling(window=50).mean()
+        ma_200 = close.rolling(window=200).mean()
+        strong_trend = self._calculate_adx(df) > 25
+        
+        buy = (ma_50 > ma_200) & (close > ma_50) & strong_trend
+        sell = (ma_50 < ma_200) & (close < ma_50) & strong_trend
+        return self._combine_signals(df.index, buy, sell)
+    
     def _calculate_adx(self, df: pd.DataFrame, period=14) -> pd.Series:
         """Calcular ADX (Average Directional Index)"""
         high = df['High']
@@ -396,15 +467,8 @@ class ConfluenceDetector:
         """
         try:
             # ✅ NUEVO: Usar configuración personalizada si se proporciona
+            min_confluence_score, analysis_weights = self._scoring_params(config)
             if config:
-                min_confluence_score = config.confluence_threshold
-                # Actualizar pesos si están en la configuración
-                analysis_weights = {
-                    AnalysisType.ELLIOTT_WAVE: config.elliott_wave_weight,
-                    AnalysisType.CHART_PATTERN: config.chart_patterns_weight,
-                    AnalysisType.FIBONACCI: config.fibonacci_weight,
-                    AnalysisType.SUPPORT_RESISTANCE: config.support_resistance_weight
-                }
                 self.logger.info(f"Usando configuración personalizada: confluencia={min_confluence_score}")
                 
                 # ✅ NUEVO: Log de tipo de trader y estrategia
@@ -412,58 +476,101 @@ class ConfluenceDetector:
                     self.logger.info(f"Tipo de trader: {config.trader_type}")
                 if hasattr(config, 'trading_strategy') and config.trading_strategy:
                     self.logger.info(f"Estrategia de trading: {config.trading_strategy}")
-            else:
-                min_confluence_score = self.min_confluence_score
-                analysis_weights = self.analysis_weights
             
             self.logger.info(f"Analizando {symbol} en {timeframe}")
             
-            # ✅ MODIFICADO: Realizar análisis filtrados según configuración
-            analyses = await self._perform_filtered_analyses(df, symbol, timeframe, config)
+            # ✅ MODIFICADO: Realizar sólo los análisis habilitados en la configuración
+            base_analyses = await self._run_base_analyses(df, symbol, timeframe, self._enabled_analyses(config))
+            shared = SharedAnalysis(symbol=symbol, timeframe=timeframe, df=df, base_analyses=base_analyses)
+            
+            return await self._score_analyses(shared, config, min_confluence_score, analysis_weights)
             
-            # ✅ NUEVO: Agregar análisis de estrategia específica
-            if config and hasattr(config, 'trading_strategy') and config.trading_strategy:
+        except Exception as e:
+            self.logger.error(f"Error analizando {symbol}: {e}")
+            return None
+    
+    async def compute_shared_analysis(self, symbol: str, df: pd.DataFrame, timeframe: str) -> SharedAnalysis:
+        """
+        Ejecuta todos los análisis que no dependen del usuario una sola vez,
+        para repartir el resultado entre todos los suscriptores del par
+        """
+        self.logger.info(f"Análisis compartido de {symbol} en {timeframe}")
+        all_analyses = set(self.analysis_weights)
+        base_analyses = await self._run_base_analyses(df, symbol, timeframe, all_analyses)
+        return SharedAnalysis(symbol=symbol, timeframe=timeframe, df=df, base_analyses=base_analyses)
+    
+    async def score_shared_analysis(self, shared: SharedAnalysis, config=None) -> Optional[Signal]:
+        """Aplica la configuración de un usuario (filtros, pesos, umbral, riesgo) a un análisis compartido"""
+        try:
+            min_confluence_score, analysis_weights = self._scoring_params(config)
+            return await self._score_analyses(shared, config, min_confluence_score, analysis_weights)
+        except Exception as e:
+            self.logger.error(f"Error puntuando {shared.symbol}: {e}")
+            return None
+    
+    def _scoring_params(self, config=None) -> Tuple[float, Dict]:
+        """Umbral de confluencia y pesos por análisis según la configuración"""
+        if not config:
+            return self.min_confluence_score, self.analysis_weights
+        return config.confluence_threshold, {
+            AnalysisType.ELLIOTT_WAVE: config.elliott_wave_weight,
+            AnalysisType.CHART_PATTERN: config.chart_patterns_weight,
+            AnalysisType.FIBONACCI: config.fibonacci_weight,
+            AnalysisType.SUPPORT_RESISTANCE: config.support_resistance_weight
+        }
+    
+    async def _score_analyses(self,
+                              shared: SharedAnalysis,
+                              config,
+                              min_confluence_score: float,
+                              analysis_weights: Dict) -> Optional[Signal]:
+        """Etapa de puntuación: lo único que depende de la configuración del usuario"""
+        symbol, timeframe, df = shared.symbol, shared.timeframe, shared.df
+        analyses = self._apply_config_to_analyses(shared.base_analyses, timeframe, config)
+        
+        # ✅ NUEVO: Agregar análisis de estrategia específica
+        if config and hasattr(config, 'trading_strategy') and config.trading_strategy:
+            with stage_timer("strategy"):
                 strategy_analysis = await self._perform_strategy_analysis(
-                    df, config.trading_strategy, timeframe, config
+                    df, config.trading_strategy, timeframe, config, shared
                 )
-                if strategy_analysis:
-                    analyses.append(strategy_analysis)
+            if strategy_analysis:
+                analyses.append(strategy_analysis)
             
-            if not analyses:
-                self.logger.info(f"No se encontraron análisis válidos para {symbol}")
-                return None
-            
-            # Detectar confluencias con pesos personalizados
+        if not analyses:
+            self.logger.info(f"No se encontraron análisis válidos para {symbol}")
+            return None
+        
+        # Detectar confluencias con pesos personalizados
+        with stage_timer("confluence_grouping"):
             confluences = await self._detect_confluence_signals_with_weights(analyses, df, analysis_weights)
-            
-            if not confluences:
-                self.logger.info(f"No se detectaron confluencias para {symbol}")
-                return None
-            
-            # Evaluar la mejor confluencia
-            best_confluence = max(confluences, key=lambda x: x.strength)
-            
-            if best_confluence.strength < min_confluence_score:
-                self.logger.info(f"Confluencia insuficiente para {symbol}: {best_confluence.strength:.2f} < {min_confluence_score}")
-                return None
-            
-            # ✅ MODIFICADO: Generar señal con configuración
+        
+        if not confluences:
+            self.logger.info(f"No se detectaron confluencias para {symbol}")
+            return None
+        
+        # Evaluar la mejor confluencia
+        best_confluence = max(confluences, key=lambda x: x.strength)
+        
+        if best_confluence.strength < min_confluence_score:
+            self.logger.info(f"Confluencia insuficiente para {symbol}: {best_confluence.strength:.2f} < {min_confluence_score}")
+            return None
+        
+        # ✅ MODIFICADO: Generar señal con configuración
+        with stage_timer("signal_generation"):
             signal = await self._generate_signal_with_config(
                 symbol, timeframe, df, best_confluence, analyses, config
             )
-            
-            self.logger.info(f"Señal generada para {symbol}: {signal.signal_type} con confluencia {signal.confluence_score:.2f}")
-            return signal
-            
-        except Exception as e:
-            self.logger.error(f"Error analizando {symbol}: {e}")
-            return None
+        
+        self.logger.info(f"Señal generada para {symbol}: {signal.signal_type} con confluencia {signal.confluence_score:.2f}")
+        return signal
     
     async def _perform_strategy_analysis(self, 
                                        df: pd.DataFrame, 
                                        strategy_name: str, 
                                        timeframe: str,
-                                       config=None) -> Optional[TechnicalAnalysis]:
+                                       config=None,
+                                       shared: Optional[SharedAnalysis] = None) -> Optional[TechnicalAnalysis]:
         """✅ NUEVO: Realizar análisis específico de estrategia"""
         try:
             strategy_key = strategy_name.lower().replace(' ', '_')
@@ -477,8 +584,13 @@ class ConfluenceDetector:
             # Obtener multiplicador de peso según temporalidad
             weight_multiplier = strategy_component.get_weight_multiplier(timeframe)
             
-            # Realizar análisis de la estrategia
-            strategy_result = await strategy_component.analyze(df, config)
+            # Realizar análisis de la estrategia (una vez por análisis compartido)
+            if shared is not None and strategy_key in shared.strategy_results:
+                strategy_result = shared.strategy_results[strategy_key]
+            else:
+                strategy_result = await strategy_component.analyze(df, config)
+                if shared is not None:
+                    shared.strategy_results[strategy_key] = strategy_result
             
             if not strategy_result:
                 return None
@@ -497,109 +609,100 @@ class ConfluenceDetector:
             self.logger.error(f"Error en análisis de estrategia {strategy_name}: {e}")
             return None
     
-    async def _perform_filtered_analyses(self, 
-                                       df: pd.DataFrame, 
-                                       symbol: str, 
-                                       timeframe: str,
-                                       config=None) -> List[TechnicalAnalysis]:
-        """Realizar análisis técnicos filtrados según configuración"""
-        analyses = []
-        
-        # ✅ NUEVO: Verificar qué análisis están habilitados
-        enable_elliott = config.enable_elliott_wave if config else True
-        enable_fibonacci = config.enable_fibonacci if config else True
-        enable_patterns = config.enable_chart_patterns if config else True
-        enable_sr = config.enable_support_resistance if config else True
-        
-        # ✅ NUEVO: Aplicar multiplicadores según tipo de trader
-        trader_multiplier = self._get_trader_type_multiplier(timeframe, config)
+    def _enabled_analyses(self, config=None) -> set:
+        """Tipos de análisis habilitados en la configuración"""
+        enabled = set()
+        if config.enable_elliott_wave if config else True:
+            enabled.add(AnalysisType.ELLIOTT_WAVE)
+        if config.enable_chart_patterns if config else True:
+            enabled.add(AnalysisType.CHART_PATTERN)
+        if config.enable_fibonacci if config else True:
+            enabled.add(AnalysisType.FIBONACCI)
+        if config.enable_support_resistance if config else True:
+            enabled.add(AnalysisType.SUPPORT_RESISTANCE)
+        return enabled
+    
+    async def _run_base_analyses(self,
+                                 df: pd.DataFrame,
+                                 symbol: str,
+                                 timeframe: str,
+                                 enabled: set) -> List[Tuple[AnalysisType, Dict]]:
+        """Ejecutar los análisis técnicos pedidos y devolver sus resultados sin ajustar"""
+        results = []
         
         # Análisis de ondas de Elliott
-        if enable_elliott:
+        if AnalysisType.ELLIOTT_WAVE in enabled:
             try:
-                elliott_result = await self.elliott_analyzer.analyze(df)
+                with stage_timer("elliott_wave"):
+                    elliott_result = await self.elliott_analyzer.analyze(df)
                 if elliott_result:
-                    description = elliott_result.get('description', 'Análisis Elliott Wave')
-                    if description is None:
-                        description = 'Análisis Elliott Wave'
-                    
-                    # Aplicar multiplicador de tipo de trader
-                    adjusted_confidence = elliott_result.get('confidence', 0.5) * trader_multiplier
-                        
-                    analyses.append(TechnicalAnalysis(
-                        type=AnalysisType.ELLIOTT_WAVE,
-                        confidence=min(adjusted_confidence, 1.0),
-                        data=elliott_result,
-                        description=description
-                    ))
+                    if elliott_result.get('description') is None:
+                        elliott_result['description'] = 'Análisis Elliott Wave'
+                    results.append((AnalysisType.ELLIOTT_WAVE, elliott_result))
             except Exception as e:
                 self.logger.warning(f"Error en análisis Elliott Wave: {e}")
         
         # Análisis de patrones
-        if enable_patterns:
+        if AnalysisType.CHART_PATTERN in enabled:
             try:
-                pattern_results = await self.pattern_detector.detect_patterns(df, timeframe)
+                with stage_timer("chart_patterns"):
+                    pattern_results = await self.pattern_detector.detect_patterns(df, timeframe)
                 for pattern in pattern_results:
-                    description = pattern.get('description', 'Patrón chartista detectado')
-                    if description is None:
-                        description = 'Patrón chartista detectado'
-                    
-                    # Aplicar multiplicador de tipo de trader
-                    adjusted_confidence = pattern.get('confidence', 0.5) * trader_multiplier
-                        
-                    analyses.append(TechnicalAnalysis(
-                        type=AnalysisType.CHART_PATTERN,
-                        confidence=min(adjusted_confidence, 1.0),
-                        data=pattern,
-                        description=description
-                    ))
+                    if pattern.get('description') is None:
+                        pattern['description'] = 'Patrón chartista detectado'
+                    results.append((AnalysisType.CHART_PATTERN, pattern))
             except Exception as e:
                 self.logger.warning(f"Error en análisis de patrones: {e}")
         
         # Análisis Fibonacci
-        if enable_fibonacci:
+        if AnalysisType.FIBONACCI in enabled:
             try:
-                if hasattr(self.fibonacci_analyzer, 'analyze'):
-                    fib_result = await self.fibonacci_analyzer.analyze(df)
-                elif hasattr(self.fibonacci_analyzer, 'calculate_levels'):
-                    fib_result = await self.fibonacci_analyzer.calculate_levels(df)
-                else:
-                    fib_result = await self._basic_fibonacci_analysis(df)
+                with stage_timer("fibonacci"):
+                    if hasattr(self.fibonacci_analyzer, 'analyze'):
+                        fib_result = await self.fibonacci_analyzer.analyze(df)
+                    elif hasattr(self.fibonacci_analyzer, 'calculate_levels'):
+                        fib_result = await self.fibonacci_analyzer.calculate_levels(df)
+                    else:
+                        fib_result = await self._basic_fibonacci_analysis(df)
                     
                 if fib_result:
-                    description = fib_result.get('description', 'Análisis Fibonacci')
-                    if description is None:
-                        description = 'Análisis Fibonacci'
-                    
-                    # Aplicar multiplicador de tipo de trader
-                    adjusted_confidence = fib_result.get('confidence', 0.5) * trader_multiplier
-                        
-                    analyses.append(TechnicalAnalysis(
-                        type=AnalysisType.FIBONACCI,
-                        confidence=min(adjusted_confidence, 1.0),
-                        data=fib_result,
-                        description=description
-                    ))
+                    if fib_result.get('description') is None:
+                        fib_result['description'] = 'Análisis Fibonacci'
+                    results.append((AnalysisType.FIBONACCI, fib_result))
             except Exception as e:
                 self.logger.warning(f"Error en análisis Fibonacci: {e}")
         
         # Análisis de soporte y resistencia
-        if enable_sr:
+        if AnalysisType.SUPPORT_RESISTANCE in enabled:
             try:
-                sr_result = await self._analyze_support_resistance(df)
+                with stage_timer("support_resistance"):
+                    sr_result = await self._analyze_support_resistance(df)
                 if sr_result:
-                    # Aplicar multiplicador de tipo de trader
-                    adjusted_confidence = sr_result['confidence'] * trader_multiplier
-                    
-                    analyses.append(TechnicalAnalysis(
-                        type=AnalysisType.SUPPORT_RESISTANCE,
-                        confidence=min(adjusted_confidence, 1.0),
-                        data=sr_result,
-                        description=sr_result['description']
-                    ))
+                    results.append((AnalysisType.SUPPORT_RESISTANCE, sr_result))
             except Exception as e:
                 self.logger.warning(f"Error en análisis S/R: {e}")
         
+        return results
+    
+    def _apply_config_to_analyses(self,
+                                  base_analyses: List[Tuple[AnalysisType, Dict]],
+                                  timeframe: str,
+                                  config=None) -> List[TechnicalAnalysis]:
+        """Filtrar por análisis habilitados y aplicar el multiplicador del tipo de trader"""
+        enabled = self._enabled_analyses(config)
+        trader_multiplier = self._get_trader_type_multiplier(timeframe, config)
+        
+        analyses = []
+        for analysis_type, result in base_analyses:
+            if analysis_type not in enabled:
+                continue
+            adjusted_confidence = result.get('confidence', 0.5) * trader_multiplier
+            analyses.append(TechnicalAnalysis(
+                type=analysis_type,
+                confidence=min(adjusted_confidence, 1.0),
+                data=result,
+                description=result['description']
+            ))
         return analyses
     
     def _get_trader_type_multiplier(self, timeframe: str, config=None) -> float:
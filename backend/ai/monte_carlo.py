@@ -0,0 +1,133 @@
+import numpy as np
+from typing import Dict, Iterable, Optional
+from dataclasses import dataclass, asdict
+
+PERCENTILES = (5, 25, 50, 75, 95, 99)
+
+# Límites de una simulación: n_paths x n_trades floats por array y bloque
+MAX_PATHS = 50000
+MAX_TRADES = 5000
+
+
+@dataclass
+class MonteCarloResult:
+    """Resumen de la simulación de secuencias de trades"""
+    n_paths: int
+    n_trades: int
+    risk_fraction: float
+    ruin_threshold: float
+    ruin_probability: float
+    max_drawdown_percentiles: Dict[str, float]
+    final_return_percentiles: Dict[str, float]
+    recovery_trades_percentiles: Dict[str, float]
+    unrecovered_probability: float
+    losing_streak_percentiles: Dict[str, float]
+    losing_streak_breach_probability: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _percentiles(values: np.ndarray) -> Dict[str, float]:
+    points = np.percentile(values, PERCENTILES)
+    return {f"p{p}": round(float(v), 6) for p, v in zip(PERCENTILES, points)}
+
+
+def _longest_run(mask: np.ndarray) -> np.ndarray:
+    """Racha más larga de True por fila, sin bucles en Python"""
+    n = mask.shape[1]
+    idx = np.arange(1, n + 1, dtype=np.int32)
+    # Índice de la última posición False vista en cada punto
+    last_false = np.maximum.accumulate(np.where(mask, 0, idx), axis=1)
+    return (idx - last_false).max(axis=1)
+
+
+def _simulate_chunk(rng: np.random.Generator,
+                    outcomes: np.ndarray,
+                    n_paths: int,
+                    n_trades: int,
+                    risk_fraction: float,
+                    ruin_level: float) -> Dict[str, np.ndarray]:
+    draws = outcomes[rng.integers(0, outcomes.size, size=(n_paths, n_trades), dtype=np.int32)]
+
+    # Sizing fijo fraccional: cada trade mueve el capital risk_fraction * R.
+    # Se trabaja en log para usar cumsum en lugar de cumprod.
+    growth = np.maximum(1.0 + risk_fraction * draws, 1e-12)
+    log_equity = np.cumsum(np.log(growth), axis=1)
+    log_equity = np.concatenate([np.zeros((n_paths, 1), dtype=log_equity.dtype), log_equity], axis=1)
+    log_peak = np.maximum.accumulate(log_equity, axis=1)
+
+    drawdown = 1.0 - np.exp(log_equity - log_peak)
+    underwater = drawdown > 1e-12
+
+    # Pico previo al peor drawdown: si el capital final no lo supera, nunca se recuperó
+    rows = np.arange(n_paths)
+    worst_peak = log_peak[rows, drawdown.argmax(axis=1)]
+
+    # Un path queda arruinado cuando el capital toca el umbral en cualquier punto
+    ruined = (log_equity.min(axis=1) <= np.log(ruin_level))
+
+    return {
+        "max_drawdown": drawdown.max(axis=1),
+        "final_return": np.exp(log_equity[:, -1]) - 1.0,
+        "recovery": _longest_run(underwater),
+        "unrecovered": log_equity[:, -1] < worst_peak,
+        "ruined": ruined,
+        "losing_streak": _longest_run(draws < 0),
+    }
+
+
+def simulate_trade_sequences(outcomes: Iterable[float],
+                             risk_percentage: float,
+                             n_paths: int = 10000,
+                             n_trades: Optional[int] = None,
+                             ruin_threshold: float = 0.5,
+                             max_losing_streak: Optional[int] = None,
+                             seed: Optional[int] = None,
+                             chunk_size: int = 2500) -> MonteCarloResult:
+    """
+    Remuestrea (bootstrap) los resultados en R de trades históricos para
+    generar `n_paths` curvas de capital de `n_trades` operaciones y resume
+    la distribución de drawdown máximo, probabilidad de ruina (perder
+    `ruin_threshold` del capital) y trades necesarios para recuperar un pico.
+    """
+    outcomes = np.asarray(list(outcomes), dtype=np.float64)
+    outcomes = outcomes[np.isfinite(outcomes)]
+    if outcomes.size == 0:
+        raise ValueError("Se necesita al menos un resultado de trade para simular")
+    if not 0 < ruin_threshold < 1:
+        raise ValueError("ruin_threshold debe estar entre 0 y 1")
+    if not 0 < n_paths <= MAX_PATHS:
+        raise ValueError(f"n_paths debe estar entre 1 y {MAX_PATHS}")
+    if n_trades is not None and not 0 < n_trades <= MAX_TRADES:
+        raise ValueError(f"n_trades debe estar entre 1 y {MAX_TRADES}")
+
+    # Sin n_trades, tantos como la muestra (acotado: la muestra puede ser muy larga)
+    n_trades = n_trades or min(max(outcomes.size, 100), MAX_TRADES)
+    risk_fraction = risk_percentage / 100.0
+    rng = np.random.default_rng(seed)
+
+    # Por bloques para acotar memoria (10k x 1k floats serían ~80 MB por array)
+    chunks = []
+    for start in range(0, n_paths, chunk_size):
+        size = min(chunk_size, n_paths - start)
+        chunks.append(_simulate_chunk(rng, outcomes, size, n_trades, risk_fraction, 1.0 - ruin_threshold))
+    merged = {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+
+    breach = None
+    if max_losing_streak:
+        breach = round(float(np.mean(merged["losing_streak"] > max_losing_streak)), 6)
+
+    return MonteCarloResult(
+        n_paths=n_paths,
+        n_trades=n_trades,
+        risk_fraction=risk_fraction,
+        ruin_threshold=ruin_threshold,
+        ruin_probability=round(float(np.mean(merged["ruined"])), 6),
+        max_drawdown_percentiles=_percentiles(merged["max_drawdown"]),
+        final_return_percentiles=_percentiles(merged["final_return"]),
+        recovery_trades_percentiles=_percentiles(merged["recovery"]),
+        unrecovered_probability=round(float(np.mean(merged["unrecovered"])), 6),
+        losing_streak_percentiles=_percentiles(merged["losing_streak"]),
+        losing_streak_breach_probability=breach,
+    )
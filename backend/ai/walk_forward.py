@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Optional
+from dataclasses import dataclass, asdict
+
+
+@dataclass
+class WindowResult:
+    """Resultado de una ventana fuera de muestra"""
+    start: str
+    end: str
+    bars: int
+    trades: int
+    long_trades: int
+    short_trades: int
+    hit_rate: float
+    avg_return: float
+    total_return: float
+    # None sin operaciones perdedoras (no hay cociente finito que dar)
+    profit_factor: Optional[float]
+
+
+def forward_returns(close: pd.Series, horizon: int) -> np.ndarray:
+    """Retorno desde el cierre de cada vela hasta `horizon` velas después (NaN al final)"""
+    if horizon < 1:
+        raise ValueError("horizon debe ser al menos 1 vela")
+    prices = close.to_numpy(dtype=float)
+    result = np.full(prices.shape, np.nan)
+    if horizon < len(prices):
+        result[:-horizon] = prices[horizon:] / prices[:-horizon] - 1.0
+    return result
+
+
+def entry_mask(direction: np.ndarray, horizon: int) -> np.ndarray:
+    """
+    Velas en las que se abre posición: la señal pasa a un valor no nulo y no
+    hay otra posición abierta. Las estrategias de estado (Swing/Position)
+    mantienen la señal varias velas; sin esto cada vela contaría como trade.
+    """
+    previous = np.concatenate([[0.0], direction[:-1]])
+    candidates = np.flatnonzero((direction != 0) & (direction != previous))
+    mask = np.zeros(direction.shape, dtype=bool)
+    next_free = 0
+    for index in candidates:
+        if index >= next_free:
+            mask[index] = True
+            next_free = index + horizon
+    return mask
+
+
+def signal_returns(df: pd.DataFrame,
+                   signals: pd.Series,
+                   horizon: int = 10,
+                   cost: float = 0.0) -> np.ndarray:
+    """
+    Retorno de cada entrada de la serie de señales manteniendo la posición
+    `horizon` velas. Devuelve NaN en las velas sin entrada o sin futuro suficiente.
+    """
+    direction = signals.to_numpy(dtype=float)
+    returns = direction * forward_returns(df['Close'], horizon) - cost
+    returns[~entry_mask(direction, horizon)] = np.nan
+    return returns
+
+
+def _summarize(returns: np.ndarray, direction: np.ndarray) -> Dict:
+    mask = ~np.isnan(returns)
+    trades = returns[mask]
+    gains = trades[trades > 0].sum()
+    losses = -trades[trades < 0].sum()
+    return {
+        "trades": int(trades.size),
+        "long_trades": int(np.count_nonzero(direction[mask] > 0)),
+        "short_trades": int(np.count_nonzero(direction[mask] < 0)),
+        "hit_rate": float(np.mean(trades > 0)) if trades.size else 0.0,
+        "avg_return": float(trades.mean()) if trades.size else 0.0,
+        "total_return": float(trades.sum()),
+        "profit_factor": float(gains / losses) if losses > 0 else None,
+    }
+
+
+def evaluate_signal_series(df: pd.DataFrame,
+                           signals: pd.Series,
+                           horizon: int = 10,
+                           cost: float = 0.0) -> Dict:
+    """Estadísticas de todas las entradas de una serie de señales"""
+    returns = signal_returns(df, signals, horizon, cost)
+    return _summarize(returns, signals.to_numpy(dtype=float))
+
+
+def walk_forward(strategy,
+                 df: pd.DataFrame,
+                 test_size: int = 500,
+                 warmup: int = 200,
+                 step: Optional[int] = None,
+                 horizon: int = 10,
+                 cost: float = 0.0,
+                 config=None) -> Dict:
+    """
+    Evaluación walk-forward de un TradingStrategyComponent.
+
+    La serie de señales se calcula una sola vez sobre todo el histórico (los
+    indicadores sólo usan datos pasados, así que no hay lookahead) y luego se
+    corta en ventanas consecutivas fuera de muestra de `test_size` velas,
+    saltando las primeras `warmup` velas mientras los indicadores se estabilizan.
+    """
+    if horizon < 1:
+        raise ValueError("horizon debe ser al menos 1 vela")
+    step = step or test_size
+    signals = strategy.signal_series(df, config)
+    direction = signals.to_numpy(dtype=float)
+    returns = signal_returns(df, signals, horizon, cost)
+
+    windows: List[WindowResult] = []
+    for start in range(warmup, len(df) - horizon, step):
+        end = min(start + test_size, len(df) - horizon)
+        if end <= start:
+            break
+        stats = _summarize(returns[start:end], direction[start:end])
+        windows.append(WindowResult(
+            start=str(df.index[start]),
+            end=str(df.index[end - 1]),
+            bars=end - start,
+            **stats
+        ))
+
+    window_returns = np.array([w.total_return for w in windows]) if windows else np.array([])
+    overall = _summarize(returns[warmup:], direction[warmup:])
+
+    return {
+        "strategy": getattr(strategy, "name", type(strategy).__name__),
+        "horizon": horizon,
+        "windows": [asdict(w) for w in windows],
+        "overall": overall,
+        "profitable_windows": int(np.count_nonzero(window_returns > 0)),
+        "window_return_std": float(window_returns.std()) if window_returns.size else 0.0,
+    }
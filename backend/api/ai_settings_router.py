@@ -7,6 +7,7 @@ import logging
 from database.models import User
 from database.models import AISettingsRequest, AISettings, AISettingsResponse, AISettingsValidation
 from database.connection import get_database
+from database.cache import find_user_document
 from api.auth import get_current_user
 
 router = APIRouter()
@@ -56,7 +57,7 @@ async def get_ai_settings(
         user_id = str(current_user.id)
         
         # Buscar la configuración en la base de datos
-        ai_settings = await db.ai_settings.find_one({"user_id": user_id})
+        ai_settings = await find_user_document(db, "ai_settings", user_id)
         
         if not ai_settings:
             return JSONResponse(
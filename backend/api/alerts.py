@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
+from datetime import datetime
+import logging
+from bson import ObjectId
+
+from database.models import User
+from database.connection import get_database
+from database.signal_analyses import owner_filter
+from api.auth import get_current_user
+from api.signals import alert_engine, prepare_for_json
+from realtime.alerts import validate_condition
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+class AlertCreateRequest(BaseModel):
+    symbol: str
+    alert_type: str = Field(default="price", description="price o signal")
+    condition: Dict[str, Any]
+    message: str = ""
+
+
+@router.post("/")
+async def create_alert(request: AlertCreateRequest, current_user: User = Depends(get_current_user)):
+    """Crear una alerta y añadirla al motor en memoria"""
+    try:
+        condition = validate_condition(request.alert_type, request.condition)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if alert_engine.count_for_user(current_user.id) >= alert_engine.max_per_user:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {alert_engine.max_per_user} alertas activas por usuario",
+        )
+
+    alert_doc = {
+        "user_id": str(current_user.id),
+        "symbol": request.symbol.upper(),
+        "alert_type": request.alert_type,
+        "condition": condition,
+        "message": request.message,
+        "is_triggered": False,
+        "created_at": datetime.utcnow(),
+        "triggered_at": None,
+    }
+    db = get_database()
+    result = await db.alerts.insert_one(alert_doc)
+    alert_doc["_id"] = result.inserted_id
+    alert_engine.add(alert_doc)
+
+    return prepare_for_json(alert_doc)
+
+
+@router.get("/")
+async def get_alerts(
+    triggered: Optional[bool] = Query(None, description="Filtrar por alertas disparadas"),
+    limit: int = Query(100, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+):
+    """Alertas del usuario, las más recientes primero"""
+    query: Dict[str, Any] = {"user_id": owner_filter(current_user.id)}
+    if triggered is not None:
+        query["is_triggered"] = triggered
+
+    db = get_database()
+    alerts = await db.alerts.find(query).sort("created_at", -1).limit(limit).to_list(length=limit)
+    return {"alerts": prepare_for_json(alerts), "active": alert_engine.count_for_user(current_user.id)}
+
+
+@router.delete("/{alert_id}")
+async def delete_alert(alert_id: str, current_user: User = Depends(get_current_user)):
+    """Eliminar una alerta del usuario"""
+    if not ObjectId.is_valid(alert_id):
+        raise HTTPException(status_code=400, detail="ID de alerta inválido")
+
+    db = get_database()
+    result = await db.alerts.delete_one({"_id": ObjectId(alert_id), "user_id": owner_filter(current_user.id)})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Alerta no encontrada")
+
+    alert_engine.remove(alert_id)
+    return {"message": "Alerta eliminada correctamente"}
@@ -1,15 +1,18 @@
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from pydantic import BaseModel, Field, EmailStr
+import asyncio
 import os
 
 from database.models import User, UserLogin, UserRegister, UserResponse, ExtendedRiskConfig
 from database.connection import db_manager
+from database.cache import user_cache
+from ai.monte_carlo import MAX_PATHS, MAX_TRADES, simulate_trade_sequences
 
 # Configuración
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
@@ -79,10 +82,15 @@ async def get_user_by_email(email: str) -> Optional[User]:
     return None
 
 
-async def get_user_by_id(user_id: str) -> Optional[User]:
+async def get_user_document(user_id: str) -> Optional[dict]:
+    """Documento del usuario (incluye risk_lock) desde la cache; se invalida al escribir"""
     from bson import ObjectId
+    return await user_cache.get(str(user_id), lambda: db_manager.find_one("users", {"_id": ObjectId(str(user_id))}))
+
+
+async def get_user_by_id(user_id: str) -> Optional[User]:
     try:
-        user_data = await db_manager.find_one("users", {"_id": ObjectId(user_id)})
+        user_data = await get_user_document(user_id)
         if user_data:
             user_data["_id"] = str(user_data["_id"])
             return User(**user_data)
@@ -103,6 +111,11 @@ async def authenticate_user(email: str, password: str) -> Optional[User]:
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     """Obtener usuario actual desde el token"""
+    return await get_user_from_token(credentials.credentials)
+
+
+async def get_user_from_token(token: str) -> User:
+    """Validar un token de acceso (cabecera Bearer o query param en SSE)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -110,7 +123,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     )
 
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: Optional[str] = payload.get("sub")
         user_id: Optional[str] = payload.get("user_id")
         token_type: Optional[str] = payload.get("type")
@@ -353,9 +366,7 @@ class RiskLockResponse(BaseModel):
 @router.get("/risk/status", response_model=RiskLockResponse)
 async def get_risk_lock_status(current_user: User = Depends(get_current_active_user)):
     """Devuelve el estado del lock de gestión de riesgo del usuario."""
-    from bson import ObjectId
-
-    doc = await db_manager.find_one("users", {"_id": ObjectId(str(current_user.id))})
+    doc = await get_user_document(current_user.id)
     risk_lock = (doc or {}).get("risk_lock", None)
 
     if not risk_lock or not risk_lock.get("locked"):
@@ -435,4 +446,64 @@ async def lock_risk_configuration(
         source=payload.source,
         mt5_snapshot=payload.mt5_snapshot or {},
         extended_risk_config=payload.extended_risk_config
-    )
\ No newline at end of file
+    )
+
+
+MAX_SAMPLE_TRADES = 20000
+
+
+class MonteCarloRequest(BaseModel):
+    # Resultados en R de un backtest o del historial de trades; las órdenes de
+    # executed_orders no guardan su salida, así que no sirven de muestra
+    r_multiples: List[float] = Field(..., max_length=MAX_SAMPLE_TRADES)
+    risk_percentage: Optional[float] = Field(None, gt=0, le=100)  # por defecto, el del lock de riesgo
+    n_paths: int = Field(default=10000, ge=100, le=MAX_PATHS)
+    n_trades: Optional[int] = Field(default=None, ge=10, le=MAX_TRADES)
+    ruin_threshold: float = Field(default=0.5, gt=0, lt=1)
+    seed: Optional[int] = None
+
+
+@router.post("/risk/monte-carlo")
+async def simulate_risk_configuration(
+    payload: MonteCarloRequest,
+    current_user: User = Depends(get_current_active_user),
+):
+    """Simula curvas de capital con la configuración de riesgo del usuario y devuelve la distribución de drawdown."""
+    doc = await get_user_document(current_user.id) or {}
+    risk_lock = doc.get("risk_lock") or {}
+    risk_management = doc.get("risk_management") or {}
+    extended_config = risk_lock.get("extended_risk_config") or {}
+
+    risk_percentage = payload.risk_percentage
+    if risk_percentage is None:
+        risk_percentage = float(risk_lock.get("risk_percentage", risk_management.get("risk_percentage", 1.0)))
+    total_capital = float(risk_lock.get("total_capital", risk_management.get("total_capital", 0.0)))
+
+    outcomes = payload.r_multiples
+    if len(outcomes) < 10:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Se necesitan al menos 10 trades cerrados para simular"
+        )
+
+    # La simulación es CPU pura: fuera del event loop
+    result = await asyncio.to_thread(
+        simulate_trade_sequences,
+        outcomes,
+        risk_percentage,
+        n_paths=payload.n_paths,
+        n_trades=payload.n_trades,
+        ruin_threshold=payload.ruin_threshold,
+        max_losing_streak=extended_config.get("max_losing_streak"),
+        seed=payload.seed,
+    )
+
+    return {
+        "source": "backtest",
+        "sample_trades": len(outcomes),
+        "total_capital": total_capital,
+        "risk_percentage": risk_percentage,
+        "locked": bool(risk_lock.get("locked")),
+        "simulation": result.to_dict(),
+        "timestamp": datetime.utcnow().isoformat(),
+    }
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from fastapi.responses import JSONResponse
 from typing import List, Dict, Optional, Any
 import asyncio
@@ -9,6 +9,7 @@ import numpy as np
 import pandas as pd
 from database.models import User
 from database.connection import get_database
+from database.timeseries import CandleStore
 from mt5.data_provider import MT5DataProvider
 from api.auth import get_current_user
 from bson import ObjectId
@@ -29,6 +30,7 @@ plt.switch_backend('Agg')
 
 
 mt5_provider = MT5DataProvider()
+candle_store = CandleStore(get_database)
 
 def prepare_for_json(data):
     """Prepara datos para serialización JSON"""
@@ -153,6 +155,27 @@ async def generate_chart_image(
             }
         )
 
+@router.get("/history/{symbol}/{timeframe}")
+async def get_candle_history(
+    symbol: str,
+    timeframe: str,
+    start: Optional[datetime] = Query(None, description="Inicio del rango (UTC, incluido)"),
+    end: Optional[datetime] = Query(None, description="Fin del rango (UTC, excluido)"),
+    limit: int = Query(500, ge=1, le=20000),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Velas guardadas del rango en formato columnar: la lectura es proporcional
+    al rango pedido, no al histórico completo del símbolo
+    """
+    arrays = await candle_store.read_candles(symbol.upper(), timeframe.upper(), start, end, limit)
+    return JSONResponse(content={
+        "symbol": symbol.upper(),
+        "timeframe": timeframe.upper(),
+        "count": int(len(arrays["t"])),
+        **{name: values.tolist() for name, values in arrays.items()},
+    })
+
 def generate_mock_data(symbol: str, timeframe: str, periods: int = 100) -> pd.DataFrame:
     """
     Genera datos mock realistas para el gráfico usando la misma estructura que tu MT5DataProvider
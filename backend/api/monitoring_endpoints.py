@@ -0,0 +1,191 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import Optional
+from datetime import datetime
+import logging
+
+from config import settings
+from database.models import User, UserRole
+from api.auth import get_current_user
+from database.connection import get_database
+from database.cache import cache_stats
+from database.indexes import verify_query_plans
+from database.performance import backfill_performance_stats
+from monitoring.profiler import request_profiler
+from monitoring.loop_watchdog import loop_watchdog
+from monitoring.mongo_pool import pool_listener
+from api.signals import alert_engine, archive_job, event_log, manager, outcome_tracker, subscriptions, write_behind
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+async def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    """Restringe el endpoint a administradores"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+
+@router.get("/profiles")
+async def list_profiles(
+    path: Optional[str] = None,
+    admin_user: User = Depends(get_admin_user),
+):
+    """
+    Lista los perfiles de requests capturados recientemente (más nuevos primero).
+    Los stacks son del hilo del event loop entero: con requests concurrentes
+    (shared_samples > 0) parte de las muestras pueden ser de otros requests.
+    """
+    profiles = request_profiler.list_profiles(path)
+    return JSONResponse(content={
+        "profiles": profiles,
+        "count": len(profiles),
+        "profiled_paths": list(request_profiler.paths),
+        "sample_rate": request_profiler.sample_rate,
+        "attribution": "event_loop_thread",
+        "timestamp": datetime.utcnow().isoformat(),
+    })
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(
+    profile_id: str,
+    admin_user: User = Depends(get_admin_user),
+):
+    """
+    Descarga los stacks colapsados de un perfil (entrada para flamegraph.pl o speedscope)
+    """
+    record = request_profiler.get_profile(profile_id)
+    if record is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Perfil no encontrado", "detail": f"No existe el perfil {profile_id}"}
+        )
+
+    return PlainTextResponse(
+        content=record.collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{record.id}.folded"'}
+    )
+
+
+@router.get("/loop-blocks")
+async def list_loop_blocks(
+    limit: int = 20,
+    admin_user: User = Depends(get_admin_user),
+):
+    """
+    Bloqueos del event loop agrupados por endpoint y función culpable,
+    más los eventos más recientes con su stack completo
+    """
+    recent = [event.to_dict() for event in list(loop_watchdog.events)[-limit:]]
+    recent.reverse()
+    return JSONResponse(content={
+        "threshold_ms": loop_watchdog.threshold * 1000.0,
+        "culprits": loop_watchdog.culprit_summary(),
+        "recent": recent,
+        "timestamp": datetime.utcnow().isoformat(),
+    })
+
+
+@router.get("/subscriptions")
+async def list_subscriptions(admin_user: User = Depends(get_admin_user)):
+    """
+    Claves (símbolo, timeframe) activas y cuántos usuarios mira cada una
+    """
+    return JSONResponse(content={
+        **subscriptions.stats(),
+        "timestamp": datetime.utcnow().isoformat(),
+    })
+
+
+@router.get("/connections")
+async def list_connections(admin_user: User = Depends(get_admin_user)):
+    """
+    Conexiones WebSocket abiertas y profundidad de la cola de envío de cada una
+    """
+    return JSONResponse(content={
+        **manager.stats(),
+        "event_log": event_log.stats(),
+        "alerts": alert_engine.stats(),
+        "outcomes": outcome_tracker.stats(),
+        "timestamp": datetime.utcnow().isoformat(),
+    })
+
+
+@router.get("/mongo-pool")
+async def mongo_pool_status(admin_user: User = Depends(get_admin_user)):
+    """
+    Conexiones abiertas, en uso y en espera por servidor (histórico de esperas en /metrics)
+    """
+    return JSONResponse(content={
+        "servers": pool_listener.stats(),
+        "max_pool_size": settings.mongo_max_pool_size,
+        "min_pool_size": settings.mongo_min_pool_size,
+        "timestamp": datetime.utcnow().isoformat(),
+    })
+
+
+@router.get("/write-behind")
+async def write_behind_status(admin_user: User = Depends(get_admin_user)):
+    """
+    Escrituras pendientes por colección en la cola diferida
+    """
+    return JSONResponse(content={
+        **write_behind.stats(),
+        "timestamp": datetime.utcnow().isoformat(),
+    })
+
+
+@router.get("/caches")
+async def cache_status(admin_user: User = Depends(get_admin_user)):
+    """
+    Entradas de las caches de documentos por usuario (aciertos y fallos en /metrics)
+    """
+    return JSONResponse(content={
+        **cache_stats(),
+        "timestamp": datetime.utcnow().isoformat(),
+    })
+
+
+@router.post("/performance/backfill")
+async def performance_backfill(
+    user_id: Optional[str] = None,
+    admin_user: User = Depends(get_admin_user),
+):
+    """
+    Suma a performance_stats las señales con resultado que aún no contaban
+    """
+    documents = await backfill_performance_stats(get_database(), user_id)
+    return JSONResponse(content={
+        "documents": documents,
+        "timestamp": datetime.utcnow().isoformat(),
+    })
+
+
+@router.post("/archive/run")
+async def run_archive(admin_user: User = Depends(get_admin_user)):
+    """
+    Pasada del job de archivo ahora mismo (señales y órdenes anteriores al horizonte)
+    """
+    archived = await archive_job.run_once()
+    return JSONResponse(content={
+        "archived": archived,
+        "after_days": archive_job.after_days,
+        "timestamp": datetime.utcnow().isoformat(),
+    })
+
+
+@router.get("/indexes")
+async def index_diagnostics(admin_user: User = Depends(get_admin_user)):
+    """
+    explain() de las consultas declaradas en database.indexes: índice usado,
+    recorridos completos de colección y ordenaciones en memoria
+    """
+    reports = await verify_query_plans(get_database())
+    return JSONResponse(content={
+        "queries": reports,
+        "collection_scans": sum(1 for r in reports if r.get("collection_scan")),
+        "in_memory_sorts": sum(1 for r in reports if r.get("in_memory_sort")),
+        "timestamp": datetime.utcnow().isoformat(),
+    })
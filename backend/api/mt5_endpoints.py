@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Any, Callable, Tuple
@@ -18,7 +18,11 @@ except Exception:
 
 from database.models import User, MT5Session, PyObjectId, MT5Profile
 from database.connection import get_database
+from database.cache import find_user_document, invalidate_for
 from api.auth import get_current_user
+from api.signals import export_response, publish_user_event, write_behind
+from database.archive import create_archive_reader
+from database.pagination import csv_lines, fetch_page, iter_documents, ndjson_lines
 
 from mt5.data_provider import MT5DataProvider
 
@@ -252,7 +256,8 @@ async def _get_or_create_mt5_session(user_id: str, db) -> Optional[Dict[str, Any
     if session_doc:
         if session_doc.get("expires_at") and session_doc["expires_at"] > datetime.utcnow():
 
-            await db.mt5_sessions.update_one(
+            await write_behind.update(
+                "mt5_sessions",
                 {"_id": session_doc["_id"]},
                 {"$set": {"last_activity": datetime.utcnow()}}
             )
@@ -447,6 +452,7 @@ async def save_ai_settings(
             },
             upsert=True
         )
+        invalidate_for("ai_settings", {"user_id": user_id})
 
         response_data = prepare_for_json(ai_settings_doc)
         
@@ -485,7 +491,7 @@ async def load_ai_settings(
         user_id = str(current_user.id)
         
 
-        ai_settings_doc = await db.ai_settings.find_one({"user_id": user_id})
+        ai_settings_doc = await find_user_document(db, "ai_settings", user_id)
         
         if not ai_settings_doc:
 
@@ -538,6 +544,7 @@ async def reset_ai_settings(
         user_id = str(current_user.id)
 
         await db.ai_settings.delete_one({"user_id": user_id})
+        invalidate_for("ai_settings", {"user_id": user_id})
 
         default_settings = get_default_ai_settings()
         
@@ -743,6 +750,14 @@ async def connect_mt5(body: ConnectRequest, current_user: User = Depends(get_cur
     }
     
     await _update_mt5_session(user_id, db, session_data)
+    await publish_user_event(user_id, {
+        "type": "session_status",
+        "connected": True,
+        "account_type": account_type,
+        "login": session_data["login"],
+        "server": session_data["server"],
+        "timestamp": datetime.utcnow().isoformat(),
+    })
 
     # Guardar perfil en DB 
     if body.remember:
@@ -755,6 +770,7 @@ async def connect_mt5(body: ConnectRequest, current_user: User = Depends(get_cur
             "updated_at": datetime.utcnow(),
         }
         await db.mt5_profiles.update_one({"user_id": user_id}, {"$set": profile_doc}, upsert=True)
+        invalidate_for("mt5_profiles", {"user_id": user_id})
 
     resp = ConnectResponse(
         connected=True,
@@ -783,7 +799,7 @@ async def autoconnect_mt5(current_user: User = Depends(get_current_user), db=Dep
     Útil en arranque o cuando el usuario habilita auto-reconexión.
     """
     user_id = str(current_user.id)
-    profile = await db.mt5_profiles.find_one({"user_id": user_id})
+    profile = await find_user_document(db, "mt5_profiles", user_id)
 
     ok = False
     try:
@@ -822,7 +838,7 @@ async def autoconnect_mt5(current_user: User = Depends(get_current_user), db=Dep
 async def get_account(current_user: User = Depends(get_current_user), db=Depends(get_database)):
     user_id = str(current_user.id)
     session = await _get_or_create_mt5_session(user_id, db)
-    profile = await db.mt5_profiles.find_one({"user_id": user_id})
+    profile = await find_user_document(db, "mt5_profiles", user_id)
 
 
     if not session:
@@ -889,6 +905,11 @@ async def disconnect_mt5(current_user: User = Depends(get_current_user), db=Depe
     
 
     await db.mt5_sessions.delete_one({"user_id": user_id})
+    await publish_user_event(user_id, {
+        "type": "session_status",
+        "connected": False,
+        "timestamp": datetime.utcnow().isoformat(),
+    })
 
     if not ok:
         return JSONResponse(
@@ -919,11 +940,12 @@ async def mt5_status(current_user: User = Depends(get_current_user), db=Depends(
     
 
     session = await db.mt5_sessions.find_one({"user_id": user_id})
-    profile = await db.mt5_profiles.find_one({"user_id": user_id})
+    profile = await find_user_document(db, "mt5_profiles", user_id)
     
 
     if session:
-        await db.mt5_sessions.update_one(
+        await write_behind.update(
+            "mt5_sessions",
             {"_id": session["_id"]},
             {"$set": {
                 "is_connected": connected,
@@ -956,6 +978,7 @@ async def save_profile(body: Profile, current_user: User = Depends(get_current_u
         "updated_at": datetime.utcnow(),
     }
     await db.mt5_profiles.update_one({"user_id": user_id}, {"$set": doc}, upsert=True)
+    invalidate_for("mt5_profiles", {"user_id": user_id})
     return JSONResponse(
         content=ProfileResponse(
             exists=True,
@@ -968,7 +991,7 @@ async def save_profile(body: Profile, current_user: User = Depends(get_current_u
 @router.get("/profile", response_model=ProfileResponse)
 async def get_profile(current_user: User = Depends(get_current_user), db=Depends(get_database)):
     user_id = str(current_user.id)
-    doc = await db.mt5_profiles.find_one({"user_id": user_id})
+    doc = await find_user_document(db, "mt5_profiles", user_id)
 
     if not doc:
         return ProfileResponse(exists=False, profile=None, timestamp=datetime.utcnow().isoformat())
@@ -999,6 +1022,7 @@ async def delete_profile(current_user: User = Depends(get_current_user), db=Depe
 
 
     await db.mt5_profiles.delete_one({"user_id": user_id})
+    invalidate_for("mt5_profiles", {"user_id": user_id})
 
 
     await db.mt5_sessions.delete_one({"user_id": user_id})
@@ -1327,12 +1351,9 @@ async def execute_order(
                 "mt5_result": prepare_for_json(result),
             }
 
-            try:
-                logger.info("💾 Saving order to database...")
-                insert_result = await db.executed_orders.insert_one(order_doc)
-                logger.info(f"✅ Order saved to database with ID: {insert_result.inserted_id}")
-            except Exception as db_error:
-                logger.error(f"❌ Database error: {db_error}")
+            # La orden ya se ejecutó en MT5: se persiste en segundo plano sin retrasar la respuesta
+            await write_behind.insert("executed_orders", order_doc)
+            logger.info(f"💾 Order queued for persistence with ID: {order_doc['_id']}")
 
 
             response_data = {
@@ -1348,6 +1369,9 @@ async def execute_order(
                 "timestamp": datetime.utcnow().isoformat(),
             }
 
+            # Las demás pestañas (y las que reconecten) también ven la ejecución
+            await publish_user_event(str(current_user.id), {"type": "order_filled", **response_data})
+
             logger.info(f"📤 Sending success response: {response_data}")
             return JSONResponse(content=response_data)
         else:
@@ -1419,31 +1443,43 @@ def _is_connected_safe():
         logger.error(f"💥 Error checking MT5 connection: {e}")
         return False
 
+# Columnas del export CSV de órdenes
+ORDER_EXPORT_COLUMNS = [
+    "id", "ticket", "symbol", "order_type", "volume", "entry_price", "stop_loss", "take_profit",
+    "status", "executed_at",
+]
+
+
 @router.get("/orders")
 async def get_user_orders(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
     current_user: User = Depends(get_current_user),
     db=Depends(get_database),
 ):
     """
-    Obtiene las órdenes ejecutadas del usuario
+    Obtiene las órdenes ejecutadas del usuario, de la más reciente hacia atrás, por páginas
     """
     try:
-        orders = (
-            await db.executed_orders.find({"user_id": current_user.id})
-            .sort("executed_at", -1)
-            .limit(50)
-            .to_list(length=50)
-        )
+        try:
+            orders, next_cursor = await fetch_page(
+                db.executed_orders, {"user_id": current_user.id}, "executed_at", limit, cursor
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
         cleaned_orders = [prepare_for_json(order) for order in orders]
 
         response_data = {
             "orders": cleaned_orders,
             "count": len(cleaned_orders),
+            "next_cursor": next_cursor,
             "timestamp": datetime.utcnow().isoformat(),
         }
 
         return JSONResponse(content=response_data)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting user orders: {e}", exc_info=True)
         return JSONResponse(
@@ -1455,6 +1491,23 @@ async def get_user_orders(
             },
         )
 
+@router.get("/orders/export")
+async def export_user_orders(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    current_user: User = Depends(get_current_user),
+    db=Depends(get_database),
+):
+    """
+    Descarga todas las órdenes del usuario en streaming (NDJSON o CSV)
+    """
+    docs = iter_documents(db.executed_orders, {"user_id": current_user.id}, "executed_at")
+    docs = create_archive_reader().rehydrate("executed_orders", docs)
+    if export_format == "csv":
+        lines = csv_lines(docs, ORDER_EXPORT_COLUMNS, prepare_for_json)
+    else:
+        lines = ndjson_lines(docs, prepare_for_json)
+    return export_response(lines, export_format, "orders")
+
 @router.post("/admin/cleanup-mt5-sessions")
 async def cleanup_mt5_sessions(
     current_user: User = Depends(get_current_user), 
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime
+import logging
+
+from database.models import User
+from database.connection import get_database
+from database.performance import ALL_TIME, get_performance_stats
+from api.auth import get_current_user
+from api.signals import prepare_for_json
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+@router.get("/")
+async def get_performance(
+    period: str = Query(ALL_TIME, description="all o un mes YYYY-MM"),
+    current_user: User = Depends(get_current_user),
+):
+    """Estadísticas precalculadas del usuario (se mantienen al cerrar cada señal)"""
+    if period != ALL_TIME:
+        try:
+            datetime.strptime(period, "%Y-%m")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="period debe ser 'all' o YYYY-MM")
+
+    stats = await get_performance_stats(get_database(), current_user.id, period)
+    if stats is None:
+        return {"period": period, "total_signals": 0, "win_rate": 0.0, "total_pips": 0.0}
+    return prepare_for_json(stats)
@@ -4,7 +4,7 @@ from bson import ObjectId
 
 from database.connection import db_manager
 from database.models import User
-from api.auth import get_current_active_user
+from api.auth import get_current_active_user, get_user_document
 
 from database.models import (
     ExtendedRiskConfig,
@@ -18,7 +18,7 @@ router = APIRouter(prefix="/risk", tags=["risk-management"])
 @router.get("/status", response_model=RiskLockResponse)
 async def get_risk_lock_status(current_user: User = Depends(get_current_active_user)):
     """Devuelve el estado del lock de gestión de riesgo del usuario."""
-    doc = await db_manager.find_one("users", {"_id": ObjectId(str(current_user.id))})
+    doc = await get_user_document(current_user.id)
     risk_lock = (doc or {}).get("risk_lock", None)
 
     if not risk_lock or not risk_lock.get("locked"):
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
-from typing import List, Dict, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Iterable, List, Dict, Optional
 import asyncio
 import json
 from datetime import datetime, timedelta
@@ -10,98 +10,226 @@ from datetime import datetime
 import pandas as pd
 from database.models import User, Signal, AnalysisConfig
 from database.connection import get_database
+from database.archive import create_archive_job, create_archive_reader
+from database.cache import find_user_document, invalidate_for
+from database.pagination import csv_lines, fetch_page, iter_documents, ndjson_lines
+from database.signal_feed import current_signal_seq, get_signal_changes, remove_signal
+from database.write_behind import create_write_behind
+from database.timeseries import CandleStore, SignalSampleStore
+from database.signal_analyses import (
+    COLD_FIELDS, SIGNAL_LIST_PROJECTION, analysis_document, get_signal_detail, owner_filter, split_signal_document,
+)
 from mt5.data_provider import MT5DataProvider
-from ai.confluence_detector import ConfluenceDetector
-from api.auth import get_current_user
+from ai.confluence_detector import ConfluenceDetector, SharedAnalysis
+from api.auth import get_current_user, get_user_from_token
 from database.models import SignalType
 from bson import ObjectId
 from fastapi import Body
+from monitoring.metrics import stage_timer
+from realtime.bar_scheduler import create_bar_scheduler
+from realtime.tick_hub import create_tick_hub, merge_tick_messages
+from realtime.alerts import create_alert_engine
+from realtime.outcome_tracker import create_outcome_tracker
+from realtime.candles import CANDLE_TIMEFRAMES, create_candle_builder, merge_candle_messages
+from realtime.connections import ClientConnection, SseConnection, create_connection_manager
+from realtime.event_log import create_event_log
+from realtime.subscriptions import (
+    SubscriptionKey, SubscriptionRegistry, TICKS, candles_timeframe, is_live_timeframe, split_candles_timeframe,
+)
+from config import settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.user_connections: Dict[str, WebSocket] = {}
-    
-    async def connect(self, websocket: WebSocket, user_id: str):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        self.user_connections[user_id] = websocket
-        logger.info(f"Usuario {user_id} conectado via WebSocket")
-    
-    def disconnect(self, websocket: WebSocket, user_id: str):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        if user_id in self.user_connections:
-            del self.user_connections[user_id]
-        logger.info(f"Usuario {user_id} desconectado")
-    
-    async def send_personal_message(self, message: str, user_id: str):
-        websocket = self.user_connections.get(user_id)
-        if websocket:
-            try:
-                await websocket.send_text(message)
-            except Exception as e:
-                logger.error(f"Error enviando mensaje a {user_id}: {e}")
-    
-    async def broadcast(self, message: str):
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                logger.error(f"Error en broadcast: {e}")
-                disconnected.append(connection)
-        
+manager = create_connection_manager()
 
-        for conn in disconnected:
-            if conn in self.active_connections:
-                self.active_connections.remove(conn)
+# Señales, órdenes y sesiones se persisten por lotes fuera del camino de la petición
+write_behind = create_write_behind(get_database)
 
-manager = ConnectionManager()
+# Eventos reanudables por usuario: un cliente que reconecta pide sólo lo que se perdió
+event_log = create_event_log()
+
+async def persist_signal(signal_doc: Dict) -> Dict:
+    """
+    Encola el resumen en trading_signals y el análisis comprimido en
+    signal_analyses; el documento completo queda con su _id para el push
+    """
+    if settings.signal_ttl_days > 0:
+        # Índice TTL sobre expires_at: sólo caducan las señales que lo llevan
+        signal_doc["expires_at"] = signal_doc["timestamp"] + timedelta(days=settings.signal_ttl_days)
+    # Las señales se guardan con el user_id como str, igual desde REST y desde tiempo real
+    signal_doc["user_id"] = str(signal_doc["user_id"])
+    summary, cold = split_signal_document(signal_doc)
+    await write_behind.insert("trading_signals", summary)
+    signal_doc["_id"] = summary["_id"]
+    await write_behind.insert(
+        "signal_analyses",
+        analysis_document(summary["_id"], signal_doc["user_id"], cold, expires_at=signal_doc.get("expires_at")),
+    )
+    return signal_doc
+
+async def publish_user_event(user_id: str, payload: Dict):
+    """Envía un evento reanudable; queda en el buffer del usuario aunque no esté conectado"""
+    user_id = str(user_id)
+    await manager.send_personal_message(event_log.append(user_id, payload), user_id)
 
 # Inicializar componentes
 mt5_provider = MT5DataProvider()
 confluence_detector = ConfluenceDetector()
 
+# Qué está mirando cada usuario: decide qué calculan el hub de ticks y el scheduler
+subscriptions = SubscriptionRegistry()
+
+async def send_ticks(user_id: str, message: Dict):
+    """Los ticks pendientes de un cliente lento se fusionan en lugar de acumularse"""
+    await manager.send_personal_message(message, user_id, conflate_key="ticks", merge=merge_tick_messages)
+
+# Un solo poll al terminal por símbolo, compartido por todos los clientes
+tick_hub = create_tick_hub(subscriptions, poll=mt5_provider.get_current_price, send=send_ticks)
+
+async def send_candle(message: Dict, user_ids: Iterable[str], conflate_key: Optional[str]):
+    """La vela en formación pendiente se reemplaza; las cerradas se acumulan"""
+    await manager.send_to_users(message, user_ids, conflate_key=conflate_key, merge=merge_candle_messages)
+
 @router.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    await manager.connect(websocket, user_id)
+    connection = await manager.connect(websocket, user_id)
     try:
-  
+        # Reconexión dentro de la gracia: las suscripciones de análisis siguen vivas
+        cancel_realtime_stop(user_id)
+        await manager.send_to_connection(
+            connection, {"type": "session", "cursor": event_log.latest_cursor(user_id)}
+        )
         await start_realtime_analysis(user_id)
         
         while True:
 
-            data = await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
 
+            # Los comandos llegan como texto JSON o como frame binario del protocolo negociado
+            data = message.get("text") if message.get("text") is not None else message.get("bytes")
             try:
-                command = json.loads(data)
-                await handle_websocket_command(command, user_id)
-            except json.JSONDecodeError:
+                command = connection.codec.decode(data)
+            except ValueError:
                 await manager.send_personal_message(
                     json.dumps({"error": "Formato de comando inválido"}), 
                     user_id
                 )
+                continue
+            await handle_websocket_command(command, user_id, connection)
     except WebSocketDisconnect:
-        manager.disconnect(websocket, user_id)
         logger.info(f"WebSocket disconnected for user {user_id}")
     except Exception as e:
         logger.error(f"Error en websocket_endpoint: {e}")
+    finally:
+        # Con otras pestañas abiertas se mantienen las suscripciones del usuario
+        if not manager.disconnect(websocket, user_id):
+            release_realtime_session(user_id)
+
+@router.get("/stream")
+async def signal_event_stream(
+    request: Request,
+    token: Optional[str] = Query(None, description="Token de acceso (EventSource no envía cabeceras)"),
+    symbols: Optional[str] = Query(None, description="Símbolos con ticks en vivo, separados por comas"),
+    candles: Optional[str] = Query(None, description="Velas en vivo como PAR:TF, separadas por comas"),
+    cursor: Optional[str] = Query(None, description="Cursor desde el que reanudar si no hay Last-Event-ID"),
+):
+    """
+    Alternativa SSE al WebSocket para redes que lo cortan: mismos eventos de
+    señales y precios, heartbeat periódico y reanudación con Last-Event-ID
+    """
+    authorization = request.headers.get("authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise HTTPException(status_code=401, detail="Token requerido")
+    user = await get_user_from_token(token)
+    user_id = str(user.id)
+
+    connection = manager.connect_stream(user_id)
+    try:
+        cancel_realtime_stop(user_id)
+        last_event_id = request.headers.get("last-event-id") or cursor
+        if last_event_id:
+            await resume_session(connection, user_id, last_event_id)
+        else:
+            await manager.send_to_connection(
+                connection, {"type": "session", "cursor": event_log.latest_cursor(user_id)}
+            )
+        await start_realtime_analysis(user_id)
+        feeds = await subscribe_stream_feeds(
+            connection,
+            user_id,
+            [symbol.strip().upper() for symbol in (symbols or "").split(",") if symbol.strip()],
+            [item.strip() for item in (candles or "").split(",") if item.strip()],
+        )
+    except Exception:
+        if not manager.disconnect_stream(connection):
+            release_realtime_session(user_id)
+        raise
+
+    async def events():
+        try:
+            async for frame in connection.stream():
+                yield frame
+        finally:
+            # El cliente cerró (o reabre el stream con otros símbolos): Starlette cancela el generador
+            if manager.disconnect_stream(connection):
+                for symbol, timeframe in feeds:
+                    subscriptions.unsubscribe(user_id, symbol, timeframe)
+            else:
+                release_realtime_session(user_id)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def subscribe_stream_feeds(connection: SseConnection,
+                                 user_id: str,
+                                 symbols: List[str],
+                                 candle_keys: List[str]) -> List[SubscriptionKey]:
+    """Sin canal de comandos, las suscripciones de un stream SSE llegan en la URL"""
+    feeds = []
+    if not symbols and not candle_keys:
+        return feeds
+    if not mt5_provider.connected and not await asyncio.to_thread(mt5_provider.connect):
+        await manager.send_to_connection(connection, {"error": "MT5 no disponible"})
+        return feeds
+
+    for symbol in symbols:
+        subscriptions.subscribe(user_id, symbol, TICKS)
+        feeds.append((symbol, TICKS))
+    if symbols:
+        await manager.send_to_connection(
+            connection, {"type": "ticks", "snapshot": True, "d": tick_hub.snapshot(symbols)}
+        )
+
+    for item in candle_keys:
+        pair, _, timeframe = item.partition(":")
+        timeframe = normalize_timeframe(timeframe or "H1")
+        if pair and timeframe in CANDLE_TIMEFRAMES:
+            subscriptions.subscribe(user_id, pair, candles_timeframe(timeframe))
+            feeds.append((pair.upper(), candles_timeframe(timeframe)))
+    return feeds
 
 async def get_recent_signals(user_id: str, pair: str = None) -> List[Dict]:
     """Obtiene señales recientes para un usuario"""
     try:
-        db = await get_database()
+        db = get_database()
         
-        filter_dict = {"user_id": user_id}
+        # Las señales guardan el par en "symbol"
+        filter_dict = {"user_id": owner_filter(user_id)}
         if pair:
-            filter_dict["pair"] = pair
+            filter_dict["symbol"] = pair
             
-        signals = await db.trading_signals.find(filter_dict).sort("timestamp", -1).limit(20).to_list(length=20)
+        signals = await (
+            db.trading_signals.find(filter_dict, SIGNAL_LIST_PROJECTION).sort("timestamp", -1).limit(20).to_list(length=20)
+        )
         
 
         cleaned_signals = []
@@ -115,52 +243,146 @@ async def get_recent_signals(user_id: str, pair: str = None) -> List[Dict]:
         logger.error(f"Error obteniendo señales recientes: {e}")
         return []
 
-async def handle_websocket_command(command: Dict, user_id: str):
+async def get_signals_delta(user_id: str, since_seq: int, pair: str = None) -> Dict:
+    """Sólo lo que cambió desde la secuencia que ya tiene el cliente"""
+    db = get_database()
+    changes = await get_signal_changes(db, user_id, since_seq, pair, settings.signal_delta_max_items)
+    changes["signals"] = [prepare_for_json(signal) for signal in changes["signals"]]
+    return changes
+
+async def handle_websocket_command(command: Dict, user_id: str, connection: Optional[ClientConnection] = None):
     """Maneja comandos recibidos via WebSocket"""
     command_type = command.get("type")
     
-    if command_type == "subscribe_pair":
+    if command_type == "resume" and connection is not None:
+        await resume_session(connection, user_id, command.get("cursor"))
+
+    elif command_type == "subscribe_pair":
         pair = command.get("pair")
         timeframe = command.get("timeframe", "H1")
         await subscribe_to_pair(user_id, pair, timeframe)
         
     elif command_type == "unsubscribe_pair":
         pair = command.get("pair")
-        await unsubscribe_from_pair(user_id, pair)
+        await unsubscribe_from_pair(user_id, pair, command.get("timeframe"))
         
+    elif command_type == "subscribe_ticks":
+        symbols = command.get("symbols") or [command.get("pair")]
+        symbols = [symbol for symbol in symbols if symbol]
+        if not mt5_provider.connected and not await asyncio.to_thread(mt5_provider.connect):
+            await manager.send_personal_message(json.dumps({"error": "MT5 no disponible"}), user_id)
+            return
+        for symbol in symbols:
+            subscriptions.subscribe(user_id, symbol, TICKS)
+        await manager.send_personal_message(
+            json.dumps({"type": "ticks", "snapshot": True, "d": tick_hub.snapshot(symbols)}),
+            user_id
+        )
+        
+    elif command_type == "unsubscribe_ticks":
+        symbols = command.get("symbols") or [command.get("pair")]
+        for symbol in symbols:
+            if symbol:
+                subscriptions.unsubscribe(user_id, symbol, TICKS)
+        
+    elif command_type == "subscribe_candles":
+        pair = command.get("pair")
+        timeframe = normalize_timeframe(command.get("timeframe", "H1"))
+        if not pair or timeframe not in CANDLE_TIMEFRAMES:
+            await manager.send_personal_message(
+                json.dumps({"error": f"Velas en vivo no disponibles para {pair} {timeframe}"}), user_id
+            )
+            return
+        if not mt5_provider.connected and not await asyncio.to_thread(mt5_provider.connect):
+            await manager.send_personal_message(json.dumps({"error": "MT5 no disponible"}), user_id)
+            return
+        subscriptions.subscribe(user_id, pair, candles_timeframe(timeframe))
+
+    elif command_type == "unsubscribe_candles":
+        pair = command.get("pair")
+        if pair:
+            timeframe = command.get("timeframe")
+            targets = [candles_timeframe(normalize_timeframe(timeframe))] if timeframe else [
+                key[1] for key in subscriptions.keys_for(user_id)
+                if key[0] == pair.upper() and split_candles_timeframe(key[1])
+            ]
+            for target in targets:
+                subscriptions.unsubscribe(user_id, pair, target)
+
     elif command_type == "get_signals":
         pair = command.get("pair")
+        since_seq = command.get("since_seq")
+        if since_seq is not None:
+            # El cliente ya tiene el feed hasta since_seq: se envía sólo el delta
+            delta = await get_signals_delta(user_id, int(since_seq), pair)
+            await manager.send_personal_message(
+                json.dumps({"type": "signals_delta", "pair": pair, **delta}),
+                user_id
+            )
+            return
+
+        seq = await current_signal_seq(get_database(), user_id)
         signals = await get_recent_signals(user_id, pair)
         await manager.send_personal_message(
             json.dumps({
                 "type": "signals_update",
                 "pair": pair,
+                "seq": seq,
                 "signals": signals
             }), 
             user_id
         )
 
 
+# Columnas del export CSV (el NDJSON lleva el resumen completo)
+SIGNAL_EXPORT_COLUMNS = [
+    "id", "symbol", "timeframe", "signal_type", "entry_price", "stop_loss", "take_profit",
+    "confluence_score", "status", "result", "pips_result", "timestamp",
+]
+
+
+def signals_filter(user_id: str, pair: Optional[str], timeframe: Optional[str]) -> Dict:
+    """Las señales guardan el par en "symbol" (índice user_id, symbol, timestamp, _id)"""
+    filter_dict = {"user_id": owner_filter(user_id)}
+    if pair:
+        filter_dict["symbol"] = pair
+    if timeframe:
+        filter_dict["timeframe"] = timeframe
+    return filter_dict
+
+
+def export_response(lines, export_format: str, filename: str) -> StreamingResponse:
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        lines,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
+
+
 @router.get("/signals/")
 async def get_signals(
     pair: Optional[str] = None,
     timeframe: Optional[str] = None,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
     current_user: User = Depends(get_current_user),
     db = Depends(get_database)
 ):
-    """Obtiene las señales de trading"""
+    """Obtiene las señales de trading, de la más reciente hacia atrás, por páginas"""
     try:
         collection = db.trading_signals
-
-        filter_dict = {"user_id": current_user.id}
-        if pair:
-            filter_dict["pair"] = pair
-        if timeframe:
-            filter_dict["timeframe"] = timeframe
+        filter_dict = signals_filter(current_user.id, pair, timeframe)
             
-
-        signals = await collection.find(filter_dict).sort("timestamp", -1).limit(limit).to_list(length=limit)
+        # La secuencia se lee antes de la consulta para no saltarse señales insertadas en medio
+        seq = await current_signal_seq(db, current_user.id)
+        # Sólo el resumen: el análisis completo se pide al abrir el detalle
+        try:
+            signals, next_cursor = await fetch_page(
+                collection, filter_dict, "timestamp", limit, cursor, SIGNAL_LIST_PROJECTION
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         cleaned_signals = []
         for signal in signals:
@@ -175,11 +397,15 @@ async def get_signals(
         response_data = {
             "signals": cleaned_signals,
             "count": len(cleaned_signals),
+            "seq": seq,
+            "next_cursor": next_cursor,
             "timestamp": datetime.utcnow().isoformat()
         }
 
         return JSONResponse(content=response_data)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error obteniendo señales: {e}", exc_info=True)
 
@@ -192,6 +418,26 @@ async def get_signals(
             }
         )
 
+@router.get("/signals/export")
+async def export_signals(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    pair: Optional[str] = None,
+    timeframe: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db = Depends(get_database)
+):
+    """Descarga todas las señales del usuario en streaming (NDJSON o CSV)"""
+    docs = iter_documents(
+        db.trading_signals, signals_filter(current_user.id, pair, timeframe), "timestamp", SIGNAL_LIST_PROJECTION
+    )
+    # Las señales archivadas salen completas desde su fichero mensual
+    docs = create_archive_reader().rehydrate("trading_signals", docs, exclude=COLD_FIELDS)
+    if export_format == "csv":
+        lines = csv_lines(docs, SIGNAL_EXPORT_COLUMNS, prepare_for_json)
+    else:
+        lines = ndjson_lines(docs, prepare_for_json)
+    return export_response(lines, export_format, "signals")
+
 # FUNCIÓN PREPARE_FOR_JSON 
 def prepare_for_json(data):
     """
@@ -274,6 +520,30 @@ def ensure_risk_fields(config):
     class Config:
         json_encoders = {ObjectId: str}
 
+def build_signal_dict(signal: Signal, timeframe: str, config) -> Dict:
+    """Campos de la señal que se guardan en trading_signals"""
+    return {
+        "symbol": signal.symbol,
+        "timeframe": timeframe,
+        "signal_type": getattr(signal.signal_type, "value", str(signal.signal_type)),
+        "entry_price": signal.entry_price,
+        "stop_loss": signal.stop_loss,
+        "take_profit": signal.take_profit,
+        "confluence_score": signal.confluence_score,
+
+        "lot_size": getattr(config, "lot_size", None),
+        "risk_per_trade": getattr(config, "risk_per_trade", None),
+        "technical_analyses": [
+            {
+                "type": ta.type.value if hasattr(ta.type, "value") else str(ta.type),
+                "confidence": ta.confidence,
+                "data": prepare_for_json(ta.data),
+                "description": ta.description,
+            }
+            for ta in (signal.technical_analyses or [])
+        ] if getattr(signal, "technical_analyses", None) else [],
+    }
+
 @router.post("/signals/analyze/{pair}")
 async def analyze_pair(
     pair: str,
@@ -302,7 +572,8 @@ async def analyze_pair(
             raise HTTPException(status_code=503, detail="Error conectando con MT5")
 
 
-        data = mt5_provider.get_realtime_data(pair, effective_timeframe, 500)
+        with stage_timer("data_fetch"):
+            data = mt5_provider.get_realtime_data(pair, effective_timeframe, 500)
         if data is None or data.empty:
             raise HTTPException(status_code=404, detail=f"No se pudieron obtener datos para {pair}")
 
@@ -310,38 +581,17 @@ async def analyze_pair(
         signal = await confluence_detector.analyze_symbol(pair, data, effective_timeframe, config)
 
         saved_signals = []
-        collection = db.trading_signals
 
         config_out = config.dict()
         config_out["timeframe"] = effective_timeframe
 
         if signal:
 
-            signal_dict = {
-                "symbol": signal.symbol,
-                "timeframe": effective_timeframe,
-                "signal_type": getattr(signal.signal_type, "value", str(signal.signal_type)),
-                "entry_price": signal.entry_price,
-                "stop_loss": signal.stop_loss,
-                "take_profit": signal.take_profit,
-                "confluence_score": signal.confluence_score,
-
-                "lot_size": getattr(config, "lot_size", None),
-                "risk_per_trade": getattr(config, "risk_per_trade", None),
-                "technical_analyses": [
-                    {
-                        "type": ta.type.value if hasattr(ta.type, "value") else str(ta.type),
-                        "confidence": ta.confidence,
-                        "data": prepare_for_json(ta.data),
-                        "description": ta.description,
-                    }
-                    for ta in (signal.technical_analyses or [])
-                ] if getattr(signal, "technical_analyses", None) else [],
-            }
+            signal_dict = build_signal_dict(signal, effective_timeframe, config)
 
 
             signal_doc = {
-                "user_id": current_user.id,
+                "user_id": str(current_user.id),
                 **signal_dict,
                 "timestamp": datetime.utcnow(),
                 "status": "ACTIVE",
@@ -349,22 +599,22 @@ async def analyze_pair(
             }
 
 
-            result = await collection.insert_one(signal_doc)
-            signal_doc["_id"] = result.inserted_id
+            with stage_timer("mongo_enqueue"):
+                await persist_signal(signal_doc)
+            outcome_tracker.add(signal_doc)
+            alert_engine.on_signal(current_user.id, signal_doc)
 
             cleaned_signal = prepare_for_json(signal_doc)
             saved_signals.append(cleaned_signal)
 
             try:
-                await manager.send_personal_message(
-                    json.dumps({
+                with stage_timer("websocket_push"):
+                    await publish_user_event(str(current_user.id), {
                         "type": "new_signals",
                         "pair": pair,
                         "signals": saved_signals,
                         "config_used": config_out,
-                    }),
-                    current_user.id,
-                )
+                    })
             except Exception as ws_error:
                 logger.warning(f"Error enviando WebSocket: {ws_error}")
 
@@ -424,18 +674,29 @@ async def update_signal_settings(
     """Actualiza la configuración de señales del usuario"""
     try:
         collection = db.user_settings
+        previous = await get_user_settings(current_user.id, db)
         
         settings_doc = {
-            "user_id": current_user.id,
+            "user_id": str(current_user.id),
             "signal_settings": settings,
             "updated_at": datetime.utcnow()
         }
         
         await collection.replace_one(
-            {"user_id": current_user.id},
+            {"user_id": owner_filter(current_user.id)},
             settings_doc,
             upsert=True
         )
+        invalidate_for("user_settings", {"user_id": current_user.id})
+        
+        # Si el usuario está conectado, el scheduler toma los nuevos pares sin esperar a reconectar
+        user_id = str(current_user.id)
+        if user_id in manager.user_connections:
+            sync_user_subscriptions(
+                user_id,
+                settings.get("pairs_to_monitor", []),
+                (previous or {}).get("pairs_to_monitor", []),
+            )
         
         return JSONResponse(content={"message": "Configuración actualizada exitosamente"})
         
@@ -450,6 +711,43 @@ async def update_signal_settings(
             }
         )
 
+@router.get("/signals/{signal_id}/detail")
+async def get_signal_details(
+    signal_id: str,
+    current_user: User = Depends(get_current_user),
+    db = Depends(get_database)
+):
+    """Señal con sus análisis técnicos completos (vista de detalle)"""
+    try:
+        obj_id = ObjectId(signal_id)
+    except Exception:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": "ID de señal inválido",
+                "detail": f"'{signal_id}' no es un ObjectId válido"
+            }
+        )
+
+    # Una señal recién creada puede seguir en la cola de escritura diferida
+    if write_behind.depth:
+        await write_behind.flush()
+    signal = await get_signal_detail(db, current_user.id, obj_id)
+    if signal is not None and signal.get("archived"):
+        record = await create_archive_reader().record("trading_signals", signal)
+        if record is not None:
+            signal = {**record["doc"], **record.get("analysis", {}), "archived": signal["archived"]}
+    if signal is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "error": "Señal no encontrada",
+                "detail": f"No se encontró señal con ID {signal_id}"
+            }
+        )
+
+    return JSONResponse(content=prepare_for_json(signal))
+
 @router.delete("/signals/{signal_id}")
 async def delete_signal(
     signal_id: str,
@@ -458,8 +756,6 @@ async def delete_signal(
 ):
     """Elimina una señal específica"""
     try:
-        collection = db.trading_signals
-        
         try:
             obj_id = ObjectId(signal_id)
         except Exception:
@@ -471,12 +767,15 @@ async def delete_signal(
                 }
             )
         
-        result = await collection.delete_one({
-            "_id": obj_id,
-            "user_id": current_user.id
-        })
+        # La señal puede seguir en la cola de escritura diferida
+        if write_behind.depth:
+            await write_behind.flush()
+        # Deja una lápida en el feed para que los clientes conectados la quiten
+        deleted = await remove_signal(db, current_user.id, obj_id)
+        if deleted:
+            outcome_tracker.remove(obj_id)
         
-        if result.deleted_count == 0:
+        if not deleted:
             return JSONResponse(
                 status_code=404,
                 content={
@@ -499,93 +798,180 @@ async def delete_signal(
         )
 
 # Funciones auxiliares para análisis en tiempo real
-async def start_realtime_analysis(user_id: str):
-    """Inicia el análisis en tiempo real para un usuario"""
-    asyncio.create_task(realtime_analysis_loop(user_id))
-
-async def realtime_analysis_loop(user_id: str):
-    """Loop principal de análisis en tiempo real"""
-    try:
-        db = await get_database()
-        
-        while user_id in manager.user_connections:
-
-            user_settings = await get_user_settings(user_id, db)
-            
-            if user_settings and user_settings.get("pairs_to_monitor"):
-                for pair_config in user_settings["pairs_to_monitor"]:
-                    pair = pair_config.get("pair")
-                    timeframe = pair_config.get("timeframe", "H1")
-                    
-                    try:
-                        await analyze_pair_realtime(user_id, pair, timeframe, db)
-                    except Exception as e:
-                        logger.error(f"Error analizando par en tiempo real {pair}: {e}")
-            
-            await asyncio.sleep(30) 
-            
-    except Exception as e:
-        logger.error(f"Error en realtime_analysis_loop: {e}")
-
-async def analyze_pair_realtime(user_id: str, pair: str, timeframe: str, db):
-    """Analiza un par en tiempo real y envía señales por WebSocket"""
-    if not mt5_provider.connect():
+async def fetch_bar_data(symbol: str, timeframe: str, count: Optional[int] = None) -> Optional[pd.DataFrame]:
+    """Velas para el scheduler y el constructor de velas, leídas fuera del event loop"""
+    if not mt5_provider.connected and not await asyncio.to_thread(mt5_provider.connect):
         logger.error("MT5 no conectado para análisis en tiempo real")
+        return None
+    return await asyncio.to_thread(
+        mt5_provider.get_realtime_data, symbol, timeframe, count or settings.bar_close_history_bars
+    )
+
+async def deliver_shared_analysis(user_id: str, shared: SharedAnalysis):
+    """Aplica la configuración del usuario al análisis compartido y envía la señal"""
+    config = user_analysis_configs.get(user_id)
+    if config is None:
+        config = await load_user_analysis_config(user_id)
+
+    with stage_timer("scoring"):
+        signal = await confluence_detector.score_shared_analysis(shared, config)
+    if not signal or signal.signal_type == SignalType.HOLD:
         return
-    
-    data = mt5_provider.get_realtime_data(pair, timeframe, 200)
-    if data is None or data.empty:
-        logger.warning(f"No se pudieron obtener datos para {pair} en tiempo real")
-        return
-    
-    signals = confluence_detector.detect_confluence_signals(data, timeframe)
-    
-    if not signals:
-        return
-    
-    collection = db.trading_signals
-    
-    saved_signals = []
-    for signal in signals:
-        signal_doc = {
-            "user_id": user_id,
-            "pair": pair,
-            "timeframe": timeframe,
-            "signal_type": signal.signal_type,
-            "direction": signal.direction,
-            "confidence": signal.confidence,
-            "entry_price": signal.entry_price,
-            "stop_loss": signal.stop_loss,
-            "take_profit": signal.take_profit,
-            "confluences": [conf.to_dict() for conf in signal.confluences],
-            "timestamp": datetime.utcnow(),
-            "status": "ACTIVE"
-        }
-        result = await collection.insert_one(signal_doc)
-        signal_doc["_id"] = result.inserted_id
-        
 
-        cleaned_signal = prepare_for_json(signal_doc)
-        saved_signals.append(cleaned_signal)
-    
+    config_out = config.dict()
+    config_out["timeframe"] = shared.timeframe
+    signal_doc = {
+        "user_id": user_id,
+        **build_signal_dict(signal, shared.timeframe, config),
+        "timestamp": datetime.utcnow(),
+        "bar_time": shared.bar_time.to_pydatetime(),
+        "status": "ACTIVE",
+        "source": "bar_close",
+        "config_used": config_out,
+    }
+
+    with stage_timer("mongo_enqueue"):
+        await persist_signal(signal_doc)
+    outcome_tracker.add(signal_doc)
+    alert_engine.on_signal(user_id, signal_doc)
 
     try:
-        await manager.send_personal_message(
-            json.dumps({
+        with stage_timer("websocket_push"):
+            await publish_user_event(user_id, {
                 "type": "new_realtime_signals",
-                "pair": pair,
-                "signals": saved_signals
-            }),
-            user_id
-        )
+                "pair": shared.symbol,
+                "timeframe": shared.timeframe,
+                "signals": [prepare_for_json(signal_doc)]
+            })
     except Exception as ws_error:
         logger.warning(f"Error enviando WebSocket en tiempo real: {ws_error}")
 
+bar_scheduler = create_bar_scheduler(
+    subscriptions,
+    fetch=fetch_bar_data,
+    analyze=confluence_detector.compute_shared_analysis,
+    deliver=deliver_shared_analysis,
+)
+
+# Velas en vivo de todos los timeframes desde el mismo flujo de ticks del hub
+# Las velas cerradas se guardan en la colección time-series por la cola diferida
+candle_store = CandleStore(get_database, write=write_behind)
+candle_builder = create_candle_builder(
+    subscriptions, fetch_history=fetch_bar_data, send=send_candle, persist=candle_store.append_candles
+)
+tick_hub.add_tick_listener(candle_builder)
+
+# Alertas de precio evaluadas con los ticks del hub; las de señal al crearse cada señal
+alert_engine = create_alert_engine(subscriptions, get_db=get_database, notify=publish_user_event)
+tick_hub.add_tick_listener(alert_engine)
+
+# Resultado de las señales ACTIVE (excursiones, SL/TP) con los mismos ticks
+outcome_tracker = create_outcome_tracker(
+    subscriptions,
+    get_db=get_database,
+    write=write_behind,
+    notify=publish_user_event,
+    samples=SignalSampleStore(get_database, write=write_behind),
+)
+tick_hub.add_tick_listener(outcome_tracker)
+
+# Mueve señales y órdenes antiguas a ficheros por mes dejando un stub en Mongo
+archive_job = create_archive_job(get_database)
+
+# Configuración de análisis por usuario (se lee al conectar, no en cada ciclo)
+user_analysis_configs: Dict[str, AnalysisConfig] = {}
+
+async def load_user_analysis_config(user_id: str) -> AnalysisConfig:
+    """Lee la configuración de IA del usuario y la deja en memoria"""
+    config = AnalysisConfig()
+    try:
+        db = get_database()
+        doc = await find_user_document(db, "ai_settings", user_id)
+        if doc:
+            fields = {k: v for k, v in doc.items() if k in AnalysisConfig.model_fields and v is not None}
+            config = ensure_risk_fields(AnalysisConfig(**fields))
+    except Exception as e:
+        logger.error(f"Error obteniendo configuración de IA de {user_id}: {e}")
+    user_analysis_configs[user_id] = config
+    return config
+
+async def start_realtime_analysis(user_id: str):
+    """Registra los pares monitoreados del usuario en el scheduler de cierre de vela"""
+    db = get_database()
+    await load_user_analysis_config(user_id)
+    user_settings = await get_user_settings(user_id, db)
+    sync_user_subscriptions(user_id, (user_settings or {}).get("pairs_to_monitor", []))
+
+def _monitored_keys(pairs_to_monitor: List[Dict]) -> set:
+    return {
+        (pair_config["pair"], normalize_timeframe(pair_config.get("timeframe", "H1")))
+        for pair_config in pairs_to_monitor or []
+        if pair_config.get("pair")
+    }
+
+def sync_user_subscriptions(user_id: str, pairs_to_monitor: List[Dict], previous_pairs: Optional[List[Dict]] = None):
+    """Suscribe los pares monitoreados y quita los que salieron de la lista anterior"""
+    current = _monitored_keys(pairs_to_monitor)
+    for pair, timeframe in _monitored_keys(previous_pairs) - current:
+        subscriptions.unsubscribe(user_id, pair, timeframe)
+    for pair, timeframe in current:
+        subscriptions.subscribe(user_id, pair, timeframe)
+
+def stop_realtime_analysis(user_id: str):
+    """Quita todas las suscripciones del usuario (ticks y análisis)"""
+    cancel_realtime_stop(user_id)
+    subscriptions.unsubscribe_user(user_id)
+    user_analysis_configs.pop(user_id, None)
+
+# Paradas diferidas de usuarios que cerraron su última conexión
+_pending_stops: Dict[str, asyncio.Task] = {}
+
+def release_realtime_session(user_id: str):
+    """
+    Última conexión cerrada: ticks y velas se sueltan ya; el análisis sigue
+    durante la gracia para que un corte breve se reanude sin perder señales
+    """
+    for symbol, timeframe in subscriptions.keys_for(user_id):
+        if is_live_timeframe(timeframe):
+            subscriptions.unsubscribe(user_id, symbol, timeframe)
+
+    grace = settings.realtime_resume_grace_seconds
+    if grace <= 0:
+        stop_realtime_analysis(user_id)
+        return
+
+    async def stop_later():
+        await asyncio.sleep(grace)
+        _pending_stops.pop(user_id, None)
+        if user_id not in manager.user_connections:
+            stop_realtime_analysis(user_id)
+
+    cancel_realtime_stop(user_id)
+    _pending_stops[user_id] = asyncio.create_task(stop_later())
+
+def cancel_realtime_stop(user_id: str):
+    task = _pending_stops.pop(user_id, None)
+    if task and task is not asyncio.current_task():
+        task.cancel()
+
+async def resume_session(connection: ClientConnection, user_id: str, cursor: Optional[str]):
+    """Reenvía a esta conexión los eventos posteriores al cursor o le pide resincronizar"""
+    missed = event_log.since(user_id, cursor)
+    if missed is None:
+        await manager.send_to_connection(
+            connection, {"type": "resync", "cursor": event_log.latest_cursor(user_id)}
+        )
+        return
+    for event in missed:
+        await manager.send_to_connection(connection, event)
+    await manager.send_to_connection(
+        connection, {"type": "resumed", "cursor": event_log.latest_cursor(user_id), "replayed": len(missed)}
+    )
+
 async def get_user_settings(user_id: str, db):
     """Obtiene la configuración del usuario"""
     try:
-        collection = db.user_settings
-        settings = await collection.find_one({"user_id": user_id})
+        settings = await find_user_document(db, "user_settings", user_id)
         return settings.get("signal_settings") if settings else None
     except Exception as e:
         logger.error(f"Error obteniendo configuración de usuario {user_id}: {e}")
@@ -593,9 +979,37 @@ async def get_user_settings(user_id: str, db):
 
 async def subscribe_to_pair(user_id: str, pair: str, timeframe: str):
     """Suscribe al usuario a un par y timeframe"""
-  
+    if not pair:
+        return
+    timeframe = normalize_timeframe(timeframe)
+    if timeframe not in ALLOWED_TIMEFRAMES:
+        await manager.send_personal_message(
+            json.dumps({"error": f"Timeframe inválido: {timeframe}"}), user_id
+        )
+        return
+
+    subscriptions.subscribe(user_id, pair, timeframe)
+    await manager.send_personal_message(
+        json.dumps({"type": "subscribed", "pair": pair.upper(), "timeframe": timeframe}), user_id
+    )
     logger.info(f"Usuario {user_id} suscrito a {pair} {timeframe}")
 
-async def unsubscribe_from_pair(user_id: str, pair: str):
-    """Desuscribe al usuario de un par"""
-    logger.info(f"Usuario {user_id} desuscrito de {pair}")
\ No newline at end of file
+async def unsubscribe_from_pair(user_id: str, pair: str, timeframe: Optional[str] = None):
+    """Desuscribe al usuario de un par (en un timeframe o en todos)"""
+    if not pair:
+        return
+    timeframes = [normalize_timeframe(timeframe)] if timeframe else [
+        key[1] for key in subscriptions.keys_for(user_id) if key[0] == pair.upper() and key[1] in ALLOWED_TIMEFRAMES
+    ]
+    removed = []
+    for tf in timeframes:
+        removed.extend(subscriptions.unsubscribe(user_id, pair, tf))
+    await manager.send_personal_message(
+        json.dumps({
+            "type": "unsubscribed",
+            "pair": pair.upper(),
+            "timeframes": [key[1] for key in removed],
+        }),
+        user_id
+    )
+    logger.info(f"Usuario {user_id} desuscrito de {pair}")
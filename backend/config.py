@@ -20,6 +20,18 @@ class Settings(BaseSettings):
     # Base de datos MongoDB
     mongodb_url: str = Field(env="MONGODB_URL")
     mongodb_database: str = Field(default="trading-ai", env="MONGODB_DATABASE")
+    mongo_max_pool_size: int = Field(default=100, env="MONGO_MAX_POOL_SIZE")
+    mongo_min_pool_size: int = Field(default=10, env="MONGO_MIN_POOL_SIZE")
+    mongo_max_idle_time_ms: int = Field(default=300000, env="MONGO_MAX_IDLE_TIME_MS")
+    # 0 = sin límite en la espera de una conexión libre
+    mongo_wait_queue_timeout_ms: int = Field(default=0, env="MONGO_WAIT_QUEUE_TIMEOUT_MS")
+    mongo_server_selection_timeout_ms: int = Field(default=5000, env="MONGO_SERVER_SELECTION_TIMEOUT_MS")
+    mongo_connect_timeout_ms: int = Field(default=10000, env="MONGO_CONNECT_TIMEOUT_MS")
+    mongo_socket_timeout_ms: int = Field(default=0, env="MONGO_SOCKET_TIMEOUT_MS")
+    mongo_read_preference: str = Field(default="primary", env="MONGO_READ_PREFERENCE")
+    # Vacío = write concern por defecto del servidor; "majority" o un número de nodos
+    mongo_write_concern: str = Field(default="", env="MONGO_WRITE_CONCERN")
+    mongo_write_timeout_ms: int = Field(default=0, env="MONGO_WRITE_TIMEOUT_MS")
     
     # Seguridad
     secret_key: str = Field(env="SECRET_KEY")
@@ -50,9 +62,75 @@ class Settings(BaseSettings):
     log_level: str = Field(default="INFO", env="LOG_LEVEL")
     log_file: str = Field(default="trading_ai.log", env="LOG_FILE")
     
+    # Profiling de requests (opt-in por header o por muestreo)
+    profiling_header: str = Field(default="X-Profile", env="PROFILING_HEADER")
+    profiling_sample_rate: float = Field(default=0.0, env="PROFILING_SAMPLE_RATE")
+    profiling_interval_ms: float = Field(default=5.0, env="PROFILING_INTERVAL_MS")
+    profiling_max_profiles: int = Field(default=50, env="PROFILING_MAX_PROFILES")
+    profiling_paths: List[str] = Field(
+        default=["/api/signals/signals/analyze", "/api/charts/generate", "/api/mt5/data"],
+        env="PROFILING_PATHS"
+    )
+
+    # Watchdog del event loop (detección de llamadas bloqueantes)
+    loop_watchdog_enabled: bool = Field(default=True, env="LOOP_WATCHDOG_ENABLED")
+    loop_watchdog_interval_ms: float = Field(default=50.0, env="LOOP_WATCHDOG_INTERVAL_MS")
+    loop_watchdog_threshold_ms: float = Field(default=100.0, env="LOOP_WATCHDOG_THRESHOLD_MS")
+    loop_watchdog_max_events: int = Field(default=200, env="LOOP_WATCHDOG_MAX_EVENTS")
+
+    # Scheduler de análisis por cierre de vela
+    bar_close_grace_seconds: float = Field(default=2.0, env="BAR_CLOSE_GRACE_SECONDS")
+    bar_close_retry_seconds: float = Field(default=5.0, env="BAR_CLOSE_RETRY_SECONDS")
+    bar_close_max_retries: int = Field(default=6, env="BAR_CLOSE_MAX_RETRIES")
+    bar_close_history_bars: int = Field(default=500, env="BAR_CLOSE_HISTORY_BARS")
+    mt5_server_utc_offset_hours: float = Field(default=0.0, env="MT5_SERVER_UTC_OFFSET_HOURS")
+
+    # Hub de ticks en vivo
+    tick_hub_poll_interval_ms: float = Field(default=250.0, env="TICK_HUB_POLL_INTERVAL_MS")
+    tick_hub_max_push_hz: float = Field(default=4.0, env="TICK_HUB_MAX_PUSH_HZ")
+    live_candle_history_bars: int = Field(default=500, env="LIVE_CANDLE_HISTORY_BARS")
+    live_candle_snapshot_bars: int = Field(default=100, env="LIVE_CANDLE_SNAPSHOT_BARS")
+    signal_delta_max_items: int = Field(default=100, env="SIGNAL_DELTA_MAX_ITEMS")
+    signal_tombstone_ttl_hours: int = Field(default=168, env="SIGNAL_TOMBSTONE_TTL_HOURS")
+    signal_ttl_days: int = Field(default=0, env="SIGNAL_TTL_DAYS")
+    signal_samples_ttl_days: int = Field(default=90, env="SIGNAL_SAMPLES_TTL_DAYS")
+    mt5_session_ttl_grace_hours: int = Field(default=24, env="MT5_SESSION_TTL_GRACE_HOURS")
+    mongo_index_diagnostics: bool = Field(default=False, env="MONGO_INDEX_DIAGNOSTICS")
+    realtime_event_buffer_size: int = Field(default=200, env="REALTIME_EVENT_BUFFER_SIZE")
+    realtime_event_buffer_ttl_seconds: float = Field(default=900.0, env="REALTIME_EVENT_BUFFER_TTL_SECONDS")
+    realtime_resume_grace_seconds: float = Field(default=30.0, env="REALTIME_RESUME_GRACE_SECONDS")
+    max_alerts_per_user: int = Field(default=200, env="MAX_ALERTS_PER_USER")
+    outcome_persist_interval_seconds: float = Field(default=5.0, env="OUTCOME_PERSIST_INTERVAL_SECONDS")
+    # 0 desactiva las muestras de precio por señal
+    outcome_sample_interval_seconds: float = Field(default=60.0, env="OUTCOME_SAMPLE_INTERVAL_SECONDS")
+
+    # Caches de documentos por usuario (usuario, ajustes de IA, perfil MT5)
+    user_cache_ttl_seconds: float = Field(default=30.0, env="USER_CACHE_TTL_SECONDS")
+    settings_cache_ttl_seconds: float = Field(default=300.0, env="SETTINGS_CACHE_TTL_SECONDS")
+    cache_max_entries: int = Field(default=10000, env="CACHE_MAX_ENTRIES")
+    cache_change_streams: bool = Field(default=False, env="CACHE_CHANGE_STREAMS")
+
+    # Archivo de señales y órdenes antiguas en ficheros comprimidos por mes
+    archive_enabled: bool = Field(default=False, env="ARCHIVE_ENABLED")
+    archive_after_days: int = Field(default=180, env="ARCHIVE_AFTER_DAYS")
+    archive_dir: str = Field(default="archive", env="ARCHIVE_DIR")
+    archive_interval_hours: float = Field(default=24.0, env="ARCHIVE_INTERVAL_HOURS")
+    archive_batch_size: int = Field(default=1000, env="ARCHIVE_BATCH_SIZE")
+
+    # Escritura diferida (señales, órdenes, sesiones)
+    write_behind_max_batch: int = Field(default=500, env="WRITE_BEHIND_MAX_BATCH")
+    write_behind_flush_interval_ms: float = Field(default=250.0, env="WRITE_BEHIND_FLUSH_INTERVAL_MS")
+    write_behind_max_pending: int = Field(default=10000, env="WRITE_BEHIND_MAX_PENDING")
+    write_behind_max_retries: int = Field(default=3, env="WRITE_BEHIND_MAX_RETRIES")
+
     # WebSocket
     websocket_ping_interval: int = Field(default=20, env="WEBSOCKET_PING_INTERVAL")
     websocket_ping_timeout: int = Field(default=10, env="WEBSOCKET_PING_TIMEOUT")
+    websocket_send_queue_size: int = Field(default=256, env="WEBSOCKET_SEND_QUEUE_SIZE")
+    websocket_send_timeout: float = Field(default=5.0, env="WEBSOCKET_SEND_TIMEOUT")
+    websocket_per_message_deflate: bool = Field(default=True, env="WEBSOCKET_PER_MESSAGE_DEFLATE")
+    sse_heartbeat_seconds: float = Field(default=15.0, env="SSE_HEARTBEAT_SECONDS")
+    sse_retry_ms: int = Field(default=3000, env="SSE_RETRY_MS")
     
     # Trading
     default_timeframes: List[str] = Field(
@@ -0,0 +1,332 @@
+import asyncio
+import gzip
+import io
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from bson import json_util
+from pymongo import ReplaceOne
+
+from config import settings
+from database.signal_analyses import decompress_payload
+from monitoring.metrics import registry
+
+try:
+    import zstandard  # type: ignore
+except Exception:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_DOCUMENTS = registry.counter(
+    "trading_ai_archived_documents_total",
+    "Documentos movidos a los ficheros de archivo por colección",
+    ["collection"],
+)
+ARCHIVE_BYTES = registry.counter(
+    "trading_ai_archive_bytes_total",
+    "Bytes comprimidos escritos en los ficheros de archivo",
+    ["collection"],
+)
+
+ZSTD = ".ndjson.zst"
+GZIP = ".ndjson.gz"
+
+
+@dataclass
+class ArchiveSpec:
+    """Qué se archiva de una colección y qué queda en Mongo como stub"""
+    collection: str
+    time_field: str
+    stub_fields: Tuple[str, ...]
+    # Condición extra de los candidatos (p.ej. no archivar señales abiertas)
+    extra_filter: Dict[str, Any] = field(default_factory=dict)
+    with_analysis: bool = False
+
+
+ARCHIVE_SPECS = [
+    ArchiveSpec(
+        "trading_signals",
+        "timestamp",
+        (
+            "user_id", "symbol", "timeframe", "signal_type", "entry_price", "stop_loss", "take_profit",
+            "confluence_score", "status", "result", "pips_result", "max_profit", "max_loss", "exit",
+            "exit_price", "seq", "created_seq", "stats_counted", "timestamp", "expires_at",
+        ),
+        extra_filter={"status": {"$ne": "ACTIVE"}},
+        with_analysis=True,
+    ),
+    ArchiveSpec(
+        "executed_orders",
+        "executed_at",
+        # Campos del listado de órdenes; el resto (mt5_result...) sólo en el fichero
+        (
+            "user_id", "symbol", "order_type", "volume", "entry_price", "stop_loss", "take_profit", "ticket",
+            "status", "executed_at", "r_multiple", "profit", "risk_amount", "exit_price", "close_price",
+        ),
+    ),
+]
+
+
+def month_key(at: datetime) -> str:
+    return at.strftime("%Y-%m")
+
+
+def archive_path(root: str, collection: str, user_id: str, month: str, extension: Optional[str] = None) -> str:
+    """Un fichero por colección, usuario y mes: exportar o rehidratar un mes lee un solo fichero"""
+    return os.path.join(root, collection, str(user_id), f"{month}{extension or default_extension()}")
+
+
+def default_extension() -> str:
+    return ZSTD if zstandard is not None else GZIP
+
+
+def existing_path(root: str, collection: str, user_id: str, month: str) -> Optional[str]:
+    for extension in (ZSTD, GZIP):
+        path = archive_path(root, collection, user_id, month, extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _compress(data: bytes, extension: str) -> bytes:
+    if extension == ZSTD:
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(blob: bytes, path: str) -> bytes:
+    if path.endswith(ZSTD):
+        if zstandard is None:
+            raise RuntimeError(f"{path} es zstd y el paquete zstandard no está instalado")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+
+def append_records(path: str, records: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """
+    Añade los registros como un frame/miembro comprimido nuevo al final del
+    fichero (zstd y gzip admiten concatenación); fsync antes de devolver para
+    que el stub en Mongo nunca apunte a datos que no están en disco.
+    Devuelve (offset, longitud) del frame: cada stub guarda el suyo.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    raw = b"".join(json_util.dumps(record).encode("utf-8") + b"\n" for record in records)
+    blob = _compress(raw, ZSTD if path.endswith(ZSTD) else GZIP)
+    with open(path, "ab") as fh:
+        offset = fh.seek(0, os.SEEK_END)
+        fh.write(blob)
+        fh.flush()
+        os.fsync(fh.fileno())
+    return offset, len(blob)
+
+
+def read_frame(path: str, offset: int, length: int) -> Dict[Any, Dict[str, Any]]:
+    """Registros de un solo frame por _id: la memoria queda acotada a un lote del job"""
+    with open(path, "rb") as fh:
+        fh.seek(offset)
+        blob = fh.read(length)
+    lines = _decompress(blob, path).splitlines()
+    return {record["doc"]["_id"]: record for record in map(json_util.loads, filter(None, lines))}
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Registros de un fichero de archivo, frame a frame, sin descomprimirlo entero en memoria"""
+    if path.endswith(ZSTD):
+        if zstandard is None:
+            raise RuntimeError(f"{path} es zstd y el paquete zstandard no está instalado")
+        with open(path, "rb") as fh:
+            reader = zstandard.ZstdDecompressor().stream_reader(fh, read_across_frames=True)
+            for line in io.BufferedReader(reader):
+                if line.strip():
+                    yield json_util.loads(line)
+    else:
+        with gzip.open(path, "rb") as fh:
+            for line in fh:
+                if line.strip():
+                    yield json_util.loads(line)
+
+
+def find_record(path: str, doc_id: Any) -> Optional[Dict[str, Any]]:
+    """Busca un registro recorriendo el fichero en streaming (stubs sin offset); gana el último"""
+    found = None
+    for record in read_records(path):
+        if record["doc"]["_id"] == doc_id:
+            found = record
+    return found
+
+
+class ArchiveJob:
+    """
+    Mueve a ficheros comprimidos por usuario y mes los documentos más viejos
+    que el horizonte y deja en Mongo un stub con los campos de listado. Se
+    recorre usuario a usuario con los índices (user_id, tiempo) existentes.
+    """
+
+    def __init__(self,
+                 get_db: Callable[[], Any],
+                 root: str,
+                 after_days: int,
+                 batch_size: int = 1000,
+                 specs: List[ArchiveSpec] = ARCHIVE_SPECS):
+        self.get_db = get_db
+        self.root = root
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.specs = specs
+        self._lock = asyncio.Lock()
+
+    async def run_once(self) -> Dict[str, int]:
+        """Una pasada completa; devuelve documentos archivados por colección"""
+        async with self._lock:
+            cutoff = datetime.utcnow() - timedelta(days=self.after_days)
+            totals: Dict[str, int] = {}
+            for spec in self.specs:
+                totals[spec.collection] = 0
+                for user_id in await self.get_db()[spec.collection].distinct("user_id"):
+                    totals[spec.collection] += await self._archive_user(spec, user_id, cutoff)
+            logger.info(f"Archivo completado (anteriores a {cutoff.date()}): {totals}")
+            return totals
+
+    async def run_forever(self, interval_hours: float):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en el job de archivo: {e}", exc_info=True)
+            await asyncio.sleep(interval_hours * 3600)
+
+    async def _archive_user(self, spec: ArchiveSpec, user_id: str, cutoff: datetime) -> int:
+        db = self.get_db()
+        query = {
+            "user_id": user_id,
+            spec.time_field: {"$lt": cutoff},
+            "archived": {"$exists": False},
+            **spec.extra_filter,
+        }
+        cursor = db[spec.collection].find(query).sort(spec.time_field, 1).batch_size(self.batch_size)
+        archived = 0
+        batch: List[Dict[str, Any]] = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                archived += await self._archive_batch(spec, user_id, batch)
+                batch = []
+        if batch:
+            archived += await self._archive_batch(spec, user_id, batch)
+        return archived
+
+    async def _archive_batch(self, spec: ArchiveSpec, user_id: str, docs: List[Dict[str, Any]]) -> int:
+        db = self.get_db()
+        analyses: Dict[Any, Dict[str, Any]] = {}
+        if spec.with_analysis:
+            ids = [doc["_id"] for doc in docs]
+            async for analysis in db.signal_analyses.find({"_id": {"$in": ids}}):
+                try:
+                    analyses[analysis["_id"]] = decompress_payload(analysis["payload"])
+                except Exception as e:
+                    logger.error(f"Análisis de la señal {analysis['_id']} ilegible, se archiva sin él: {e}")
+
+        per_month: Dict[str, List[Dict[str, Any]]] = {}
+        for doc in docs:
+            record = {"doc": doc}
+            if doc["_id"] in analyses:
+                record["analysis"] = analyses[doc["_id"]]
+            per_month.setdefault(month_key(doc[spec.time_field]), []).append(record)
+
+        # Primero el disco; si el proceso cae antes del stub, la próxima pasada reescribe el lote
+        now = datetime.utcnow()
+        operations = []
+        for month, records in per_month.items():
+            path = archive_path(self.root, spec.collection, user_id, month)
+            existing = existing_path(self.root, spec.collection, user_id, month)
+            if existing is not None:
+                path = existing
+            offset, length = await asyncio.to_thread(append_records, path, records)
+            ARCHIVE_BYTES.inc(length, collection=spec.collection)
+            stub_archive = {
+                "month": month,
+                "file": os.path.relpath(path, self.root),
+                "offset": offset,
+                "length": length,
+                "at": now,
+            }
+            for record in records:
+                doc = record["doc"]
+                stub = {key: doc[key] for key in spec.stub_fields if key in doc}
+                stub["_id"] = doc["_id"]
+                stub["archived"] = stub_archive
+                operations.append(ReplaceOne({"_id": doc["_id"], "archived": {"$exists": False}}, stub))
+
+        await db[spec.collection].bulk_write(operations, ordered=False)
+        if spec.with_analysis:
+            await db.signal_analyses.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        ARCHIVED_DOCUMENTS.inc(len(docs), collection=spec.collection)
+        return len(docs)
+
+
+class ArchiveReader:
+    """
+    Rehidrata stubs leyendo sólo el frame de su lote (offset y longitud en
+    el stub). Se guarda el último frame leído: un cursor por tiempo pide los
+    stubs de un mismo lote seguidos, y nunca hay más de un lote en memoria.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._frame: Optional[Tuple[str, int]] = None
+        self._records: Dict[Any, Dict[str, Any]] = {}
+
+    async def record(self, collection: str, stub: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Registro archivado ({"doc", "analysis"}) de un stub, o None si no está en disco"""
+        archived = stub.get("archived")
+        if not archived:
+            return None
+        path = os.path.join(self.root, archived["file"])
+        try:
+            if "offset" not in archived:
+                return await asyncio.to_thread(find_record, path, stub["_id"])
+            key = (path, archived["offset"])
+            if key != self._frame:
+                self._records = await asyncio.to_thread(read_frame, path, archived["offset"], archived["length"])
+                self._frame = key
+        except (OSError, RuntimeError) as e:
+            logger.error(f"No se pudo leer el archivo de {collection} {stub['_id']}: {e}")
+            return None
+        return self._records.get(stub["_id"])
+
+    async def rehydrate(self,
+                        collection: str,
+                        docs: AsyncIterator[Dict[str, Any]],
+                        exclude: Tuple[str, ...] = ()) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Documentos completos a partir de un cursor con stubs: los no
+        archivados (o ilegibles) pasan tal cual
+        """
+        async for doc in docs:
+            record = await self.record(collection, doc) if doc.get("archived") else None
+            if record is None:
+                yield doc
+                continue
+            full = {key: value for key, value in record["doc"].items() if key not in exclude}
+            full["archived"] = doc["archived"]
+            yield full
+
+
+def create_archive_job(get_db: Callable[[], Any]) -> ArchiveJob:
+    """Job configurado desde settings"""
+    return ArchiveJob(
+        get_db,
+        root=settings.archive_dir,
+        after_days=settings.archive_after_days,
+        batch_size=settings.archive_batch_size,
+    )
+
+
+def create_archive_reader() -> ArchiveReader:
+    return ArchiveReader(settings.archive_dir)
@@ -0,0 +1,161 @@
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from config import settings
+from database.signal_analyses import owner_filter
+from monitoring.metrics import record_cache_access
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class DocumentCache:
+    """
+    Cache en proceso de documentos por clave (user_id) con TTL y LRU.
+    Las escrituras invalidan explícitamente; el TTL acota lo que puede
+    tardar en verse un cambio hecho por otro worker sin change streams.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float, max_entries: int = 10000):
+        self.name = name
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Una sola lectura a Mongo por clave aunque lleguen varias peticiones a la vez
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Claves invalidadas mientras se cargaban: ese resultado no se guarda
+        self._stale: Set[str] = set()
+
+    async def get(self, key: str, loader: Loader) -> Optional[Dict[str, Any]]:
+        key = str(key)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            record_cache_access(self.name, True)
+            return copy.deepcopy(entry[1])
+        record_cache_access(self.name, False)
+
+        pending = self._loading.get(key)
+        if pending is not None:
+            try:
+                doc = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Se canceló quien cargaba (p.ej. el cliente cortó), no este llamador: se carga de nuevo
+                if not pending.cancelled():
+                    raise
+                return await self.get(key, loader)
+            return copy.deepcopy(doc)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            doc = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita "exception was never retrieved" si nadie más esperaba
+            future.exception()
+            raise
+        finally:
+            self._loading.pop(key, None)
+            stale = key in self._stale
+            self._stale.discard(key)
+
+        # Una invalidación durante la carga descarta el resultado (puede ser anterior a la escritura)
+        if doc is not None and not stale:
+            self._store(key, doc)
+        future.set_result(doc)
+        return copy.deepcopy(doc)
+
+    def _store(self, key: str, doc: Dict[str, Any]):
+        self._entries[key] = (time.monotonic() + self.ttl, doc)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Any):
+        key = str(key)
+        self._entries.pop(key, None)
+        if key in self._loading:
+            self._stale.add(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._stale.update(self._loading)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "ttl_seconds": self.ttl, "loading": len(self._loading)}
+
+
+user_cache = DocumentCache("users", settings.user_cache_ttl_seconds, settings.cache_max_entries)
+ai_settings_cache = DocumentCache("ai_settings", settings.settings_cache_ttl_seconds, settings.cache_max_entries)
+user_settings_cache = DocumentCache("user_settings", settings.settings_cache_ttl_seconds, settings.cache_max_entries)
+mt5_profile_cache = DocumentCache("mt5_profiles", settings.settings_cache_ttl_seconds, settings.cache_max_entries)
+
+# Colección -> (cache, campo del documento que es la clave)
+CACHED_COLLECTIONS: Dict[str, Tuple[DocumentCache, str]] = {
+    "users": (user_cache, "_id"),
+    "ai_settings": (ai_settings_cache, "user_id"),
+    "user_settings": (user_settings_cache, "user_id"),
+    "mt5_profiles": (mt5_profile_cache, "user_id"),
+}
+
+
+def invalidate_for(collection: str, filter_dict: Dict[str, Any]):
+    """Invalida tras una escritura; sin la clave en el filtro se vacía la cache entera"""
+    cached = CACHED_COLLECTIONS.get(collection)
+    if cached is None:
+        return
+    cache, key_field = cached
+    key = (filter_dict or {}).get(key_field)
+    if key is None or isinstance(key, dict):
+        cache.clear()
+    else:
+        cache.invalidate(key)
+
+
+async def find_user_document(db, collection: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    find_one({"user_id": ...}) de una colección cacheada por usuario. La
+    clave es el str del id y la consulta acepta las dos formas guardadas,
+    así da igual si el llamador pasa el ObjectId o el str.
+    """
+    cache, _ = CACHED_COLLECTIONS[collection]
+    return await cache.get(user_id, lambda: db[collection].find_one({"user_id": owner_filter(user_id)}))
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {cache.name: cache.stats() for cache, _ in CACHED_COLLECTIONS.values()}
+
+
+async def watch_invalidations(db):
+    """
+    Con varios workers: un change stream invalida en este proceso lo que
+    escribieron los demás. Necesita replica set; en un servidor standalone
+    se registra el aviso y se sigue sólo con TTL.
+    """
+    pipeline = [{"$match": {"ns.coll": {"$in": list(CACHED_COLLECTIONS)}}}]
+    try:
+        async with db.watch(pipeline, full_document="updateLookup") as stream:
+            logger.info("Invalidación de caches por change stream activa")
+            async for change in stream:
+                collection = change["ns"]["coll"]
+                cache, key_field = CACHED_COLLECTIONS[collection]
+                if key_field == "_id":
+                    cache.invalidate(change["documentKey"]["_id"])
+                elif change.get("fullDocument"):
+                    cache.invalidate(change["fullDocument"].get(key_field))
+                else:
+                    # Borrado sin la imagen previa: no se sabe de qué usuario era
+                    cache.clear()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"Change streams no disponibles, las caches dependen del TTL: {e}")
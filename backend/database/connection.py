@@ -4,6 +4,12 @@ from pymongo.errors import ConnectionFailure
 import logging
 from typing import Optional
 
+from config import settings
+from monitoring.mongo_pool import pool_listener
+from database.cache import invalidate_for
+from database.indexes import ensure_indexes, verify_query_plans
+from database.timeseries import ensure_timeseries_collections
+
 class MongoDB:
     client: Optional[AsyncIOMotorClient] = None # type: ignore
     database = None
@@ -11,6 +17,27 @@ class MongoDB:
 # Instancia global
 mongodb = MongoDB()
 
+def client_options() -> dict:
+    """Pool, timeouts, read preference y write concern del cliente desde settings"""
+    options = {
+        "maxPoolSize": settings.mongo_max_pool_size,
+        "minPoolSize": settings.mongo_min_pool_size,
+        "maxIdleTimeMS": settings.mongo_max_idle_time_ms or None,
+        "waitQueueTimeoutMS": settings.mongo_wait_queue_timeout_ms or None,
+        "serverSelectionTimeoutMS": settings.mongo_server_selection_timeout_ms,
+        "connectTimeoutMS": settings.mongo_connect_timeout_ms,
+        "socketTimeoutMS": settings.mongo_socket_timeout_ms or None,
+        "readPreference": settings.mongo_read_preference,
+        # Eventos CMAP -> métricas del pool en /metrics
+        "event_listeners": [pool_listener],
+    }
+    write_concern = settings.mongo_write_concern.strip()
+    if write_concern:
+        options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+        if settings.mongo_write_timeout_ms:
+            options["wTimeoutMS"] = settings.mongo_write_timeout_ms
+    return options
+
 async def connect_to_mongo():
     """Conectar a MongoDB"""
     try:
@@ -19,11 +46,11 @@ async def connect_to_mongo():
         DATABASE_NAME = os.getenv("MONGODB_DATABASE", "trading_ia")
 
         # Crear cliente
-        mongodb.client = AsyncIOMotorClient(
-            MONGO_URL,
-            maxPoolSize=10,
-            minPoolSize=10,
-            serverSelectionTimeoutMS=5000
+        options = client_options()
+        mongodb.client = AsyncIOMotorClient(MONGO_URL, **options)
+        logging.info(
+            f"Pool de MongoDB: {options['minPoolSize']}-{options['maxPoolSize']} conexiones, "
+            f"readPreference={options['readPreference']}, w={options.get('w', 'default')}"
         )
         
 
@@ -51,56 +78,23 @@ async def close_mongo_connection():
         logging.info("Conexión a MongoDB cerrada")
 
 async def create_indexes():
-    """Crear índices necesarios para optimizar consultas"""
-    try:
-        # Índices para usuarios
-        await mongodb.database.users.create_index("username", unique=True)
-        await mongodb.database.users.create_index("email", unique=True)
-        await mongodb.database.users.create_index("created_at")
-        
-        # Índices para señales
-        await mongodb.database.signals.create_index([
-            ("symbol", 1),
-            ("timeframe", 1),
-            ("created_at", -1)
-        ])
-        await mongodb.database.signals.create_index("is_active")
-        await mongodb.database.signals.create_index("signal_type")
-        await mongodb.database.signals.create_index("confluence_score")
-        await mongodb.database.signals.create_index("created_at")
-        await mongodb.database.signals.create_index("expires_at")
-        
-        # Índices para datos de mercado
-        await mongodb.database.market_data.create_index([
-            ("symbol", 1),
-            ("timeframe", 1)
-        ], unique=True)
-        await mongodb.database.market_data.create_index("last_updated")
-        
-        # Índices para alertas
-        await mongodb.database.alerts.create_index("user_id")
-        await mongodb.database.alerts.create_index("symbol")
-        await mongodb.database.alerts.create_index("is_triggered")
-        await mongodb.database.alerts.create_index("created_at")
-        
-        # Índices para performance
-        await mongodb.database.performance_stats.create_index("user_id")
-        await mongodb.database.performance_stats.create_index([
-            ("period_start", 1),
-            ("period_end", 1)
-        ])
-        
-        logging.info("Índices de MongoDB creados exitosamente")
-        
-    except Exception as e:
-        logging.error(f"Error creando índices: {e}")
+    """Crear los índices declarados en database.indexes junto a las consultas que los usan"""
+    created = await ensure_indexes(mongodb.database)
+    logging.info(f"Índices de MongoDB verificados en {len(created)} colecciones")
+    native = await ensure_timeseries_collections(mongodb.database)
+    logging.info(f"Series temporales: {native}")
+
+    if settings.mongo_index_diagnostics:
+        reports = await verify_query_plans(mongodb.database)
+        scans = [r for r in reports if r.get("collection_scan") or r.get("in_memory_sort")]
+        logging.info(f"Diagnóstico de índices: {len(reports)} consultas, {len(scans)} sin índice adecuado")
 
 # Funciones de utilidad para obtener colecciones
 def get_users_collection():
     return mongodb.database.users
 
 def get_signals_collection():
-    return mongodb.database.signals
+    return mongodb.database.trading_signals
 
 def get_market_data_collection():
     return mongodb.database.market_data
@@ -150,6 +144,7 @@ class DatabaseManager:
         """Actualizar un documento"""
         collection = mongodb.database[collection_name]
         result = await collection.update_one(filter_dict, {"$set": update_dict})
+        invalidate_for(collection_name, filter_dict)
         return result.modified_count
     
     @staticmethod
@@ -157,6 +152,7 @@ class DatabaseManager:
         """Eliminar un documento"""
         collection = mongodb.database[collection_name]
         result = await collection.delete_one(filter_dict)
+        invalidate_for(collection_name, filter_dict)
         return result.deleted_count
     
     @staticmethod
@@ -0,0 +1,230 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+IndexKeys = List[Tuple[str, int]]
+
+# Valor de relleno para las consultas de explain(): sólo importa la forma
+SAMPLE = "__explain__"
+
+
+@dataclass
+class IndexSpec:
+    keys: IndexKeys
+    options: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return self.options.get("name") or "_".join(f"{key}_{direction}" for key, direction in self.keys)
+
+
+@dataclass
+class QueryShape:
+    """Consulta real del código, para comprobar con explain() que usa un índice"""
+    name: str
+    filter: Dict[str, Any]
+    sort: Optional[IndexKeys] = None
+    limit: int = 50
+
+
+@dataclass
+class CollectionIndexes:
+    collection: str
+    indexes: List[IndexSpec]
+    queries: List[QueryShape] = field(default_factory=list)
+
+
+def index_catalog() -> List[CollectionIndexes]:
+    """Índices por colección junto a las consultas que los usan (los TTL salen de settings)"""
+    return [
+        CollectionIndexes(
+            "users",
+            [
+                IndexSpec([("username", 1)], {"unique": True}),
+                IndexSpec([("email", 1)], {"unique": True}),
+                IndexSpec([("created_at", 1)]),
+            ],
+            [
+                QueryShape("login por email", {"email": SAMPLE}, limit=1),
+                QueryShape("registro por username", {"username": SAMPLE}, limit=1),
+            ],
+        ),
+        CollectionIndexes(
+            "trading_signals",
+            [
+                # _id desempata la paginación por cursor (timestamp, _id)
+                IndexSpec([("user_id", 1), ("timestamp", -1), ("_id", -1)]),
+                IndexSpec([("user_id", 1), ("symbol", 1), ("timestamp", -1), ("_id", -1)]),
+                # Feed versionado: deltas por (user_id, seq)
+                IndexSpec(
+                    [("user_id", 1), ("seq", 1)],
+                    {"unique": True, "partialFilterExpression": {"seq": {"$exists": True}}},
+                ),
+                # Carga del tracker de resultados: sólo las abiertas entran en el índice
+                IndexSpec([("status", 1)], {"partialFilterExpression": {"status": "ACTIVE"}}),
+                # Señales de una pasada del backfill de estadísticas
+                IndexSpec(
+                    [("stats_run", 1), ("user_id", 1)],
+                    {"partialFilterExpression": {"stats_run": {"$exists": True}}},
+                ),
+                # Sólo caducan las señales con expires_at (SIGNAL_TTL_DAYS > 0)
+                IndexSpec([("expires_at", 1)], {"expireAfterSeconds": 0}),
+            ],
+            [
+                QueryShape("GET /signals/", {"user_id": SAMPLE}, [("timestamp", -1), ("_id", -1)]),
+                QueryShape(
+                    "GET /signals/?pair", {"user_id": SAMPLE, "symbol": SAMPLE}, [("timestamp", -1), ("_id", -1)]
+                ),
+                QueryShape(
+                    "GET /signals/?pair&timeframe",
+                    {"user_id": SAMPLE, "symbol": SAMPLE, "timeframe": SAMPLE},
+                    [("timestamp", -1), ("_id", -1)],
+                ),
+                QueryShape("delta de señales", {"user_id": SAMPLE, "seq": {"$gt": 0}}, [("seq", 1)], limit=101),
+                QueryShape("carga del tracker de resultados", {"status": "ACTIVE"}, limit=0),
+                QueryShape("backfill de estadísticas", {"stats_run": SAMPLE, "user_id": SAMPLE}, limit=0),
+            ],
+        ),
+        CollectionIndexes(
+            "signal_tombstones",
+            [
+                IndexSpec([("user_id", 1), ("seq", 1)]),
+                IndexSpec([("deleted_at", 1)], {"expireAfterSeconds": settings.signal_tombstone_ttl_hours * 3600}),
+            ],
+            [QueryShape("delta de borradas", {"user_id": SAMPLE, "seq": {"$gt": 0}}, [("seq", 1)], limit=101)],
+        ),
+        CollectionIndexes(
+            "signal_analyses",
+            [IndexSpec([("expires_at", 1)], {"expireAfterSeconds": 0})],
+        ),
+        CollectionIndexes(
+            "executed_orders",
+            [IndexSpec([("user_id", 1), ("executed_at", -1), ("_id", -1)])],
+            [QueryShape("GET /mt5/orders", {"user_id": SAMPLE}, [("executed_at", -1), ("_id", -1)])],
+        ),
+        CollectionIndexes(
+            "mt5_sessions",
+            [
+                IndexSpec([("user_id", 1)], {"unique": True}),
+                # La sesión caduca a las 24h; el documento se borra tras la gracia
+                IndexSpec(
+                    [("expires_at", 1)],
+                    {"expireAfterSeconds": settings.mt5_session_ttl_grace_hours * 3600},
+                ),
+            ],
+            [QueryShape("sesión del usuario", {"user_id": SAMPLE}, limit=1)],
+        ),
+        CollectionIndexes(
+            "mt5_profiles",
+            [IndexSpec([("user_id", 1)], {"unique": True})],
+            [QueryShape("perfil del usuario", {"user_id": SAMPLE}, limit=1)],
+        ),
+        CollectionIndexes(
+            "ai_settings",
+            [IndexSpec([("user_id", 1)], {"unique": True})],
+            [QueryShape("configuración de IA", {"user_id": SAMPLE}, limit=1)],
+        ),
+        CollectionIndexes(
+            "user_settings",
+            [IndexSpec([("user_id", 1)], {"unique": True})],
+            [QueryShape("configuración de señales", {"user_id": SAMPLE}, limit=1)],
+        ),
+        CollectionIndexes(
+            "alerts",
+            [
+                IndexSpec([("user_id", 1), ("created_at", -1)]),
+                # Carga del motor de alertas al arrancar: activas por tipo
+                IndexSpec([("is_triggered", 1), ("alert_type", 1)]),
+            ],
+            [
+                QueryShape("GET /alerts/", {"user_id": SAMPLE}, [("created_at", -1)]),
+                QueryShape(
+                    "carga del motor de alertas",
+                    {"is_triggered": False, "alert_type": {"$in": ["price", "signal"]}},
+                    limit=0,
+                ),
+            ],
+        ),
+        CollectionIndexes(
+            "market_data",
+            [
+                IndexSpec([("symbol", 1), ("timeframe", 1)], {"unique": True}),
+                IndexSpec([("last_updated", 1)]),
+            ],
+        ),
+        CollectionIndexes(
+            "performance_stats",
+            [
+                IndexSpec([("user_id", 1)]),
+                IndexSpec([("period_start", 1), ("period_end", 1)]),
+            ],
+        ),
+    ]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Crea los índices del catálogo; un índice que falla no impide crear los demás"""
+    created: Dict[str, List[str]] = {}
+    for entry in index_catalog():
+        for spec in entry.indexes:
+            try:
+                name = await db[entry.collection].create_index(spec.keys, **spec.options)
+                created.setdefault(entry.collection, []).append(name)
+            except Exception as e:
+                # Típico: índice único sobre datos duplicados o TTL ya creado con otro plazo
+                logger.error(f"Índice {entry.collection}.{spec.name} no creado: {e}")
+    return created
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    stages = [plan]
+    for child in [plan.get("inputStage")] + list(plan.get("inputStages", [])):
+        if child:
+            stages.extend(_plan_stages(child))
+    return stages
+
+
+async def explain_query(db, collection: str, query: QueryShape) -> Dict[str, Any]:
+    """Plan ganador de la consulta: índices usados, COLLSCAN y ordenación en memoria"""
+    command: Dict[str, Any] = {"find": collection, "filter": query.filter}
+    if query.sort:
+        command["sort"] = dict(query.sort)
+    if query.limit:
+        command["limit"] = query.limit
+
+    result = await db.command({"explain": command, "verbosity": "queryPlanner"})
+    winning = result.get("queryPlanner", {}).get("winningPlan", {})
+    # Con SBE el plan clásico viene dentro de queryPlan
+    stages = _plan_stages(winning.get("queryPlan", winning))
+    names = [stage.get("stage") for stage in stages]
+    return {
+        "collection": collection,
+        "query": query.name,
+        "indexes": [stage["indexName"] for stage in stages if stage.get("indexName")],
+        "collection_scan": "COLLSCAN" in names,
+        "in_memory_sort": "SORT" in names,
+        "stages": names,
+    }
+
+
+async def verify_query_plans(db) -> List[Dict[str, Any]]:
+    """Diagnóstico: explain() de cada consulta declarada y aviso de las que recorren la colección"""
+    reports = []
+    for entry in index_catalog():
+        for query in entry.queries:
+            try:
+                report = await explain_query(db, entry.collection, query)
+            except Exception as e:
+                report = {"collection": entry.collection, "query": query.name, "error": str(e)}
+                logger.error(f"explain() falló para {entry.collection} ({query.name}): {e}")
+            else:
+                if report["collection_scan"]:
+                    logger.warning(f"COLLSCAN en {entry.collection} para '{query.name}'")
+                elif report["in_memory_sort"]:
+                    logger.warning(f"Ordenación en memoria en {entry.collection} para '{query.name}'")
+            reports.append(report)
+    return reports
@@ -409,6 +409,8 @@ class OHLCV(BaseModel):
     volume: float
 
 class MarketData(BaseModel):
+    # Formato antiguo con la lista embebida; las velas nuevas van a la
+    # colección time-series market_candles (database.timeseries.CandleStore)
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     symbol: str
     timeframe: str
@@ -0,0 +1,116 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Documentos que se piden a Mongo por lote al exportar: memoria acotada sea cual sea el total
+EXPORT_BATCH_SIZE = 500
+
+
+def encode_cursor(value: Any, doc_id: ObjectId) -> str:
+    """Cursor opaco con la clave (valor de orden, _id) del último documento de la página"""
+    if isinstance(value, datetime):
+        raw = {"d": value.isoformat(), "id": str(doc_id)}
+    else:
+        raw = {"v": value, "id": str(doc_id)}
+    return base64.urlsafe_b64encode(json.dumps(raw, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, ObjectId]:
+    """(valor de orden, _id) del cursor; ValueError si no es un cursor de esta API"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = datetime.fromisoformat(raw["d"]) if "d" in raw else raw["v"]
+        return value, ObjectId(raw["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError(f"Cursor inválido: {e}")
+
+
+def keyset_filter(filter_dict: Dict[str, Any], field: str, cursor: Optional[str]) -> Dict[str, Any]:
+    """
+    Añade al filtro la condición "después del cursor" para orden descendente
+    por (field, _id): usa el mismo índice que la primera página, sin skip
+    """
+    if not cursor:
+        return filter_dict
+    value, doc_id = decode_cursor(cursor)
+    # El $lte acota el recorrido del índice; el $or desempata por _id
+    after = {field: {"$lte": value}, "$or": [{field: {"$lt": value}}, {field: value, "_id": {"$lt": doc_id}}]}
+    return {"$and": [filter_dict, after]} if filter_dict else after
+
+
+async def fetch_page(collection,
+                     filter_dict: Dict[str, Any],
+                     field: str,
+                     limit: int,
+                     cursor: Optional[str] = None,
+                     projection: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Página de `limit` documentos más recientes y el cursor de la siguiente (None si no hay más)"""
+    docs = await (
+        collection.find(keyset_filter(filter_dict, field, cursor), projection)
+        .sort([(field, -1), ("_id", -1)])
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    last = docs[-1]
+    return docs, encode_cursor(last.get(field), last["_id"])
+
+
+async def iter_documents(collection,
+                         filter_dict: Dict[str, Any],
+                         field: str,
+                         projection: Optional[Dict[str, Any]] = None,
+                         batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    """Recorre el cursor de Motor lote a lote sin acumular los documentos"""
+    cursor = (
+        collection.find(filter_dict, projection)
+        .sort([(field, -1), ("_id", -1)])
+        .batch_size(batch_size)
+    )
+    try:
+        async for doc in cursor:
+            yield doc
+    finally:
+        # Si el cliente corta la descarga, el cursor del servidor se libera ya
+        await cursor.close()
+
+
+async def ndjson_lines(docs: AsyncIterator[Dict[str, Any]],
+                       serialize: Callable[[Any], Any]) -> AsyncIterator[str]:
+    """Una línea JSON por documento"""
+    async for doc in docs:
+        yield json.dumps(serialize(doc), separators=(",", ":"), default=str) + "\n"
+
+
+async def csv_lines(docs: AsyncIterator[Dict[str, Any]],
+                    columns: Sequence[str],
+                    serialize: Callable[[Any], Any]) -> AsyncIterator[str]:
+    """Cabecera y una fila por documento; las columnas anidadas van como JSON"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(columns)
+    yield flush()
+    async for doc in docs:
+        row = serialize(doc)
+        writer.writerow([
+            json.dumps(row.get(column), default=str) if isinstance(row.get(column), (dict, list))
+            else ("" if row.get(column) is None else row.get(column))
+            for column in columns
+        ])
+        yield flush()
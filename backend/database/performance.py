@@ -0,0 +1,342 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from database.signal_analyses import owner_filter
+
+logger = logging.getLogger(__name__)
+
+PROFIT = "profit"
+LOSS = "loss"
+BREAKEVEN = "breakeven"
+OUTCOMES = (PROFIT, LOSS, BREAKEVEN)
+
+ALL_TIME = "all"
+
+
+def stats_id(user_id: str, period: str) -> str:
+    """_id del documento de performance_stats: uno global y uno por mes (YYYY-MM)"""
+    return f"{user_id}:{period}"
+
+
+def month_period(at: datetime) -> str:
+    return at.strftime("%Y-%m")
+
+
+def month_bounds(period: str):
+    start = datetime.strptime(period, "%Y-%m")
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+def stat_key(name: str) -> str:
+    """Símbolos como claves de subdocumento: sin puntos ni $ (EURUSD.m -> EURUSD_m)"""
+    return str(name or "unknown").replace(".", "_").lstrip("$") or "unknown"
+
+
+def _add(path: str, amount) -> Dict[str, Any]:
+    return {"$add": [{"$ifNull": [f"${path}", 0]}, amount]}
+
+
+def _ratio(numerator: str, denominator: str) -> Dict[str, Any]:
+    return {"$cond": [{"$gt": [f"${denominator}", 0]}, {"$divide": [f"${numerator}", f"${denominator}"]}, 0]}
+
+
+def _streak(result: str) -> Dict[str, Any]:
+    """Racha actual con signo: positiva en ganadoras, negativa en perdedoras; un breakeven la corta"""
+    current = {"$ifNull": ["$current_streak", 0]}
+    if result == PROFIT:
+        return {"$cond": [{"$gt": [current, 0]}, {"$add": [current, 1]}, 1]}
+    if result == LOSS:
+        return {"$cond": [{"$lt": [current, 0]}, {"$subtract": [current, 1]}, -1]}
+    return 0
+
+
+def outcome_update(user_id: str, period: str, result: str, pips: float, symbol: str, timeframe: str,
+                   at: datetime) -> List[Dict[str, Any]]:
+    """
+    Update con pipeline que suma un resultado a un documento de estadísticas:
+    contadores, racha y desgloses en una sola escritura atómica, sin releer
+    las señales del periodo
+    """
+    win = 1 if result == PROFIT else 0
+    loss = 1 if result == LOSS else 0
+    counters = {
+        "user_id": user_id,
+        "period": period,
+        "total_signals": _add("total_signals", 1),
+        "profitable_signals": _add("profitable_signals", win),
+        "losing_signals": _add("losing_signals", loss),
+        "total_pips": _add("total_pips", pips),
+        "current_streak": _streak(result),
+        "updated_at": at,
+    }
+    if period == ALL_TIME:
+        counters["period_start"] = {"$min": [{"$ifNull": ["$period_start", at]}, at]}
+        counters["period_end"] = {"$max": [{"$ifNull": ["$period_end", at]}, at]}
+    else:
+        counters["period_start"], counters["period_end"] = month_bounds(period)
+
+    breakdowns = [f"symbol_performance.{stat_key(symbol)}", f"timeframe_performance.{stat_key(timeframe)}"]
+    for prefix in breakdowns:
+        counters[f"{prefix}.total"] = _add(f"{prefix}.total", 1)
+        counters[f"{prefix}.wins"] = _add(f"{prefix}.wins", win)
+        counters[f"{prefix}.losses"] = _add(f"{prefix}.losses", loss)
+        counters[f"{prefix}.pips"] = _add(f"{prefix}.pips", pips)
+
+    derived = {
+        "win_rate": _ratio("profitable_signals", "total_signals"),
+        "average_pips_per_trade": _ratio("total_pips", "total_signals"),
+        "max_consecutive_wins": {"$max": [{"$ifNull": ["$max_consecutive_wins", 0]}, "$current_streak"]},
+        "max_consecutive_losses": {
+            "$max": [{"$ifNull": ["$max_consecutive_losses", 0]}, {"$multiply": ["$current_streak", -1]}]
+        },
+    }
+    for prefix in breakdowns:
+        derived[f"{prefix}.win_rate"] = _ratio(f"{prefix}.wins", f"{prefix}.total")
+    return [{"$set": counters}, {"$set": derived}]
+
+
+def signal_outcome_time(signal: Dict[str, Any]) -> datetime:
+    """Momento del resultado: el cambio de estado o, si no lo hay, la creación (igual que el backfill)"""
+    return signal.get("status_changed_at") or signal.get("timestamp") or datetime.utcnow()
+
+
+async def record_signal_outcome(db, signal: Dict[str, Any]) -> bool:
+    """
+    Suma el resultado de una señal a sus estadísticas (global y del mes).
+    La marca stats_counted en la señal garantiza que cuenta una sola vez
+    aunque el resultado se notifique dos veces; si la escritura de las
+    estadísticas falla se retira la marca y el próximo backfill la recoge.
+    """
+    result = signal.get("result")
+    if result not in OUTCOMES:
+        return False
+    claimed = await db.trading_signals.update_one(
+        {"_id": signal["_id"], "stats_counted": {"$ne": True}},
+        {"$set": {"stats_counted": True}},
+    )
+    if not claimed.modified_count:
+        return False
+
+    at = signal_outcome_time(signal)
+    user_id = str(signal["user_id"])
+    try:
+        for period in (ALL_TIME, month_period(at)):
+            await db.performance_stats.update_one(
+                {"_id": stats_id(user_id, period)},
+                outcome_update(
+                    user_id, period, result, float(signal.get("pips_result") or 0.0),
+                    signal.get("symbol"), signal.get("timeframe"), at,
+                ),
+                upsert=True,
+            )
+    except Exception as e:
+        logger.error(f"Error sumando el resultado de la señal {signal['_id']} a las estadísticas: {e}")
+        await db.trading_signals.update_one({"_id": signal["_id"]}, {"$unset": {"stats_counted": ""}})
+        return False
+    return True
+
+
+async def get_performance_stats(db, user_id: str, period: str = ALL_TIME) -> Optional[Dict[str, Any]]:
+    """Estadísticas ya materializadas: una lectura por _id"""
+    return await db.performance_stats.find_one({"_id": stats_id(user_id, period)}, {"current_streak": 0})
+
+
+def _breakdown_facet(field: str) -> List[Dict[str, Any]]:
+    return [
+        {"$group": {
+            "_id": {"user_id": "$user_id", "period": "$period", "key": f"${field}"},
+            "total": {"$sum": 1},
+            "wins": {"$sum": {"$cond": [{"$eq": ["$result", PROFIT]}, 1, 0]}},
+            "losses": {"$sum": {"$cond": [{"$eq": ["$result", LOSS]}, 1, 0]}},
+            "pips": {"$sum": "$pips"},
+        }},
+    ]
+
+
+# Rachas sobre los resultados ordenados por fecha: {cur, wins, losses}
+STREAK_REDUCE = {
+    "$reduce": {
+        "input": "$results",
+        "initialValue": {"cur": 0, "wins": 0, "losses": 0},
+        "in": {"$let": {
+            "vars": {"cur": {"$switch": {
+                "branches": [
+                    {"case": {"$eq": ["$$this", PROFIT]},
+                     "then": {"$cond": [{"$gt": ["$$value.cur", 0]}, {"$add": ["$$value.cur", 1]}, 1]}},
+                    {"case": {"$eq": ["$$this", LOSS]},
+                     "then": {"$cond": [{"$lt": ["$$value.cur", 0]}, {"$subtract": ["$$value.cur", 1]}, -1]}},
+                ],
+                "default": 0,
+            }}},
+            "in": {
+                "cur": "$$cur",
+                "wins": {"$max": ["$$value.wins", "$$cur"]},
+                "losses": {"$max": ["$$value.losses", {"$multiply": ["$$cur", -1]}]},
+            },
+        }},
+    }
+}
+
+
+def backfill_pipeline(run_id: ObjectId, user_id: Any) -> List[Dict[str, Any]]:
+    """
+    Agrega en Mongo las señales de un usuario marcadas en una pasada del
+    backfill: un usuario por agregación mantiene el $facet lejos de 16 MB
+    """
+    match = {"stats_run": run_id, "user_id": user_id}
+    at = {"$ifNull": ["$status_changed_at", "$timestamp"]}
+    return [
+        {"$match": match},
+        {"$project": {
+            # Las señales antiguas guardan el user_id como ObjectId: una sola clave por usuario
+            "user_id": {"$toString": "$user_id"}, "symbol": 1, "timeframe": 1, "result": 1,
+            "pips": {"$ifNull": ["$pips_result", 0]},
+            "at": at,
+            # Cada resultado cuenta en el global y en su mes
+            "period": [ALL_TIME, {"$dateToString": {"format": "%Y-%m", "date": at}}],
+        }},
+        {"$unwind": "$period"},
+        {"$sort": {"at": 1}},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": {"user_id": "$user_id", "period": "$period"},
+                    "total_signals": {"$sum": 1},
+                    "profitable_signals": {"$sum": {"$cond": [{"$eq": ["$result", PROFIT]}, 1, 0]}},
+                    "losing_signals": {"$sum": {"$cond": [{"$eq": ["$result", LOSS]}, 1, 0]}},
+                    "total_pips": {"$sum": "$pips"},
+                    "first": {"$min": "$at"},
+                    "last": {"$max": "$at"},
+                    "results": {"$push": "$result"},
+                }},
+                {"$set": {"streaks": STREAK_REDUCE}},
+                {"$unset": "results"},
+            ],
+            "symbols": _breakdown_facet("symbol"),
+            "timeframes": _breakdown_facet("timeframe"),
+        }},
+    ]
+
+
+def _breakdown_entry(row: Dict[str, Any]) -> Dict[str, float]:
+    return {
+        "total": row["total"],
+        "wins": row["wins"],
+        "losses": row["losses"],
+        "pips": row["pips"],
+        "win_rate": row["wins"] / row["total"] if row["total"] else 0.0,
+    }
+
+
+def stats_documents(facets: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Convierte el resultado del $facet en documentos de performance_stats"""
+    docs: Dict[str, Dict[str, Any]] = {}
+    now = datetime.utcnow()
+    for row in facets["totals"]:
+        user_id, period = row["_id"]["user_id"], row["_id"]["period"]
+        total = row["total_signals"]
+        start, end = (row["first"], row["last"]) if period == ALL_TIME else month_bounds(period)
+        docs[stats_id(user_id, period)] = {
+            "_id": stats_id(user_id, period),
+            "user_id": user_id,
+            "period": period,
+            "period_start": start,
+            "period_end": end,
+            "total_signals": total,
+            "profitable_signals": row["profitable_signals"],
+            "losing_signals": row["losing_signals"],
+            "win_rate": row["profitable_signals"] / total if total else 0.0,
+            "total_pips": row["total_pips"],
+            "average_pips_per_trade": row["total_pips"] / total if total else 0.0,
+            "max_consecutive_wins": row["streaks"]["wins"],
+            "max_consecutive_losses": row["streaks"]["losses"],
+            "current_streak": row["streaks"]["cur"],
+            "symbol_performance": {},
+            "timeframe_performance": {},
+            "updated_at": now,
+        }
+    for facet, field in (("symbols", "symbol_performance"), ("timeframes", "timeframe_performance")):
+        for row in facets[facet]:
+            doc = docs.get(stats_id(row["_id"]["user_id"], row["_id"]["period"]))
+            if doc is not None:
+                doc[field][stat_key(row["_id"]["key"])] = _breakdown_entry(row)
+    return list(docs.values())
+
+
+def merge_update(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Update con pipeline que suma un documento calculado por el backfill al
+    existente (las señales de la vía incremental ya están en él). Las rachas
+    máximas se combinan con el máximo; la racha actual queda la existente.
+    """
+    counters: Dict[str, Any] = {
+        "user_id": doc["user_id"],
+        "period": doc["period"],
+        "total_signals": _add("total_signals", doc["total_signals"]),
+        "profitable_signals": _add("profitable_signals", doc["profitable_signals"]),
+        "losing_signals": _add("losing_signals", doc["losing_signals"]),
+        "total_pips": _add("total_pips", doc["total_pips"]),
+        "current_streak": {"$ifNull": ["$current_streak", doc["current_streak"]]},
+        "max_consecutive_wins": {"$max": [{"$ifNull": ["$max_consecutive_wins", 0]}, doc["max_consecutive_wins"]]},
+        "max_consecutive_losses": {
+            "$max": [{"$ifNull": ["$max_consecutive_losses", 0]}, doc["max_consecutive_losses"]]
+        },
+        "updated_at": doc["updated_at"],
+    }
+    if doc["period"] == ALL_TIME:
+        counters["period_start"] = {"$min": [{"$ifNull": ["$period_start", doc["period_start"]]}, doc["period_start"]]}
+        counters["period_end"] = {"$max": [{"$ifNull": ["$period_end", doc["period_end"]]}, doc["period_end"]]}
+    else:
+        counters["period_start"], counters["period_end"] = doc["period_start"], doc["period_end"]
+
+    derived = {
+        "win_rate": _ratio("profitable_signals", "total_signals"),
+        "average_pips_per_trade": _ratio("total_pips", "total_signals"),
+    }
+    for field in ("symbol_performance", "timeframe_performance"):
+        for key, entry in doc[field].items():
+            prefix = f"{field}.{key}"
+            for name in ("total", "wins", "losses", "pips"):
+                counters[f"{prefix}.{name}"] = _add(f"{prefix}.{name}", entry[name])
+            derived[f"{prefix}.win_rate"] = _ratio(f"{prefix}.wins", f"{prefix}.total")
+    return [{"$set": counters}, {"$set": derived}]
+
+
+async def backfill_performance_stats(db, user_id: Optional[str] = None) -> int:
+    """
+    Suma a performance_stats las señales con resultado que aún no contaban
+    (arranque del materializador o corrección). Cada pasada marca sus
+    señales con un stats_run propio y agrega sólo ésas, usuario a usuario:
+    una señal contada por la vía incremental nunca entra dos veces. Si la
+    escritura de un usuario falla, sus señales se desmarcan para otra pasada.
+    """
+    run_id = ObjectId()
+    marked: Dict[str, Any] = {"result": {"$in": list(OUTCOMES)}, "stats_counted": {"$ne": True}}
+    if user_id:
+        marked["user_id"] = owner_filter(user_id)
+    await db.trading_signals.update_many(marked, {"$set": {"stats_counted": True, "stats_run": run_id}})
+
+    written = 0
+    for owner in await db.trading_signals.distinct("user_id", {"stats_run": run_id}):
+        try:
+            pipeline = backfill_pipeline(run_id, owner)
+            facets = await db.trading_signals.aggregate(pipeline, allowDiskUse=True).to_list(length=1)
+            docs = stats_documents(facets[0]) if facets else []
+            if docs:
+                await db.performance_stats.bulk_write(
+                    [UpdateOne({"_id": doc["_id"]}, merge_update(doc), upsert=True) for doc in docs]
+                )
+            written += len(docs)
+        except Exception as e:
+            logger.error(f"Error en el backfill de estadísticas del usuario {owner}: {e}")
+            await db.trading_signals.update_many(
+                {"stats_run": run_id, "user_id": owner},
+                {"$unset": {"stats_counted": "", "stats_run": ""}},
+            )
+    logger.info(f"Estadísticas de performance actualizadas: {written} documentos")
+    return written
@@ -0,0 +1,96 @@
+import json
+import logging
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from bson import Binary, ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Campos voluminosos que sólo necesita la vista de detalle
+COLD_FIELDS = ("technical_analyses", "config_used")
+
+# Proyección de los listados: también recorta las señales antiguas que aún los embeben
+SIGNAL_LIST_PROJECTION = {field: 0 for field in COLD_FIELDS}
+
+ENCODING = "zlib+json"
+
+
+def owner_filter(user_id: Any) -> Any:
+    """
+    Condición sobre user_id en documentos por usuario (señales, ajustes): se
+    guarda como str, pero lo escrito por REST antes de normalizarlo lo lleva
+    como ObjectId
+    """
+    user_id = str(user_id)
+    if ObjectId.is_valid(user_id):
+        return {"$in": [user_id, ObjectId(user_id)]}
+    return user_id
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def compress_payload(payload: Dict[str, Any]) -> Binary:
+    raw = json.dumps(payload, separators=(",", ":"), default=_json_default).encode("utf-8")
+    return Binary(zlib.compress(raw, 6))
+
+
+def decompress_payload(blob: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def split_signal_document(signal_doc: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Separa el resumen que se lista del análisis completo que se guarda aparte"""
+    summary = {key: value for key, value in signal_doc.items() if key not in COLD_FIELDS}
+    cold = {key: signal_doc[key] for key in COLD_FIELDS if key in signal_doc}
+    # Tipo y confianza de cada análisis bastan para pintar la lista
+    summary["analysis_summary"] = [
+        {"type": analysis.get("type"), "confidence": analysis.get("confidence")}
+        for analysis in cold.get("technical_analyses") or []
+    ]
+    return summary, cold
+
+
+def analysis_document(signal_id: ObjectId,
+                      user_id: str,
+                      cold: Dict[str, Any],
+                      expires_at: Optional[datetime] = None) -> Dict[str, Any]:
+    """Documento de signal_analyses: mismo _id que la señal y el payload comprimido"""
+    blob = compress_payload(cold)
+    doc = {
+        "_id": signal_id,
+        "user_id": user_id,
+        "encoding": ENCODING,
+        "payload": blob,
+        "size": len(blob),
+        "created_at": datetime.utcnow(),
+    }
+    if expires_at is not None:
+        # Caduca con su señal (mismo índice TTL sobre expires_at)
+        doc["expires_at"] = expires_at
+    return doc
+
+
+async def get_signal_detail(db, user_id: str, signal_id: ObjectId) -> Optional[Dict[str, Any]]:
+    """Señal completa: el resumen más el análisis descomprimido"""
+    signal = await db.trading_signals.find_one({"_id": signal_id, "user_id": owner_filter(user_id)})
+    if signal is None:
+        return None
+
+    analysis = await db.signal_analyses.find_one({"_id": signal_id, "user_id": owner_filter(user_id)})
+    if analysis is not None:
+        try:
+            signal.update(decompress_payload(analysis["payload"]))
+        except Exception as e:
+            logger.error(f"Análisis de la señal {signal_id} ilegible: {e}")
+    # Las señales guardadas antes de la separación ya traen el análisis embebido
+    return signal
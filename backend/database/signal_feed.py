@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import weakref
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from database.performance import record_signal_outcome
+from database.signal_analyses import SIGNAL_LIST_PROJECTION, owner_filter
+
+logger = logging.getLogger(__name__)
+
+# Documento de contador por usuario en la colección counters
+SEQ_COUNTER_ID = "signal_seq:{user_id}"
+
+
+async def _increment_counter(db, user_id: str, count: int) -> int:
+    counter = await db.counters.find_one_and_update(
+        {"_id": SEQ_COUNTER_ID.format(user_id=user_id)},
+        {"$inc": {"seq": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["seq"] - count + 1
+
+
+async def _counter_seq(db, user_id: str) -> int:
+    counter = await db.counters.find_one({"_id": SEQ_COUNTER_ID.format(user_id=user_id)})
+    return counter["seq"] if counter else 0
+
+
+class SeqReservations:
+    """
+    Secuencias reservadas cuyo documento todavía no está escrito. Reservar y
+    calcular el techo de un delta pasan por el mismo lock del usuario, así
+    un delta nunca entrega una secuencia posterior a otra que aún se está
+    escribiendo: el cliente no avanza su cursor por encima de ella. Es por
+    proceso, como la cola diferida que escribe las señales.
+    """
+
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._held: Dict[str, List[int]] = {}
+
+    def _lock(self, user_id: str) -> asyncio.Lock:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def reserve(self, db, user_id: Any, count: int = 1) -> int:
+        """Reserva `count` secuencias consecutivas y las retiene hasta release; devuelve la primera"""
+        user_id = str(user_id)
+        async with self._lock(user_id):
+            first = await _increment_counter(db, user_id, count)
+            self._held.setdefault(user_id, []).append(first)
+        return first
+
+    def release(self, user_id: Any, first: int):
+        """El documento ya está escrito (o la escritura falló): deja de limitar los deltas"""
+        user_id = str(user_id)
+        held = self._held.get(user_id)
+        if held and first in held:
+            held.remove(first)
+            if not held:
+                del self._held[user_id]
+
+    async def ceiling(self, db, user_id: Any) -> int:
+        """Mayor secuencia que un delta puede entregar sin saltarse escrituras en curso"""
+        user_id = str(user_id)
+        async with self._lock(user_id):
+            held = self._held.get(user_id)
+            if held:
+                return min(held) - 1
+            return await _counter_seq(db, user_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {user_id: len(held) for user_id, held in self._held.items()}
+
+
+seq_reservations = SeqReservations()
+
+
+@asynccontextmanager
+async def reserved_seqs(db, user_id: Any, count: int = 1):
+    """Secuencias reservadas mientras dura el bloque que escribe sus documentos"""
+    first = await seq_reservations.reserve(db, user_id, count)
+    try:
+        yield first
+    finally:
+        seq_reservations.release(user_id, first)
+
+
+async def assign_signal_seqs(db, signal_docs: List[Dict[str, Any]]) -> Callable[[], None]:
+    """
+    Numera un lote de señales con una reserva por usuario (escritura
+    diferida). Devuelve la función que libera las reservas tras el bulk_write;
+    un reintento vuelve a numerar, porque los cursores pueden haber pasado ya
+    la secuencia de un intento fallido.
+    """
+    per_user: Dict[str, List[Dict[str, Any]]] = {}
+    for doc in signal_docs:
+        per_user.setdefault(str(doc["user_id"]), []).append(doc)
+    holds: List[Tuple[str, int]] = []
+    try:
+        for user_id, docs in per_user.items():
+            first = await seq_reservations.reserve(db, user_id, len(docs))
+            holds.append((user_id, first))
+            for offset, doc in enumerate(docs):
+                doc["seq"] = doc["created_seq"] = first + offset
+    except BaseException:
+        _release_all(holds)
+        raise
+    return lambda: _release_all(holds)
+
+
+def _release_all(holds: List[Tuple[str, int]]):
+    for user_id, first in holds:
+        seq_reservations.release(user_id, first)
+
+
+async def current_signal_seq(db, user_id: Any) -> int:
+    """Secuencia del feed hasta la que todo está escrito (cursor inicial de un listado)"""
+    return await seq_reservations.ceiling(db, user_id)
+
+
+async def close_signals(db, closes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Cierra un lote de señales ACTIVE con su resultado: una reserva de
+    secuencias por usuario y un solo bulk_write; después se suman a las
+    estadísticas sólo los cierres que se aplicaron. Cada cierre trae _id,
+    user_id, symbol, timeframe, status y los campos a guardar (result,
+    pips_result...). Devuelve los cierres aplicados.
+    """
+    if not closes:
+        return []
+    now = datetime.utcnow()
+    per_user: Dict[str, List[Dict[str, Any]]] = {}
+    for close in closes:
+        per_user.setdefault(close["user_id"], []).append(close)
+    holds: List[Tuple[str, int]] = []
+    try:
+        for user_id, user_closes in per_user.items():
+            first = await seq_reservations.reserve(db, user_id, len(user_closes))
+            holds.append((user_id, first))
+            for offset, close in enumerate(user_closes):
+                close["seq"] = first + offset
+                close["status_changed_at"] = now
+
+        # Por _id: el user_id guardado puede ser ObjectId o str según quién creó la señal
+        operations = [
+            UpdateOne(
+                {"_id": close["_id"], "status": "ACTIVE"},
+                {"$set": {k: v for k, v in close.items() if k not in ("_id", "user_id", "symbol", "timeframe")}},
+            )
+            for close in closes
+        ]
+        await db.trading_signals.bulk_write(operations, ordered=False)
+    finally:
+        _release_all(holds)
+
+    # La secuencia de cada cierre es única: si la señal la tiene, el cierre se aplicó
+    seqs = {close["_id"]: close["seq"] for close in closes}
+    cursor = db.trading_signals.find({"_id": {"$in": list(seqs)}}, {"seq": 1})
+    applied_ids = {doc["_id"] async for doc in cursor if doc.get("seq") == seqs[doc["_id"]]}
+    applied = [close for close in closes if close["_id"] in applied_ids]
+    for close in applied:
+        await record_signal_outcome(db, close)
+    return applied
+
+
+async def remove_signal(db, user_id: str, signal_id: ObjectId) -> bool:
+    """Borra la señal dejando una lápida para que los clientes la quiten en el próximo delta"""
+    signal = await db.trading_signals.find_one_and_delete(
+        {"_id": signal_id, "user_id": owner_filter(user_id)},
+        projection={"symbol": 1},
+    )
+    if signal is None:
+        return False
+    await db.signal_analyses.delete_one({"_id": signal_id})
+    async with reserved_seqs(db, user_id) as seq:
+        await db.signal_tombstones.insert_one({
+            "user_id": str(user_id),
+            "signal_id": signal_id,
+            "symbol": signal.get("symbol"),
+            "seq": seq,
+            "deleted_at": datetime.utcnow(),
+        })
+    return True
+
+
+async def get_signal_changes(db,
+                             user_id: str,
+                             since_seq: int,
+                             pair: Optional[str] = None,
+                             limit: int = 100) -> Dict[str, Any]:
+    """
+    Cambios del feed posteriores a `since_seq`: señales nuevas completas,
+    sólo el estado de las que el cliente ya tenía y los ids borrados.
+    `seq` es el cursor para la siguiente llamada; nunca pasa de una
+    secuencia reservada cuyo documento aún se está escribiendo.
+    """
+    ceiling = await seq_reservations.ceiling(db, user_id)
+    if ceiling <= since_seq:
+        return {"seq": since_seq, "signals": [], "status_changes": [], "deleted": [], "has_more": False}
+    query: Dict[str, Any] = {"user_id": owner_filter(user_id), "seq": {"$gt": since_seq, "$lte": ceiling}}
+    if pair:
+        query["symbol"] = pair
+
+    changed = await (
+        db.trading_signals.find(query, SIGNAL_LIST_PROJECTION).sort("seq", 1).limit(limit + 1).to_list(length=limit + 1)
+    )
+    deleted = await db.signal_tombstones.find(query).sort("seq", 1).limit(limit + 1).to_list(length=limit + 1)
+
+    events = sorted(
+        [("signal", doc) for doc in changed] + [("deleted", doc) for doc in deleted],
+        key=lambda event: event[1]["seq"],
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    signals: List[Dict[str, Any]] = []
+    status_changes: List[Dict[str, Any]] = []
+    removed: List[Dict[str, Any]] = []
+    for kind, doc in events:
+        if kind == "deleted":
+            removed.append({"id": str(doc["signal_id"]), "seq": doc["seq"]})
+        elif doc.get("created_seq", doc["seq"]) > since_seq:
+            signals.append(doc)
+        else:
+            status_changes.append({"id": str(doc["_id"]), "seq": doc["seq"], "status": doc.get("status")})
+
+    # El cursor avanza sólo hasta lo efectivamente leído, nunca hasta el contador
+    return {
+        "seq": events[-1][1]["seq"] if events else since_seq,
+        "signals": signals,
+        "status_changes": status_changes,
+        "deleted": removed,
+        "has_more": has_more,
+    }
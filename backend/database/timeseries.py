@@ -0,0 +1,215 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+CANDLES_COLLECTION = "market_candles"
+SIGNAL_SAMPLES_COLLECTION = "signal_price_samples"
+
+TIME_FIELD = "t"
+META_FIELD = "m"
+
+# Filas por lote al leer un rango
+READ_BATCH_SIZE = 5000
+
+# Una fila por instante: (tiempo, valor de cada campo en el orden del store)
+Row = Tuple[Any, ...]
+
+
+@dataclass
+class SeriesSpec:
+    name: str
+    granularity: str
+    meta_keys: Tuple[str, ...]
+    expire_after_seconds: Optional[int] = None
+
+
+def series_catalog() -> List[SeriesSpec]:
+    return [
+        SeriesSpec(CANDLES_COLLECTION, "minutes", ("symbol", "timeframe")),
+        SeriesSpec(
+            SIGNAL_SAMPLES_COLLECTION,
+            "seconds",
+            ("signal_id",),
+            expire_after_seconds=settings.signal_samples_ttl_days * 86400 or None,
+        ),
+    ]
+
+
+async def ensure_timeseries_collections(db) -> Dict[str, bool]:
+    """
+    Crea las colecciones time-series (MongoDB 5.0+). En servidores sin
+    soporte quedan como colecciones normales con el mismo índice
+    (meta, t), así el API de append/lectura es igual en los dos casos.
+    """
+    existing = set(await db.list_collection_names())
+    native: Dict[str, bool] = {}
+    for spec in series_catalog():
+        options: Dict[str, Any] = {
+            "timeseries": {"timeField": TIME_FIELD, "metaField": META_FIELD, "granularity": spec.granularity},
+        }
+        if spec.expire_after_seconds:
+            options["expireAfterSeconds"] = spec.expire_after_seconds
+
+        native[spec.name] = True
+        if spec.name not in existing:
+            try:
+                await db.create_collection(spec.name, **options)
+            except CollectionInvalid:
+                pass
+            except OperationFailure as e:
+                native[spec.name] = False
+                logger.warning(f"{spec.name} sin colección time-series ({e}); se usa una colección normal")
+
+        # Índice secundario por meta + tiempo: lecturas por rango proporcionales al rango
+        keys = [(f"{META_FIELD}.{key}", 1) for key in spec.meta_keys] + [(TIME_FIELD, 1)]
+        try:
+            await db[spec.name].create_index(keys)
+        except Exception as e:
+            logger.error(f"Índice de {spec.name} no creado: {e}")
+    return native
+
+
+class TimeSeriesStore:
+    """
+    Serie de mediciones por clave de meta (p.ej. símbolo y timeframe): un
+    documento por instante en lugar de una lista embebida que crece sin fin.
+    Las lecturas por rango devuelven arrays de NumPy por campo.
+    """
+
+    def __init__(self, get_db, collection: str, fields: Sequence[str], write=None):
+        self.get_db = get_db
+        self.collection = collection
+        self.fields = tuple(fields)
+        # Cola de escritura diferida opcional: append no espera a Mongo
+        self.write = write
+        self._latest: Dict[Tuple, Optional[datetime]] = {}
+
+    @staticmethod
+    def _meta_filter(meta: Dict[str, Any]) -> Dict[str, Any]:
+        # Campo a campo: la igualdad de subdocumento depende del orden de las claves
+        return {f"{META_FIELD}.{key}": value for key, value in meta.items()}
+
+    async def latest_time(self, meta: Dict[str, Any]) -> Optional[datetime]:
+        key = tuple(sorted(meta.items()))
+        if key not in self._latest:
+            doc = await self.get_db()[self.collection].find_one(
+                self._meta_filter(meta), {TIME_FIELD: 1}, sort=[(TIME_FIELD, -1)]
+            )
+            self._latest[key] = doc[TIME_FIELD] if doc else None
+        return self._latest[key]
+
+    async def append(self, meta: Dict[str, Any], rows: Sequence[Row]) -> int:
+        """Añade las filas posteriores a la última guardada; devuelve cuántas"""
+        latest = await self.latest_time(meta)
+        docs = [
+            {TIME_FIELD: row[0], META_FIELD: meta, **dict(zip(self.fields, row[1:]))}
+            for row in rows
+            if latest is None or row[0] > latest
+        ]
+        if not docs:
+            return 0
+
+        if self.write is not None:
+            for doc in docs:
+                await self.write.insert(self.collection, doc)
+        else:
+            await self.get_db()[self.collection].insert_many(docs, ordered=False)
+        self._latest[tuple(sorted(meta.items()))] = docs[-1][TIME_FIELD]
+        return len(docs)
+
+    async def read(self,
+                   meta: Dict[str, Any],
+                   start: Optional[datetime] = None,
+                   end: Optional[datetime] = None,
+                   limit: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Rango [start, end) en orden cronológico como {"t": epoch ms, campo: array}.
+        Con `limit` se devuelven las últimas `limit` filas del rango.
+        """
+        match = self._meta_filter(meta)
+        if start or end:
+            match[TIME_FIELD] = {
+                **({"$gte": start} if start else {}),
+                **({"$lt": end} if end else {}),
+            }
+        pipeline: List[Dict[str, Any]] = [{"$match": match}, {"$sort": {TIME_FIELD: -1 if limit else 1}}]
+        if limit:
+            pipeline.append({"$limit": limit})
+        # Documentos pequeños por lotes (un solo documento con todo el rango pasaría de 16 MB)
+        pipeline.append({"$project": {
+            "_id": 0,
+            TIME_FIELD: {"$toLong": f"${TIME_FIELD}"},
+            **{field: 1 for field in self.fields},
+        }})
+
+        columns: Dict[str, List[Any]] = {name: [] for name in (TIME_FIELD, *self.fields)}
+        cursor = self.get_db()[self.collection].aggregate(pipeline, batchSize=READ_BATCH_SIZE)
+        async for doc in cursor:
+            for name, values in columns.items():
+                values.append(doc.get(name))
+        arrays = {TIME_FIELD: np.asarray(columns[TIME_FIELD], dtype=np.int64)}
+        for field in self.fields:
+            arrays[field] = np.asarray(columns[field], dtype=np.float64)
+        if limit:
+            arrays = {name: values[::-1] for name, values in arrays.items()}
+        return arrays
+
+
+class CandleStore(TimeSeriesStore):
+    """Velas OHLCV cerradas por (símbolo, timeframe)"""
+
+    FIELDS = ("open", "high", "low", "close", "volume")
+
+    def __init__(self, get_db, write=None):
+        super().__init__(get_db, CANDLES_COLLECTION, self.FIELDS, write)
+
+    async def append_candles(self, symbol: str, timeframe: str, candles: Sequence) -> int:
+        """Candle de realtime.candles (time en epoch segundos)"""
+        rows = [
+            (datetime.utcfromtimestamp(c.time), c.open, c.high, c.low, c.close, c.volume)
+            for c in candles
+        ]
+        return await self.append({"symbol": symbol, "timeframe": timeframe}, rows)
+
+    async def read_candles(self,
+                           symbol: str,
+                           timeframe: str,
+                           start: Optional[datetime] = None,
+                           end: Optional[datetime] = None,
+                           limit: Optional[int] = None) -> Dict[str, np.ndarray]:
+        return await self.read({"symbol": symbol, "timeframe": timeframe}, start, end, limit)
+
+
+class SignalSampleStore(TimeSeriesStore):
+    """Muestras de precio tomadas mientras se sigue el resultado de una señal"""
+
+    FIELDS = ("bid", "ask")
+
+    def __init__(self, get_db, write=None):
+        super().__init__(get_db, SIGNAL_SAMPLES_COLLECTION, self.FIELDS, write)
+
+    async def append_samples(self, rows: Sequence[Tuple[str, datetime, float, float]]) -> int:
+        """
+        Lote de (signal_id, t, bid, ask) de muchas señales a la vez. El llamador
+        muestrea con tiempos crecientes, así que no se consulta la última guardada.
+        """
+        docs = [
+            {TIME_FIELD: at, META_FIELD: {"signal_id": signal_id}, "bid": bid, "ask": ask}
+            for signal_id, at, bid, ask in rows
+        ]
+        if not docs:
+            return 0
+        if self.write is not None:
+            for doc in docs:
+                await self.write.insert(self.collection, doc)
+        else:
+            await self.get_db()[self.collection].insert_many(docs, ordered=False)
+        return len(docs)
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import settings
+from database.signal_feed import assign_signal_seqs
+from monitoring.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_DEPTH = registry.gauge(
+    "trading_ai_write_behind_depth",
+    "Escrituras pendientes en la cola diferida por colección",
+    ["collection"],
+)
+WRITE_BEHIND_FLUSH_DURATION = registry.histogram(
+    "trading_ai_write_behind_flush_seconds",
+    "Duración de cada bulk_write de la cola diferida",
+)
+WRITE_BEHIND_BATCH = registry.histogram(
+    "trading_ai_write_behind_batch_size",
+    "Operaciones por bulk_write de la cola diferida",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+WRITE_BEHIND_LAG = registry.histogram(
+    "trading_ai_write_behind_lag_seconds",
+    "Tiempo desde que se encola la escritura más antigua del lote hasta que se persiste",
+)
+WRITE_BEHIND_FAILED = registry.counter(
+    "trading_ai_write_behind_failed_total",
+    "Escrituras diferidas descartadas tras fallar",
+    ["collection"],
+)
+
+WRITE_BEHIND_WRITE_CONCERN = registry.counter(
+    "trading_ai_write_behind_write_concern_errors_total",
+    "Lotes aplicados en el primario sin la confirmación del write concern configurado",
+    ["collection"],
+)
+
+# Clave duplicada: en un reintento, la inserción ya se había aplicado
+DUPLICATE_KEY = 11000
+
+# Prepara los documentos de un lote justo antes de escribirlo (p.ej. numerarlos);
+# si devuelve una función, se llama al terminar el bulk_write (haya ido bien o no)
+PrepareFn = Callable[[Any, List[Dict[str, Any]]], Awaitable[Optional[Callable[[], None]]]]
+
+
+@dataclass
+class PendingWrite:
+    queued_at: float
+    document: Optional[Dict[str, Any]] = None
+    filter: Optional[Dict[str, Any]] = None
+    update: Optional[Dict[str, Any]] = None
+    upsert: bool = False
+    attempts: int = 0
+
+    def operation(self):
+        if self.document is not None:
+            return InsertOne(self.document)
+        return UpdateOne(self.filter, self.update, upsert=self.upsert)
+
+
+class WriteBehindQueue:
+    """
+    Escrituras diferidas: las señales, órdenes y sesiones se encolan en
+    memoria y se persisten con un bulk_write por colección al llenarse el
+    lote o cada flush_interval. Dentro de una colección se respeta el orden.
+    """
+
+    def __init__(self,
+                 get_db: Callable[[], Any],
+                 max_batch: int = 500,
+                 flush_interval_ms: float = 250.0,
+                 max_pending: int = 10000,
+                 max_retries: int = 3,
+                 prepare: Optional[Dict[str, PrepareFn]] = None):
+        self.get_db = get_db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.prepare = prepare or {}
+        self._pending: Dict[str, List[PendingWrite]] = {}
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return sum(len(writes) for writes in self._pending.values())
+
+    async def insert(self, collection: str, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Encola el documento con su _id ya asignado para poder devolverlo al cliente"""
+        document.setdefault("_id", ObjectId())
+        await self._enqueue(collection, PendingWrite(queued_at=time.monotonic(), document=document))
+        return document
+
+    async def update(self, collection: str, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        await self._enqueue(
+            collection,
+            PendingWrite(queued_at=time.monotonic(), filter=filter, update=update, upsert=upsert),
+        )
+
+    async def _enqueue(self, collection: str, write: PendingWrite):
+        if self.depth >= self.max_pending:
+            # Mongo no da abasto: el llamador espera al flush en lugar de crecer sin límite
+            await self.flush()
+        writes = self._pending.setdefault(collection, [])
+        writes.append(write)
+        WRITE_BEHIND_DEPTH.set(len(writes), collection=collection)
+        if len(writes) >= self.max_batch:
+            self._full.set()
+        self.start()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error en la cola de escritura diferida: {e}")
+
+    async def flush(self):
+        """Persiste todo lo pendiente en lotes de max_batch"""
+        async with self._lock:
+            for collection in list(self._pending):
+                while self._pending.get(collection):
+                    if not await self._flush_batch(collection):
+                        break
+
+    async def _flush_batch(self, collection: str) -> bool:
+        """Escribe un lote; False si falló y debe reintentarse en el próximo ciclo"""
+        writes = self._pending[collection]
+        batch, self._pending[collection] = writes[:self.max_batch], writes[self.max_batch:]
+        db = self.get_db()
+        started = time.monotonic()
+        finish = None
+        try:
+            if collection in self.prepare:
+                finish = await self.prepare[collection](db, [w.document for w in batch if w.document is not None])
+            with WRITE_BEHIND_FLUSH_DURATION.time():
+                await db[collection].bulk_write([w.operation() for w in batch], ordered=True)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors") or []
+            if not write_errors:
+                # Sólo writeConcernErrors: el primario aplicó todo el lote pero no se confirmó
+                # con el w/wtimeout pedido; reintentarlo duplicaría las inserciones
+                WRITE_BEHIND_WRITE_CONCERN.inc(collection=collection)
+                logger.error(
+                    f"Lote de {len(batch)} escrituras en {collection} sin confirmar por el write concern: "
+                    f"{e.details.get('writeConcernErrors')}"
+                )
+                return True
+            # Con ordered=True todo lo anterior al error quedó escrito; el resto se reintenta
+            failed = write_errors[0]["index"]
+            if write_errors[0].get("code") == DUPLICATE_KEY and batch[failed].attempts:
+                remaining = await self._drop_applied(db, collection, batch[failed:])
+                if remaining is not None and len(remaining) < len(batch) - failed:
+                    self._requeue(collection, remaining)
+                    return True
+            logger.error(f"Escritura diferida descartada en {collection}: {write_errors[0].get('errmsg')}")
+            WRITE_BEHIND_FAILED.inc(collection=collection)
+            self._requeue(collection, batch[failed + 1:])
+            return False
+        except Exception as e:
+            for write in batch:
+                write.attempts += 1
+            retry = [w for w in batch if w.attempts < self.max_retries]
+            if len(retry) < len(batch):
+                WRITE_BEHIND_FAILED.inc(len(batch) - len(retry), collection=collection)
+            logger.error(f"Error escribiendo {len(batch)} documentos en {collection} ({len(retry)} se reintentan): {e}")
+            self._requeue(collection, retry)
+            return False
+        finally:
+            if finish is not None:
+                finish()
+            WRITE_BEHIND_DEPTH.set(len(self._pending.get(collection, [])), collection=collection)
+
+        WRITE_BEHIND_BATCH.observe(len(batch))
+        WRITE_BEHIND_LAG.observe(started - batch[0].queued_at)
+        return True
+
+    async def _drop_applied(self,
+                            db,
+                            collection: str,
+                            writes: List[PendingWrite]) -> Optional[List[PendingWrite]]:
+        """
+        Un lote que falló con una excepción genérica pudo aplicarse igualmente:
+        al reintentarlo, las inserciones que ya están en Mongo dan 11000. Se
+        quitan todas de una vez (una consulta por _id) en lugar de una por ciclo.
+        """
+        retried = [w.document["_id"] for w in writes if w.attempts and w.document is not None]
+        try:
+            cursor = db[collection].find({"_id": {"$in": retried}}, {"_id": 1})
+            applied = {doc["_id"] async for doc in cursor}
+        except Exception as e:
+            logger.error(f"No se pudo comprobar qué inserciones reintentadas de {collection} ya estaban: {e}")
+            return None
+        if applied:
+            logger.warning(f"{len(applied)} inserciones reintentadas en {collection} ya estaban aplicadas")
+        return [w for w in writes if not (w.attempts and w.document is not None and w.document["_id"] in applied)]
+
+    def _requeue(self, collection: str, writes: List[PendingWrite]):
+        self._pending[collection] = writes + self._pending.get(collection, [])
+
+    async def drain(self):
+        """Al cerrar la aplicación: para el flusher y persiste lo pendiente"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _ in range(self.max_retries):
+            await self.flush()
+            if not self.depth:
+                break
+        if self.depth:
+            logger.error(f"Cola de escritura diferida cerrada con {self.depth} escrituras sin persistir")
+        else:
+            logger.info("Cola de escritura diferida vaciada")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": {collection: len(writes) for collection, writes in self._pending.items() if writes},
+            "max_batch": self.max_batch,
+            "flush_interval_ms": self.flush_interval * 1000,
+        }
+
+
+def create_write_behind(get_db: Callable[[], Any]) -> WriteBehindQueue:
+    """Cola configurada desde settings; las señales se numeran por lote al escribirse"""
+    return WriteBehindQueue(
+        get_db,
+        max_batch=settings.write_behind_max_batch,
+        flush_interval_ms=settings.write_behind_flush_interval_ms,
+        max_pending=settings.write_behind_max_pending,
+        max_retries=settings.write_behind_max_retries,
+        prepare={"trading_signals": assign_signal_seqs},
+    )
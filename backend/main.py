@@ -1,10 +1,11 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 import logging
 import json
+import asyncio
 from contextlib import asynccontextmanager
 from bson import ObjectId
 from datetime import datetime
@@ -14,14 +15,24 @@ import pandas as pd
 # Importar routers
 from api.auth import router as auth_router
 from api.pairs import router as pairs_router
-from api.signals import router as signals_router
+from api.signals import (
+    router as signals_router, archive_job, bar_scheduler, tick_hub, alert_engine, outcome_tracker, write_behind,
+)
+from api.alerts import router as alerts_router  # Alertas de precio y de señal
+from api.performance import router as performance_router  # Estadísticas precalculadas
 # Nuevos routers importados
 from api.charts_endpoints import router as charts_router  # Router de gráficos
 from api.mt5_endpoints import router as mt5_router  # Router de integración MT5
+from api.monitoring_endpoints import router as monitoring_router  # Perfiles y diagnóstico
 
 # Importar componentes
-from database.connection import connect_to_mongo, close_mongo_connection
+from database.connection import connect_to_mongo, close_mongo_connection, get_database
+from database.cache import watch_invalidations
 from mt5.data_provider import MT5DataProvider
+from monitoring.profiler import request_profiler
+from monitoring.metrics import registry as metrics_registry
+from monitoring.loop_watchdog import loop_watchdog
+from config import settings
 
 # Configurar logging
 logging.basicConfig(
@@ -97,6 +108,8 @@ async def lifespan(app: FastAPI):
         # Conectar a MongoDB
         await connect_to_mongo()
         logger.info("✅ Conexión a MongoDB establecida")
+        await alert_engine.load()
+        await outcome_tracker.load()
         
         # Inicializar MT5
         global mt5_provider
@@ -108,11 +121,38 @@ async def lifespan(app: FastAPI):
             
     except Exception as e:
         logger.error(f"❌ Error durante el inicio: {e}")
+
+    # Watchdog del event loop: mide el lag y atribuye los bloqueos a su endpoint
+    loop_watchdog_task = None
+    if settings.loop_watchdog_enabled:
+        loop_watchdog.register_routes(app.routes)
+        loop_watchdog_task = asyncio.create_task(loop_watchdog.run())
+
+    # Con varios workers, los cambios de otros procesos invalidan las caches de este
+    cache_watch_task = None
+    if settings.cache_change_streams:
+        cache_watch_task = asyncio.create_task(watch_invalidations(get_database()))
+
+    # Señales y órdenes antiguas a ficheros comprimidos por mes
+    archive_task = None
+    if settings.archive_enabled:
+        archive_task = asyncio.create_task(archive_job.run_forever(settings.archive_interval_hours))
         
     yield
     
     # Shutdown
     logger.info("Cerrando aplicación Trading AI...")
+    if loop_watchdog_task:
+        loop_watchdog_task.cancel()
+    if cache_watch_task:
+        cache_watch_task.cancel()
+    if archive_task:
+        archive_task.cancel()
+    await bar_scheduler.stop()
+    await tick_hub.stop()
+    await alert_engine.stop()
+    # Lo que quede en la cola diferida se escribe antes de cerrar Mongo
+    await write_behind.drain()
     try:
         await close_mongo_connection()
         if mt5_provider:
@@ -257,6 +297,31 @@ async def objectid_serialization_middleware(request: Request, call_next):
             }
         )
 
+# MIDDLEWARE de profiling: se registra al final para envolver a los demás
+# y medir también la serialización de la respuesta
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    """
+    Captura un perfil de stacks del request si lo pide el header de profiling
+    o si cae dentro de la tasa de muestreo configurada
+    """
+    request_profiler.in_flight += 1
+    try:
+        trigger = request_profiler.should_profile(request.url.path, request.headers)
+        if not trigger:
+            return await call_next(request)
+
+        with request_profiler.profile(request.method, request.url.path, trigger) as record:
+            response = await call_next(request)
+            if record is not None:
+                record.status_code = response.status_code
+    finally:
+        request_profiler.in_flight -= 1
+
+    if record is not None:
+        response.headers["X-Profile-Id"] = record.id
+    return response
+
 #  HANDLER PARA OPTIONS
 @app.options("/{full_path:path}")
 async def options_handler(full_path: str):
@@ -276,8 +341,11 @@ async def options_handler(full_path: str):
 app.include_router(auth_router, prefix="/api", tags=["authentication"])
 app.include_router(pairs_router, prefix="/api/pairs", tags=["pairs"])
 app.include_router(signals_router, prefix="/api/signals", tags=["signals"])
+app.include_router(alerts_router, prefix="/api/alerts", tags=["alerts"])
+app.include_router(performance_router, prefix="/api/performance", tags=["performance"])
 app.include_router(charts_router, prefix="/api/charts", tags=["charts", "visualization"])
 app.include_router(mt5_router, prefix="/api/mt5", tags=["metatrader5", "trading"])
+app.include_router(monitoring_router, prefix="/api/admin", tags=["admin", "monitoring"])
 
 # Servir archivos estáticos del frontend 
 try:
@@ -331,6 +399,14 @@ async def health_check():
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(
+        content=metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 #  MANEJO DE ERRORES GLOBALES
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -377,7 +453,9 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
-        log_level="info"
+        log_level="info",
+        # Compresión permessage-deflate negociada con cada cliente WebSocket
+        ws_per_message_deflate=settings.websocket_per_message_deflate,
     )
 
 # claves de la cuenta demo mt5 investor:LnAo_6Vk password: Q@Lr6zAo user: 95234648
\ No newline at end of file
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from config import settings
+from monitoring.metrics import EVENT_LOOP_LAG, LOOP_BLOCKS, LOOP_BLOCKED_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Raíz del backend: los frames fuera de aquí (stdlib, site-packages) no son culpables
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Frames del stack que se guardan en el evento (la atribución recorre el stack entero)
+MAX_STACK_DEPTH = 40
+# Frame del loop que ejecuta cada paso de una tarea: el siguiente es la coroutine de la tarea
+HANDLE_RUN_CODE = asyncio.events.Handle._run.__code__
+
+
+@dataclass
+class BlockEvent:
+    """Bloqueo del event loop detectado por el watchdog"""
+    detected_at: datetime
+    endpoint: str
+    culprit: str
+    stack: List[str] = field(default_factory=list)
+    duration_ms: float = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "detected_at": self.detected_at.isoformat(),
+            "endpoint": self.endpoint,
+            "culprit": self.culprit,
+            "duration_ms": round(self.duration_ms, 1),
+            "stack": self.stack,
+        }
+
+
+def _is_project_frame(filename: str) -> bool:
+    return filename.startswith(PROJECT_ROOT) and "site-packages" not in filename
+
+
+def _short_filename(filename: str) -> str:
+    if _is_project_frame(filename):
+        return os.path.relpath(filename, PROJECT_ROOT)
+    return os.path.basename(filename)
+
+
+def _function_label(frame) -> str:
+    """'funcion (archivo)' sin número de línea, para agrupar por función"""
+    return f"{frame.f_code.co_name} ({_short_filename(frame.f_code.co_filename)})"
+
+
+def _frame_label(frame) -> str:
+    return f"{frame.f_code.co_name} ({_short_filename(frame.f_code.co_filename)}:{frame.f_lineno})"
+
+
+def _background_task_name(frames) -> str:
+    """
+    Tarea en curso según el propio stack del hilo del loop: la coroutine
+    exterior es el frame que llama Handle._run. No se consulta asyncio desde
+    el hilo del watchdog.
+    """
+    for frame in frames:
+        if frame.f_back is not None and frame.f_back.f_code is HANDLE_RUN_CODE:
+            return f"background:{frame.f_code.co_qualname}"
+    return "unknown"
+
+
+class EventLoopWatchdog:
+    """
+    Mide el lag del event loop con un latido y, desde un hilo aparte, detecta
+    cuándo el latido se retrasa más del umbral. En ese momento captura el stack
+    del hilo del loop y atribuye el bloqueo al endpoint (o tarea de fondo) y a
+    la función del proyecto que lo está causando.
+    """
+
+    def __init__(self, interval_ms: float = 50.0, threshold_ms: float = 100.0, max_events: int = 200):
+        self.interval = interval_ms / 1000.0
+        self.threshold = threshold_ms / 1000.0
+        self.events: Deque[BlockEvent] = deque(maxlen=max_events)
+        self._endpoint_codes: Dict[object, str] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._pending: Optional[BlockEvent] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register_routes(self, routes):
+        """Indexa el código de cada endpoint para atribuir los bloqueos a su ruta"""
+        for route in routes:
+            endpoint = getattr(route, "endpoint", None)
+            code = getattr(endpoint, "__code__", None)
+            if code is None:
+                continue
+            methods = getattr(route, "methods", None)
+            verb = ",".join(sorted(methods)) if methods else "WS"
+            self._endpoint_codes[code] = f"{verb} {route.path}"
+
+    async def run(self):
+        """Latido del event loop; se lanza como tarea en el lifespan"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                expected = self._loop.time() + self.interval
+                self._last_beat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, self._loop.time() - expected)
+                self._last_beat = time.monotonic()
+                EVENT_LOOP_LAG.observe(lag)
+                self._close_episode(lag)
+        finally:
+            self._stop.set()
+
+    def _watch(self):
+        check_every = max(self.threshold / 2.0, 0.005)
+        while not self._stop.wait(check_every):
+            stalled = time.monotonic() - self._last_beat - self.interval
+            if stalled < self.threshold:
+                continue
+            with self._lock:
+                if self._pending is None:
+                    self._pending = self._capture()
+
+    def _capture(self) -> Optional[BlockEvent]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+
+        # Del frame más interno hacia afuera
+        endpoint = None
+        culprit = None
+        for f in frames:
+            if culprit is None and _is_project_frame(f.f_code.co_filename):
+                culprit = _function_label(f)
+            if endpoint is None:
+                endpoint = self._endpoint_codes.get(f.f_code)
+            if endpoint and culprit:
+                break
+
+        if endpoint is None:
+            endpoint = _background_task_name(frames)
+
+        return BlockEvent(
+            detected_at=datetime.utcnow(),
+            endpoint=endpoint,
+            culprit=culprit or _function_label(frames[0]),
+            stack=[_frame_label(f) for f in reversed(frames[:MAX_STACK_DEPTH])],
+        )
+
+    def _close_episode(self, lag: float):
+        with self._lock:
+            event, self._pending = self._pending, None
+        if event is None:
+            return
+        event.duration_ms = lag * 1000.0
+        self.events.append(event)
+        LOOP_BLOCKS.inc(endpoint=event.endpoint, culprit=event.culprit)
+        LOOP_BLOCKED_SECONDS.inc(lag, endpoint=event.endpoint, culprit=event.culprit)
+        logger.warning(
+            f"Event loop bloqueado {event.duration_ms:.0f} ms en {event.endpoint} por {event.culprit}"
+        )
+
+    def stop(self):
+        self._stop.set()
+
+    def culprit_summary(self) -> List[Dict]:
+        """Agrega los bloqueos recientes por (endpoint, culpable)"""
+        summary: Dict[tuple, Dict] = {}
+        for event in list(self.events):
+            key = (event.endpoint, event.culprit)
+            entry = summary.setdefault(key, {
+                "endpoint": event.endpoint,
+                "culprit": event.culprit,
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "last_stack": event.stack,
+            })
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + event.duration_ms, 1)
+            entry["max_ms"] = round(max(entry["max_ms"], event.duration_ms), 1)
+            entry["last_stack"] = event.stack
+        return sorted(summary.values(), key=lambda e: e["total_ms"], reverse=True)
+
+
+loop_watchdog = EventLoopWatchdog(
+    interval_ms=settings.loop_watchdog_interval_ms,
+    threshold_ms=settings.loop_watchdog_threshold_ms,
+    max_events=settings.loop_watchdog_max_events,
+)
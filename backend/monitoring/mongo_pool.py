@@ -0,0 +1,129 @@
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+from pymongo import monitoring
+
+from monitoring.metrics import registry
+
+POOL_CONNECTIONS = registry.gauge(
+    "trading_ai_mongo_pool_connections",
+    "Conexiones abiertas en el pool de Mongo por servidor",
+    ["address"],
+)
+POOL_IN_USE = registry.gauge(
+    "trading_ai_mongo_pool_in_use",
+    "Conexiones del pool de Mongo prestadas a una operación",
+    ["address"],
+)
+POOL_WAITING = registry.gauge(
+    "trading_ai_mongo_pool_waiting",
+    "Operaciones esperando una conexión libre del pool",
+    ["address"],
+)
+CHECKOUT_WAIT = registry.histogram(
+    "trading_ai_mongo_pool_checkout_seconds",
+    "Espera hasta obtener una conexión del pool de Mongo",
+    ["address"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+CHECKOUT_FAILED = registry.counter(
+    "trading_ai_mongo_pool_checkout_failed_total",
+    "Préstamos de conexión fallidos por motivo (timeout, pool cerrado, error)",
+    ["address", "reason"],
+)
+POOL_CLEARED = registry.counter(
+    "trading_ai_mongo_pool_cleared_total",
+    "Veces que el driver vació el pool (errores de red o de servidor)",
+    ["address"],
+)
+
+
+def _address(event) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    Eventos CMAP del driver hacia las métricas: tamaño del pool, conexiones
+    en uso, cola de espera y tiempo de checkout. Los eventos llegan desde los
+    hilos del driver; el checkout empieza y termina en el mismo hilo.
+    """
+
+    def __init__(self):
+        self._started = threading.local()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _checkout_started_at(self) -> Dict[Tuple[Any, ...], float]:
+        if not hasattr(self._started, "at"):
+            self._started.at = {}
+        return self._started.at
+
+    def _stat(self, address: str, field: str, delta: int) -> int:
+        with self._lock:
+            stats = self._stats.setdefault(address, {"connections": 0, "in_use": 0, "waiting": 0})
+            stats[field] = max(stats[field] + delta, 0)
+            return stats[field]
+
+    def _finish_wait(self, event) -> float:
+        started = self._checkout_started_at().pop(event.address, None)
+        POOL_WAITING.set(self._stat(_address(event), "waiting", -1), address=_address(event))
+        # pymongo >= 4.7 trae la duración en el evento
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            return duration
+        return time.perf_counter() - started if started is not None else 0.0
+
+    # Préstamos
+
+    def connection_check_out_started(self, event):
+        self._checkout_started_at()[event.address] = time.perf_counter()
+        POOL_WAITING.set(self._stat(_address(event), "waiting", 1), address=_address(event))
+
+    def connection_checked_out(self, event):
+        CHECKOUT_WAIT.observe(self._finish_wait(event), address=_address(event))
+        POOL_IN_USE.set(self._stat(_address(event), "in_use", 1), address=_address(event))
+
+    def connection_check_out_failed(self, event):
+        CHECKOUT_WAIT.observe(self._finish_wait(event), address=_address(event))
+        CHECKOUT_FAILED.inc(address=_address(event), reason=str(event.reason))
+
+    def connection_checked_in(self, event):
+        POOL_IN_USE.set(self._stat(_address(event), "in_use", -1), address=_address(event))
+
+    # Ciclo de vida de conexiones y pools
+
+    def connection_created(self, event):
+        POOL_CONNECTIONS.set(self._stat(_address(event), "connections", 1), address=_address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        POOL_CONNECTIONS.set(self._stat(_address(event), "connections", -1), address=_address(event))
+
+    def pool_created(self, event):
+        self._stat(_address(event), "connections", 0)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        POOL_CLEARED.inc(address=_address(event))
+
+    def pool_closed(self, event):
+        address = _address(event)
+        with self._lock:
+            self._stats.pop(address, None)
+        POOL_CONNECTIONS.set(0, address=address)
+        POOL_IN_USE.set(0, address=address)
+        POOL_WAITING.set(0, address=address)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {address: dict(stats) for address, stats in self._stats.items()}
+
+
+pool_listener = PoolMetricsListener()
@@ -0,0 +1,192 @@
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProfileRecord:
+    """Perfil de stacks capturado para un request"""
+    id: str
+    method: str
+    path: str
+    trigger: str  # "header" o "sampled"
+    started_at: datetime
+    duration_ms: float = 0.0
+    status_code: Optional[int] = None
+    samples: int = 0
+    # Muestras tomadas con otros requests en curso: sus stacks pueden ser de ellos
+    shared_samples: int = 0
+    stacks: Counter = field(default_factory=Counter)
+
+    def top_frames(self, limit: int = 5) -> List[Dict]:
+        """Funciones hoja con más muestras (tiempo propio)"""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = self.samples or 1
+        return [
+            {"frame": frame, "samples": count, "percent": round(100.0 * count / total, 1)}
+            for frame, count in leaves.most_common(limit)
+        ]
+
+    def collapsed(self) -> str:
+        """Stacks en formato colapsado (compatible con flamegraph.pl / speedscope)"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 2),
+            "status_code": self.status_code,
+            "samples": self.samples,
+            "shared_samples": self.shared_samples,
+            "top_frames": self.top_frames(),
+        }
+
+
+class StackSampler:
+    """
+    Muestrea periódicamente el stack de un hilo (el del event loop) desde un hilo
+    auxiliar. Así las llamadas síncronas (MT5, pandas, Mongo, serialización)
+    aparecen con su peso real sin instrumentar el código.
+
+    Limitación: se muestrea el hilo entero, no la tarea del request. Con otros
+    requests (o tareas de fondo) en curso, sus stacks se atribuyen al perfil;
+    shared_samples cuenta las muestras tomadas con más de un request en vuelo.
+    """
+
+    def __init__(self, thread_id: int, interval: float, in_flight: Optional[Callable[[], int]] = None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.in_flight = in_flight
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.shared_samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.stacks[collapse_stack(frame)] += 1
+            self.samples += 1
+            if self.in_flight is not None and self.in_flight() > 1:
+                self.shared_samples += 1
+
+
+def collapse_stack(frame) -> str:
+    """Convierte un frame en una línea 'raiz;...;hoja' para flame graphs"""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
+
+
+class RequestProfiler:
+    """Decide qué requests perfilar y guarda los perfiles recientes en memoria"""
+
+    def __init__(self,
+                 paths: List[str],
+                 header: str = "X-Profile",
+                 sample_rate: float = 0.0,
+                 interval_ms: float = 5.0,
+                 max_profiles: int = 50):
+        self.paths = tuple(paths)
+        self.header = header.lower()
+        self.sample_rate = sample_rate
+        self.interval = max(interval_ms, 1.0) / 1000.0
+        self.profiles: Deque[ProfileRecord] = deque(maxlen=max_profiles)
+        # Un único perfil a la vez: el sampler ve todo el hilo del event loop
+        self._active = threading.Lock()
+        # Requests HTTP en curso (lo mantiene el middleware) para marcar muestras compartidas
+        self.in_flight = 0
+
+    def should_profile(self, path: str, headers) -> Optional[str]:
+        """Devuelve el motivo del perfilado o None si el request no se perfila"""
+        if not path.startswith(self.paths):
+            return None
+        if headers.get(self.header, "").strip().lower() in {"1", "true", "yes"}:
+            return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    @contextmanager
+    def profile(self, method: str, path: str, trigger: str):
+        """Perfila el bloque; entrega None si ya hay otro perfil en curso"""
+        if not self._active.acquire(blocking=False):
+            yield None
+            return
+
+        record = ProfileRecord(
+            id=uuid.uuid4().hex[:12],
+            method=method,
+            path=path,
+            trigger=trigger,
+            started_at=datetime.utcnow(),
+        )
+        sampler = StackSampler(threading.get_ident(), self.interval, in_flight=lambda: self.in_flight)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            yield record
+        finally:
+            sampler.stop()
+            record.duration_ms = (time.perf_counter() - start) * 1000.0
+            record.stacks = sampler.stacks
+            record.samples = sampler.samples
+            record.shared_samples = sampler.shared_samples
+            self.profiles.append(record)
+            self._active.release()
+            logger.info(
+                f"Perfil {record.id} capturado para {method} {path}: "
+                f"{record.duration_ms:.1f} ms, {record.samples} muestras"
+            )
+
+    def list_profiles(self, path: Optional[str] = None) -> List[Dict]:
+        records = reversed(self.profiles)
+        return [r.summary() for r in records if not path or r.path.startswith(path)]
+
+    def get_profile(self, profile_id: str) -> Optional[ProfileRecord]:
+        for record in self.profiles:
+            if record.id == profile_id:
+                return record
+        return None
+
+
+request_profiler = RequestProfiler(
+    paths=settings.profiling_paths,
+    header=settings.profiling_header,
+    sample_rate=settings.profiling_sample_rate,
+    interval_ms=settings.profiling_interval_ms,
+    max_profiles=settings.profiling_max_profiles,
+)
@@ -6,6 +6,8 @@ from typing import List, Dict, Optional, Union
 import asyncio
 import logging
 
+from monitoring.metrics import mt5_call_timer
+
 class MT5DataProvider:
     def __init__(self):
         self.connected = False
@@ -15,7 +17,9 @@ class MT5DataProvider:
     def connect(self) -> bool:
         """Conectar a MetaTrader 5"""
         try:
-            if not mt5.initialize():
+            with mt5_call_timer("initialize"):
+                initialized = mt5.initialize()
+            if not initialized:
                 self.logger.error(f"MT5 initialization failed: {mt5.last_error()}")
                 return False
             
@@ -38,7 +42,8 @@ class MT5DataProvider:
     def _load_available_symbols(self):
         """Cargar símbolos disponibles"""
         try:
-            symbols = mt5.symbols_get()
+            with mt5_call_timer("symbols_get"):
+                symbols = mt5.symbols_get()
             if symbols:
                 self.available_symbols = [
                     {
@@ -158,7 +163,8 @@ class MT5DataProvider:
             self.logger.info(f"📤 Enviando orden: {request}")
 
 
-            result = mt5.order_send(request)
+            with mt5_call_timer("order_send"):
+                result = mt5.order_send(request)
             
             if result is None:
                 error_msg = f"MT5 order_send returned None. Last error: {mt5.last_error()}"
@@ -239,7 +245,8 @@ class MT5DataProvider:
             tf = tf_map.get(timeframe, mt5.TIMEFRAME_H1)
             
             # Obtener datos históricos
-            rates = mt5.copy_rates_from_pos(symbol, tf, 0, count)
+            with mt5_call_timer("copy_rates_from_pos"):
+                rates = mt5.copy_rates_from_pos(symbol, tf, 0, count)
             
             if rates is None or len(rates) == 0:
                 self.logger.warning(f"No se pudieron obtener datos para {symbol}")
@@ -265,7 +272,8 @@ class MT5DataProvider:
             return None
         
         try:
-            tick = mt5.symbol_info_tick(symbol)
+            with mt5_call_timer("symbol_info_tick"):
+                tick = mt5.symbol_info_tick(symbol)
             if tick is None:
                 return None
             
@@ -307,7 +315,8 @@ class MT5DataProvider:
             return None
         
         try:
-            info = mt5.symbol_info(symbol)
+            with mt5_call_timer("symbol_info"):
+                info = mt5.symbol_info(symbol)
             if info is None:
                 return None
             
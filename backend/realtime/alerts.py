@@ -0,0 +1,383 @@
+import asyncio
+import heapq
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import settings
+from monitoring.metrics import registry
+from realtime.subscriptions import ALERTS, SubscriptionRegistry
+from realtime.tick_hub import TickListener
+
+logger = logging.getLogger(__name__)
+
+# Suscriptor interno con el que el motor pide al hub los ticks de sus símbolos
+ALERTS_SUBSCRIBER = "__alerts__"
+
+PRICE_FIELDS = ("bid", "ask")
+
+# Espera antes de reintentar un lote que Mongo rechazó
+FLUSH_RETRY_SECONDS = 1.0
+DIRECTIONS = ("above", "below")
+
+ALERTS_ACTIVE = registry.gauge(
+    "trading_ai_alerts_active",
+    "Alertas activas en memoria por tipo",
+    ["alert_type"],
+)
+ALERTS_TRIGGERED = registry.counter(
+    "trading_ai_alerts_triggered_total",
+    "Alertas disparadas por tipo",
+    ["alert_type"],
+)
+ALERT_WRITE_BATCH = registry.histogram(
+    "trading_ai_alert_write_batch_size",
+    "Alertas marcadas como disparadas por cada bulk_write",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 1000),
+)
+
+NotifyFn = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+@dataclass
+class ActiveAlert:
+    id: str
+    user_id: str
+    symbol: str
+    alert_type: str
+    condition: Dict[str, Any]
+    message: str = ""
+    # Entrada vigente en el PriceBook: una alerta re-añadida deja muerta la anterior
+    order: int = 0
+
+
+def _live(entry: Tuple[float, int, str], alive: Dict[str, ActiveAlert]) -> bool:
+    alert = alive.get(entry[2])
+    return alert is not None and alert.order == entry[1]
+
+
+@dataclass
+class TriggeredAlert:
+    alert: ActiveAlert
+    value: Optional[float]
+    triggered_at: datetime = field(default_factory=datetime.utcnow)
+
+
+class PriceBook:
+    """
+    Umbrales de un (símbolo, campo de precio): un min-heap para "above" y un
+    max-heap para "below". Un tick sólo mira la cima de cada heap, así que
+    cuesta O(log n) por alerta disparada en lugar de recorrer todas.
+    Las alertas borradas se descartan de forma perezosa al llegar a la cima.
+    """
+
+    def __init__(self):
+        self.above: List[Tuple[float, int, str]] = []
+        self.below: List[Tuple[float, int, str]] = []
+        self.dead = 0
+
+    def __len__(self) -> int:
+        return len(self.above) + len(self.below) - self.dead
+
+    def add(self, alert_id: str, direction: str, threshold: float, order: int):
+        if direction == "above":
+            heapq.heappush(self.above, (threshold, order, alert_id))
+        else:
+            heapq.heappush(self.below, (-threshold, order, alert_id))
+
+    def crossed(self, price: float, alive: Dict[str, ActiveAlert]) -> List[str]:
+        """Saca de los heaps las alertas cuyo umbral cruzó el precio"""
+        hits = []
+        while self.above and self.above[0][0] <= price:
+            entry = heapq.heappop(self.above)
+            if _live(entry, alive):
+                hits.append(entry[2])
+            else:
+                self.dead -= 1
+        while self.below and -self.below[0][0] >= price:
+            entry = heapq.heappop(self.below)
+            if _live(entry, alive):
+                hits.append(entry[2])
+            else:
+                self.dead -= 1
+        return hits
+
+    def compact(self, alive: Dict[str, ActiveAlert]):
+        """Reconstruye los heaps cuando la mitad son alertas borradas"""
+        self.above = [entry for entry in self.above if _live(entry, alive)]
+        self.below = [entry for entry in self.below if _live(entry, alive)]
+        heapq.heapify(self.above)
+        heapq.heapify(self.below)
+        self.dead = 0
+
+
+def validate_condition(alert_type: str, condition: Dict[str, Any]) -> Dict[str, Any]:
+    """Normaliza la condición; ValueError si no es evaluable por el motor"""
+    if alert_type == "price":
+        direction = str(condition.get("direction", "")).lower()
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction debe ser uno de {DIRECTIONS}")
+        price_field = str(condition.get("field", "bid")).lower()
+        if price_field not in PRICE_FIELDS:
+            raise ValueError(f"field debe ser uno de {PRICE_FIELDS}")
+        try:
+            price = float(condition["price"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("price es obligatorio y numérico")
+        return {"direction": direction, "field": price_field, "price": price}
+
+    if alert_type == "signal":
+        normalized: Dict[str, Any] = {"min_confidence": float(condition.get("min_confidence", 0.0))}
+        if condition.get("signal_type"):
+            normalized["signal_type"] = str(condition["signal_type"]).upper()
+        if condition.get("timeframe"):
+            normalized["timeframe"] = str(condition["timeframe"]).upper()
+        return normalized
+
+    raise ValueError(f"Tipo de alerta no soportado por el motor: {alert_type}")
+
+
+class AlertEngine(TickListener):
+    """
+    Motor de alertas en memoria. Las de precio viven en un PriceBook por
+    (símbolo, campo) y se evalúan con cada tick del hub; las de señal se
+    evalúan al crearse cada señal del usuario. Las disparadas se marcan en
+    Mongo por lotes desde una tarea en segundo plano (y al ritmo de push del
+    hub) y se notifican por WebSocket.
+    """
+
+    def __init__(self,
+                 subscriptions: SubscriptionRegistry,
+                 get_db: Callable[[], Any],
+                 notify: NotifyFn,
+                 max_per_user: int = 200):
+        self.subscriptions = subscriptions
+        self.get_db = get_db
+        self.notify = notify
+        self.max_per_user = max_per_user
+        self._alerts: Dict[str, ActiveAlert] = {}
+        self._per_user: Dict[str, int] = {}
+        self._books: Dict[Tuple[str, str], PriceBook] = {}
+        self._price_count: Dict[str, int] = {}
+        self._signal_alerts: Dict[Tuple[str, str], Dict[str, ActiveAlert]] = {}
+        self._pending: List[TriggeredAlert] = []
+        self._order = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self):
+        """Carga las alertas activas de Mongo (una pasada con proyección mínima)"""
+        db = self.get_db()
+        cursor = db.alerts.find(
+            {"is_triggered": False, "alert_type": {"$in": ["price", "signal"]}},
+            {"user_id": 1, "symbol": 1, "alert_type": 1, "condition": 1, "message": 1},
+        ).batch_size(5000)
+        loaded = 0
+        async for doc in cursor:
+            try:
+                self.add(doc)
+                loaded += 1
+            except ValueError as e:
+                logger.warning(f"Alerta {doc.get('_id')} ignorada: {e}")
+        logger.info(f"Motor de alertas: {loaded} alertas activas cargadas")
+
+    def add(self, doc: Dict[str, Any]) -> ActiveAlert:
+        alert = ActiveAlert(
+            id=str(doc["_id"]),
+            user_id=str(doc["user_id"]),
+            symbol=str(doc["symbol"]).upper(),
+            alert_type=doc["alert_type"],
+            condition=validate_condition(doc["alert_type"], doc.get("condition") or {}),
+            message=doc.get("message", ""),
+        )
+        if alert.id in self._alerts:
+            self.remove(alert.id)
+        self._alerts[alert.id] = alert
+        self._per_user[alert.user_id] = self._per_user.get(alert.user_id, 0) + 1
+
+        if alert.alert_type == "price":
+            book = self._books.setdefault((alert.symbol, alert.condition["field"]), PriceBook())
+            self._order += 1
+            alert.order = self._order
+            book.add(alert.id, alert.condition["direction"], alert.condition["price"], alert.order)
+            self._price_count[alert.symbol] = self._price_count.get(alert.symbol, 0) + 1
+            if self._price_count[alert.symbol] == 1:
+                self.subscriptions.subscribe(ALERTS_SUBSCRIBER, alert.symbol, ALERTS)
+        else:
+            self._signal_alerts.setdefault((alert.user_id, alert.symbol), {})[alert.id] = alert
+
+        self._update_gauges()
+        return alert
+
+    def remove(self, alert_id: str, popped: bool = False) -> Optional[ActiveAlert]:
+        """Quita la alerta del índice; `popped` si ya salió del heap al dispararse"""
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        remaining = self._per_user.get(alert.user_id, 1) - 1
+        if remaining > 0:
+            self._per_user[alert.user_id] = remaining
+        else:
+            self._per_user.pop(alert.user_id, None)
+
+        if alert.alert_type == "price":
+            book = self._books.get((alert.symbol, alert.condition["field"]))
+            if book is not None:
+                if not popped:
+                    book.dead += 1
+                if len(book) == 0:
+                    del self._books[(alert.symbol, alert.condition["field"])]
+                elif book.dead * 2 > len(book.above) + len(book.below):
+                    book.compact(self._alerts)
+            self._release_symbol(alert.symbol)
+        else:
+            user_alerts = self._signal_alerts.get((alert.user_id, alert.symbol), {})
+            user_alerts.pop(alert_id, None)
+            if not user_alerts:
+                self._signal_alerts.pop((alert.user_id, alert.symbol), None)
+
+        self._update_gauges()
+        return alert
+
+    def _release_symbol(self, symbol: str):
+        remaining = self._price_count.get(symbol, 0) - 1
+        if remaining > 0:
+            self._price_count[symbol] = remaining
+            return
+        self._price_count.pop(symbol, None)
+        self.subscriptions.unsubscribe(ALERTS_SUBSCRIBER, symbol, ALERTS)
+
+    # Evaluación
+
+    def on_tick(self, symbol: str, tick: Dict):
+        for price_field in PRICE_FIELDS:
+            book = self._books.get((symbol, price_field))
+            price = tick.get(price_field)
+            if book is None or not price:
+                continue
+            for alert_id in book.crossed(price, self._alerts):
+                self._trigger(alert_id, price, popped=True)
+
+    def on_signal(self, user_id: str, signal: Dict[str, Any]):
+        """Evalúa las alertas de señal del usuario para el símbolo de la señal"""
+        symbol = str(signal.get("symbol", "")).upper()
+        for alert in list(self._signal_alerts.get((str(user_id), symbol), {}).values()):
+            condition = alert.condition
+            if float(signal.get("confluence_score") or 0.0) < condition["min_confidence"]:
+                continue
+            if condition.get("signal_type") and str(signal.get("signal_type", "")).upper() != condition["signal_type"]:
+                continue
+            if condition.get("timeframe") and str(signal.get("timeframe", "")).upper() != condition["timeframe"]:
+                continue
+            self._trigger(alert.id, signal.get("entry_price"))
+
+    def _trigger(self, alert_id: str, value: Optional[float], popped: bool = False):
+        alert = self.remove(alert_id, popped)
+        if alert is None:
+            return
+        self._pending.append(TriggeredAlert(alert=alert, value=value))
+        ALERTS_TRIGGERED.inc(alert_type=alert.alert_type)
+        self.start()
+
+    def start(self):
+        """Flush en segundo plano: quien dispara (un tick, una señal nueva) no espera a Mongo"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while self._pending:
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error en el flush de alertas: {e}")
+            if self._pending:
+                await asyncio.sleep(FLUSH_RETRY_SECONDS)
+
+    async def stop(self):
+        """Al cerrar la aplicación: para el flusher y escribe lo pendiente"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """
+        Marca en Mongo el lote de alertas disparadas y notifica a sus usuarios.
+        Sólo se notifica lo que quedó escrito: si Mongo falla el lote vuelve a
+        la cola, así una alerta no se notifica y se vuelve a disparar al reiniciar.
+        """
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+
+        operations = [
+            UpdateOne(
+                {"_id": ObjectId(item.alert.id), "is_triggered": False},
+                {"$set": {"is_triggered": True, "triggered_at": item.triggered_at, "triggered_value": item.value}},
+            )
+            for item in batch
+        ]
+        try:
+            await self.get_db().alerts.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Errores por documento (no transitorios): esas alertas se descartan sin notificar
+            failed = {error["index"] for error in e.details.get("writeErrors") or []}
+            if failed:
+                logger.error(f"{len(failed)} alertas disparadas no se pudieron marcar: {e.details['writeErrors'][0].get('errmsg')}")
+            batch = [item for index, item in enumerate(batch) if index not in failed]
+        except Exception as e:
+            logger.error(f"Error marcando {len(operations)} alertas disparadas, se reintentan: {e}")
+            self._pending = batch + self._pending
+            return
+        ALERT_WRITE_BATCH.observe(len(operations))
+
+        for item in batch:
+            try:
+                await self.notify(item.alert.user_id, {
+                    "type": "alert_triggered",
+                    "alert_id": item.alert.id,
+                    "symbol": item.alert.symbol,
+                    "alert_type": item.alert.alert_type,
+                    "condition": item.alert.condition,
+                    "message": item.alert.message,
+                    "value": item.value,
+                    "triggered_at": item.triggered_at.isoformat(),
+                })
+            except Exception as e:
+                logger.error(f"Error notificando alerta {item.alert.id}: {e}")
+
+    def count_for_user(self, user_id: str) -> int:
+        return self._per_user.get(str(user_id), 0)
+
+    def _update_gauges(self):
+        price = sum(self._price_count.values())
+        ALERTS_ACTIVE.set(price, alert_type="price")
+        ALERTS_ACTIVE.set(len(self._alerts) - price, alert_type="signal")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": len(self._alerts),
+            "price_symbols": len(self._price_count),
+            "books": {f"{symbol}:{price_field}": len(book) for (symbol, price_field), book in self._books.items()},
+            "pending": len(self._pending),
+        }
+
+
+def create_alert_engine(subscriptions: SubscriptionRegistry,
+                        get_db: Callable[[], Any],
+                        notify: NotifyFn) -> AlertEngine:
+    """Motor configurado desde settings"""
+    return AlertEngine(
+        subscriptions,
+        get_db=get_db,
+        notify=notify,
+        max_per_user=settings.max_alerts_per_user,
+    )
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import pandas as pd
+
+from config import settings
+from monitoring.metrics import registry, stage_timer
+from realtime.subscriptions import SubscriptionKey, SubscriptionListener, SubscriptionRegistry
+
+logger = logging.getLogger(__name__)
+
+TIMEFRAME_SECONDS = {
+    "M1": 60,
+    "M5": 5 * 60,
+    "M15": 15 * 60,
+    "M30": 30 * 60,
+    "H1": 60 * 60,
+    "H4": 4 * 60 * 60,
+    "D1": 24 * 60 * 60,
+    "W1": 7 * 24 * 60 * 60,
+}
+
+# Los lunes 00:00 UTC caen en múltiplos de 7 días desde 1970-01-05
+_WEEK_ANCHOR = 4 * 24 * 60 * 60
+
+BAR_CLOSE_RUNS = registry.counter(
+    "trading_ai_bar_close_runs_total",
+    "Ejecuciones del scheduler de cierre de vela por resultado",
+    ["timeframe", "result"],
+)
+BAR_CLOSE_FANOUT = registry.histogram(
+    "trading_ai_bar_close_fanout_users",
+    "Usuarios que reciben cada análisis compartido",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250),
+)
+
+FetchFn = Callable[[str, str], Awaitable[Optional[pd.DataFrame]]]
+AnalyzeFn = Callable[[str, pd.DataFrame, str], Awaitable[Any]]
+DeliverFn = Callable[[str, Any], Awaitable[None]]
+
+
+def next_bar_close(timeframe: str, now: float, utc_offset_hours: float = 0.0) -> float:
+    """Próximo cierre de vela (epoch) alineado al reloj del servidor del broker"""
+    period = TIMEFRAME_SECONDS.get(timeframe, TIMEFRAME_SECONDS["H1"])
+    offset = utc_offset_hours * 3600.0
+    anchor = _WEEK_ANCHOR if timeframe == "W1" else 0
+    shifted = now + offset - anchor
+    return (shifted // period + 1) * period - offset + anchor
+
+
+class BarCloseScheduler(SubscriptionListener):
+    """
+    Scheduler central de análisis. Deduplica las suscripciones (símbolo,
+    timeframe) de todos los usuarios, analiza cada clave una sola vez al
+    cerrar la vela y reparte el resultado compartido a los suscriptores,
+    que sólo aplican su configuración en la etapa de puntuación.
+    """
+
+    def __init__(self,
+                 subscriptions: SubscriptionRegistry,
+                 fetch: FetchFn,
+                 analyze: AnalyzeFn,
+                 deliver: DeliverFn,
+                 grace_seconds: float = 2.0,
+                 retry_seconds: float = 5.0,
+                 max_retries: int = 6,
+                 utc_offset_hours: float = 0.0,
+                 max_concurrent: int = 10):
+        self.subscriptions = subscriptions
+        self.fetch = fetch
+        self.analyze = analyze
+        self.deliver = deliver
+        self.grace_seconds = grace_seconds
+        self.retry_seconds = retry_seconds
+        self.max_retries = max_retries
+        self.utc_offset_hours = utc_offset_hours
+        self._due: Dict[SubscriptionKey, float] = {}
+        self._retries: Dict[SubscriptionKey, int] = {}
+        self._last_bar: Dict[SubscriptionKey, Any] = {}
+        self._last_shared: Dict[SubscriptionKey, Any] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running: Dict[SubscriptionKey, asyncio.Task] = {}
+        subscriptions.add_listener(self)
+
+    # Eventos del registro de suscripciones
+
+    def on_key_added(self, key: SubscriptionKey):
+        if key[1] not in TIMEFRAME_SECONDS:
+            return
+        # Clave nueva: primer análisis inmediato, luego en cada cierre de vela
+        self._due[key] = time.time()
+        self._wakeup.set()
+        self.start()
+
+    def on_subscriber_added(self, key: SubscriptionKey, user_id: str):
+        # Clave ya activa: el nuevo suscriptor recibe el último análisis sin recalcular
+        if key in self._last_shared:
+            asyncio.create_task(self._deliver_one(user_id, self._last_shared[key]))
+
+    def on_key_removed(self, key: SubscriptionKey):
+        self._due.pop(key, None)
+        self._retries.pop(key, None)
+        self._last_bar.pop(key, None)
+        self._last_shared.pop(key, None)
+
+    # Ciclo principal
+
+    def start(self):
+        """Arranca el scheduler si no está corriendo (idempotente)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        for task in list(self._running.values()):
+            task.cancel()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _next_due(self, timeframe: str, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        return next_bar_close(timeframe, now, self.utc_offset_hours) + self.grace_seconds
+
+    async def run(self):
+        logger.info("Scheduler de cierre de vela iniciado")
+        while True:
+            self._wakeup.clear()
+            if not self._due:
+                await self._wakeup.wait()
+                continue
+
+            now = time.time()
+            wait = min(self._due.values()) - now
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            for key in [key for key, at in self._due.items() if at <= now]:
+                # Se reprograma antes de lanzar para no disparar dos veces la misma vela
+                self._due[key] = self._next_due(key[1], now)
+                if key in self._running:
+                    continue
+                task = asyncio.create_task(self._run_key(key))
+                self._running[key] = task
+                task.add_done_callback(lambda _t, key=key: self._running.pop(key, None))
+
+    async def _run_key(self, key: SubscriptionKey):
+        symbol, timeframe = key
+        async with self._semaphore:
+            try:
+                with stage_timer("data_fetch"):
+                    df = await self.fetch(symbol, timeframe)
+                if df is None or len(df) < 2:
+                    BAR_CLOSE_RUNS.inc(timeframe=timeframe, result="no_data")
+                    return
+
+                # La última fila es la vela que se está formando: si no cambió,
+                # el broker aún no abrió la nueva vela y se reintenta en breve
+                forming_bar = df.index[-1]
+                if self._last_bar.get(key) == forming_bar:
+                    self._schedule_retry(key)
+                    BAR_CLOSE_RUNS.inc(timeframe=timeframe, result="unchanged")
+                    return
+                self._last_bar[key] = forming_bar
+                self._retries.pop(key, None)
+
+                shared = await self.analyze(symbol, df.iloc[:-1], timeframe)
+                self._last_shared[key] = shared
+                users = list(self.subscriptions.subscribers(key))
+                BAR_CLOSE_FANOUT.observe(len(users))
+                BAR_CLOSE_RUNS.inc(timeframe=timeframe, result="analyzed")
+            except Exception as e:
+                BAR_CLOSE_RUNS.inc(timeframe=timeframe, result="error")
+                logger.error(f"Error en análisis de cierre de vela {symbol} {timeframe}: {e}", exc_info=True)
+                return
+
+        await asyncio.gather(*(self._deliver_one(user_id, shared) for user_id in users))
+
+    async def _deliver_one(self, user_id: str, shared: Any):
+        try:
+            await self.deliver(user_id, shared)
+        except Exception as e:
+            logger.error(f"Error entregando análisis a {user_id}: {e}")
+
+    def _schedule_retry(self, key: SubscriptionKey):
+        retries = self._retries.get(key, 0)
+        if retries >= self.max_retries or key not in self._due:
+            self._retries.pop(key, None)
+            return
+        self._retries[key] = retries + 1
+        self._due[key] = min(self._due[key], time.time() + self.retry_seconds)
+        self._wakeup.set()
+
+
+def create_bar_scheduler(subscriptions: SubscriptionRegistry,
+                         fetch: FetchFn,
+                         analyze: AnalyzeFn,
+                         deliver: DeliverFn) -> BarCloseScheduler:
+    """Scheduler configurado desde settings"""
+    return BarCloseScheduler(
+        subscriptions=subscriptions,
+        fetch=fetch,
+        analyze=analyze,
+        deliver=deliver,
+        grace_seconds=settings.bar_close_grace_seconds,
+        retry_seconds=settings.bar_close_retry_seconds,
+        max_retries=settings.bar_close_max_retries,
+        utc_offset_hours=settings.mt5_server_utc_offset_hours,
+        max_concurrent=settings.max_concurrent_analysis,
+    )
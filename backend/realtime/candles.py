@@ -0,0 +1,290 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from config import settings
+from monitoring.metrics import registry
+from realtime.bar_scheduler import TIMEFRAME_SECONDS
+from realtime.subscriptions import (
+    SubscriptionKey, SubscriptionListener, SubscriptionRegistry, candles_timeframe, split_candles_timeframe,
+)
+from realtime.tick_hub import TickListener
+
+logger = logging.getLogger(__name__)
+
+# Todos los timeframes se construyen a la vez desde el mismo flujo de ticks
+CANDLE_TIMEFRAMES = ("M1", "M5", "M15", "M30", "H1", "H4", "D1")
+
+CANDLES_CLOSED = registry.counter(
+    "trading_ai_live_candles_closed_total",
+    "Velas cerradas por el constructor de velas en vivo",
+    ["timeframe"],
+)
+CANDLE_MESSAGES = registry.counter(
+    "trading_ai_live_candle_messages_total",
+    "Mensajes de vela enviados a clientes",
+)
+
+HistoryFn = Callable[[str, str, int], Awaitable[Optional[pd.DataFrame]]]
+# (payload, usuarios, clave de conflación): el mismo payload se codifica una vez para todos
+SendFn = Callable[[Dict, Iterable[str], Optional[str]], Awaitable[None]]
+# (símbolo, timeframe, velas cerradas) hacia el almacén de series temporales
+PersistFn = Callable[[str, str, List["Candle"]], Awaitable[int]]
+
+
+def bar_open_time(timeframe: str, epoch: float) -> int:
+    """Apertura (epoch del servidor) de la vela que contiene el instante dado"""
+    period = TIMEFRAME_SECONDS[timeframe]
+    return int(epoch // period * period)
+
+
+@dataclass
+class Candle:
+    time: int
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float = 0.0
+
+    @classmethod
+    def from_price(cls, time: int, price: float) -> "Candle":
+        return cls(time=time, open=price, high=price, low=price, close=price, volume=1.0)
+
+    def update(self, price: float):
+        self.high = max(self.high, price)
+        self.low = min(self.low, price)
+        self.close = price
+        self.volume += 1.0
+
+    def as_list(self) -> List:
+        """[t_ms, o, h, l, c, v] para los mensajes"""
+        return [self.time * 1000, self.open, self.high, self.low, self.close, self.volume]
+
+
+def candles_from_dataframe(df: pd.DataFrame) -> List[Candle]:
+    """Velas de MT5 (Open/High/Low/Close/Volume indexadas por tiempo) a Candle"""
+    return [
+        Candle(
+            time=int(index.timestamp()),
+            open=float(row.Open),
+            high=float(row.High),
+            low=float(row.Low),
+            close=float(row.Close),
+            volume=float(row.Volume),
+        )
+        for index, row in zip(df.index, df.itertuples(index=False))
+    ]
+
+
+class CandleHistory:
+    """Velas cerradas por (símbolo, timeframe) en memoria, acotadas a max_bars"""
+
+    def __init__(self, max_bars: int = 500):
+        self.max_bars = max_bars
+        self._bars: Dict[Tuple[str, str], Deque[Candle]] = {}
+
+    def seed(self, symbol: str, timeframe: str, candles: List[Candle]):
+        self._bars[(symbol, timeframe)] = deque(candles[-self.max_bars:], maxlen=self.max_bars)
+
+    def append(self, symbol: str, timeframe: str, candle: Candle):
+        bars = self._bars.setdefault((symbol, timeframe), deque(maxlen=self.max_bars))
+        if bars and bars[-1].time >= candle.time:
+            # La vela ya estaba (sembrada desde MT5 tras cerrar): se reemplaza
+            if bars[-1].time == candle.time:
+                bars[-1] = candle
+            return
+        bars.append(candle)
+
+    def get(self, symbol: str, timeframe: str, count: Optional[int] = None) -> List[Candle]:
+        bars = list(self._bars.get((symbol, timeframe), ()))
+        return bars[-count:] if count else bars
+
+    def drop(self, symbol: str):
+        for key in [key for key in self._bars if key[0] == symbol]:
+            del self._bars[key]
+
+
+def merge_candle_messages(pending: Dict, new: Dict) -> Dict:
+    """Fusiona dos actualizaciones pendientes sin perder las velas cerradas del primero"""
+    closed = pending.get("closed", []) + new.get("closed", [])
+    return {**new, "closed": closed} if closed else new
+
+
+class LiveCandleBuilder(SubscriptionListener, TickListener):
+    """
+    Construye la vela en formación de cada timeframe desde los ticks del hub.
+    Al suscribirse un cliente recibe el histórico y después sólo la última
+    vela actualizada; cada vela cerrada se guarda en el histórico local.
+    """
+
+    def __init__(self,
+                 subscriptions: SubscriptionRegistry,
+                 fetch_history: HistoryFn,
+                 send: SendFn,
+                 timeframes: Tuple[str, ...] = CANDLE_TIMEFRAMES,
+                 history_bars: int = 500,
+                 snapshot_bars: int = 100,
+                 persist: Optional[PersistFn] = None):
+        self.subscriptions = subscriptions
+        self.fetch_history = fetch_history
+        self.send = send
+        self.persist = persist
+        self.timeframes = timeframes
+        self.snapshot_bars = snapshot_bars
+        self.history = CandleHistory(history_bars)
+        self._forming: Dict[str, Dict[str, Candle]] = {}
+        self._closed: Dict[Tuple[str, str], List[Candle]] = {}
+        self._dirty: Set[Tuple[str, str]] = set()
+        self._seeding: Dict[str, asyncio.Task] = {}
+        subscriptions.add_listener(self)
+
+    # Eventos del registro de suscripciones
+
+    def on_key_added(self, key: SubscriptionKey):
+        symbol = key[0]
+        if split_candles_timeframe(key[1]) is None:
+            return
+        if symbol not in self._forming and symbol not in self._seeding:
+            task = asyncio.create_task(self._seed(symbol))
+            self._seeding[symbol] = task
+            task.add_done_callback(lambda _t, symbol=symbol: self._seeding.pop(symbol, None))
+
+    def on_subscriber_added(self, key: SubscriptionKey, user_id: str):
+        timeframe = split_candles_timeframe(key[1])
+        # Si el símbolo todavía se está sembrando, el snapshot sale al terminar
+        if timeframe is not None and key[0] in self._forming:
+            asyncio.create_task(self._send_snapshot([user_id], key[0], timeframe))
+
+    def on_key_removed(self, key: SubscriptionKey):
+        symbol = key[0]
+        if split_candles_timeframe(key[1]) is None or self._candle_keys(symbol):
+            return
+        task = self._seeding.pop(symbol, None)
+        if task:
+            task.cancel()
+        self._forming.pop(symbol, None)
+        self.history.drop(symbol)
+        for pending in [pending for pending in self._dirty if pending[0] == symbol]:
+            self._dirty.discard(pending)
+            self._closed.pop(pending, None)
+
+    def _candle_keys(self, symbol: str) -> List[SubscriptionKey]:
+        return [
+            key for key in self.subscriptions.keys()
+            if key[0] == symbol and split_candles_timeframe(key[1]) is not None
+        ]
+
+    async def _seed(self, symbol: str):
+        """Histórico inicial de MT5: velas cerradas y la que se está formando"""
+        forming: Dict[str, Candle] = {}
+        for timeframe in self.timeframes:
+            try:
+                df = await self.fetch_history(symbol, timeframe, self.history.max_bars + 1)
+            except Exception as e:
+                logger.error(f"Error sembrando velas {symbol} {timeframe}: {e}")
+                df = None
+            if df is None or df.empty:
+                continue
+            candles = candles_from_dataframe(df)
+            self.history.seed(symbol, timeframe, candles[:-1])
+            forming[timeframe] = candles[-1]
+            # El almacén sólo guarda las posteriores a su última vela
+            await self._persist(symbol, timeframe, candles[:-1])
+
+        if not self._candle_keys(symbol):
+            return
+        # Sin histórico de algún timeframe, su primera vela sale del próximo tick
+        self._forming[symbol] = forming
+        await asyncio.gather(*(
+            self._send_snapshot(self.subscriptions.subscribers(key), symbol, split_candles_timeframe(key[1]))
+            for key in self._candle_keys(symbol)
+        ))
+
+    async def _send_snapshot(self, user_ids: Iterable[str], symbol: str, timeframe: str):
+        candles = self.history.get(symbol, timeframe, self.snapshot_bars)
+        current = self._forming.get(symbol, {}).get(timeframe)
+        if current is not None:
+            candles = candles + [current]
+        payload = {
+            "type": "candles",
+            "symbol": symbol,
+            "timeframe": timeframe,
+            "candles": [candle.as_list() for candle in candles],
+        }
+        try:
+            await self.send(payload, user_ids, None)
+        except Exception as e:
+            logger.error(f"Error enviando velas de {symbol} {timeframe}: {e}")
+
+    async def _persist(self, symbol: str, timeframe: str, candles: List[Candle]):
+        if self.persist is None or not candles:
+            return
+        try:
+            await self.persist(symbol, timeframe, candles)
+        except Exception as e:
+            logger.error(f"Error guardando velas de {symbol} {timeframe}: {e}")
+
+    # Ticks del hub
+
+    def on_tick(self, symbol: str, tick: Dict):
+        forming = self._forming.get(symbol)
+        price = tick.get("bid")
+        tick_time = tick.get("time")
+        if forming is None or not price or tick_time is None:
+            return
+        epoch = tick_time.timestamp() if hasattr(tick_time, "timestamp") else float(tick_time)
+
+        for timeframe in self.timeframes:
+            opened = bar_open_time(timeframe, epoch)
+            candle = forming.get(timeframe)
+            if candle is None or opened > candle.time:
+                if candle is not None:
+                    self.history.append(symbol, timeframe, candle)
+                    self._closed.setdefault((symbol, timeframe), []).append(candle)
+                    CANDLES_CLOSED.inc(timeframe=timeframe)
+                forming[timeframe] = Candle.from_price(opened, price)
+            elif opened == candle.time:
+                candle.update(price)
+            else:
+                continue
+            self._dirty.add((symbol, timeframe))
+
+    async def flush(self):
+        """Envía la última vela de cada (símbolo, timeframe) que cambió a sus suscriptores"""
+        dirty, self._dirty = self._dirty, set()
+        sent = 0
+        for symbol, timeframe in dirty:
+            closed = self._closed.pop((symbol, timeframe), [])
+            await self._persist(symbol, timeframe, closed)
+            users = self.subscriptions.subscribers((symbol, candles_timeframe(timeframe)))
+            candle = self._forming.get(symbol, {}).get(timeframe)
+            if not users or candle is None:
+                continue
+            payload = {"type": "candle", "symbol": symbol, "timeframe": timeframe, "c": candle.as_list()}
+            if closed:
+                payload["closed"] = [bar.as_list() for bar in closed]
+            await self.send(payload, users, f"candle:{symbol}:{timeframe}")
+            sent += len(users)
+
+        if sent:
+            CANDLE_MESSAGES.inc(sent)
+
+
+def create_candle_builder(subscriptions: SubscriptionRegistry,
+                          fetch_history: HistoryFn,
+                          send: SendFn,
+                          persist: Optional[PersistFn] = None) -> LiveCandleBuilder:
+    """Constructor de velas configurado desde settings"""
+    return LiveCandleBuilder(
+        subscriptions=subscriptions,
+        fetch_history=fetch_history,
+        send=send,
+        history_bars=settings.live_candle_history_bars,
+        snapshot_bars=settings.live_candle_snapshot_bars,
+        persist=persist,
+    )
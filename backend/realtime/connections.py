@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+from config import settings
+from monitoring.metrics import registry
+from realtime.protocol import CODECS, JSON_CODEC, SSE, SSE_CODEC, Codec, EncodingCache, Frame, Payload, negotiate
+
+logger = logging.getLogger(__name__)
+
+WS_CONNECTIONS = registry.gauge(
+    "trading_ai_ws_connections",
+    "Conexiones WebSocket abiertas por protocolo",
+    ["protocol"],
+)
+WS_QUEUE_DEPTH = registry.gauge(
+    "trading_ai_ws_queue_depth",
+    "Mensajes pendientes en todas las colas de envío",
+)
+WS_QUEUE_DEPTH_ON_ENQUEUE = registry.histogram(
+    "trading_ai_ws_queue_depth_on_enqueue",
+    "Profundidad de la cola de la conexión al encolar cada mensaje",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500),
+)
+WS_MESSAGES_SENT = registry.counter(
+    "trading_ai_ws_messages_sent_total",
+    "Mensajes entregados a clientes WebSocket",
+)
+WS_MESSAGES_DROPPED = registry.counter(
+    "trading_ai_ws_messages_dropped_total",
+    "Mensajes descartados por cola llena, conflación o conexión cerrada",
+    ["reason"],
+)
+WS_SEND_DURATION = registry.histogram(
+    "trading_ai_ws_send_duration_seconds",
+    "Duración de cada envío por conexión",
+)
+WS_BYTES_SENT = registry.counter(
+    "trading_ai_ws_bytes_sent_total",
+    "Bytes de payload enviados a clientes WebSocket (antes de permessage-deflate)",
+    ["protocol"],
+)
+
+# Fusiona dos payloads conflados; no debe modificar sus argumentos
+MergeFn = Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+
+
+class ClientConnection:
+    """
+    Socket de un cliente con su cola de envío acotada y su propia tarea
+    escritora: un cliente lento sólo llena su cola, no frena a los demás.
+    """
+
+    def __init__(self,
+                 websocket: WebSocket,
+                 user_id: str,
+                 max_queue: int,
+                 send_timeout: float,
+                 codec: Codec = JSON_CODEC):
+        self.id = uuid.uuid4().hex[:12]
+        self.websocket = websocket
+        self.user_id = user_id
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.codec = codec
+        # (clave de conflación o None, frame; None si está en _conflated)
+        self._queue: Deque[Tuple[Optional[str], Optional[Frame]]] = deque()
+        # clave -> (payload, frame ya codificado o None si hubo fusión)
+        self._conflated: Dict[str, Tuple[Dict[str, Any], Optional[Frame]]] = {}
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self.closed = False
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def start(self, on_failure: Callable[["ClientConnection"], None]):
+        self._writer = asyncio.create_task(self._write_loop(on_failure))
+
+    def enqueue(self, message: EncodingCache, conflate_key: Optional[str] = None, merge: Optional[MergeFn] = None):
+        """
+        Encola sin bloquear. Con `conflate_key` el mensaje reemplaza (o se fusiona
+        con `merge`) al pendiente de la misma clave; si la cola está llena se
+        descarta el más antiguo.
+        """
+        if self.closed:
+            WS_MESSAGES_DROPPED.inc(reason="closed")
+            return
+
+        if conflate_key is not None and conflate_key in self._conflated:
+            pending, _ = self._conflated[conflate_key]
+            if merge:
+                self._conflated[conflate_key] = (merge(pending, message.payload), None)
+            else:
+                self._conflated[conflate_key] = (message.payload, message.frame(self.codec))
+            WS_MESSAGES_DROPPED.inc(reason="conflated")
+            return
+
+        WS_QUEUE_DEPTH_ON_ENQUEUE.observe(len(self._queue))
+        if len(self._queue) >= self.max_queue:
+            self._drop_oldest()
+            WS_MESSAGES_DROPPED.inc(reason="overflow")
+        else:
+            WS_QUEUE_DEPTH.inc()
+
+        if conflate_key is not None:
+            self._conflated[conflate_key] = (message.payload, message.frame(self.codec))
+            self._queue.append((conflate_key, None))
+        else:
+            self._queue.append((None, message.frame(self.codec)))
+        self._ready.set()
+
+    def _drop_oldest(self):
+        # Los slots conflados llevan el valor más reciente: se descarta el
+        # mensaje normal más antiguo y sólo si no hay ninguno, el slot más viejo
+        for index, (key, _) in enumerate(self._queue):
+            if key is None:
+                del self._queue[index]
+                return
+        old_key, _ = self._queue.popleft()
+        self._conflated.pop(old_key, None)
+
+    def _next(self) -> Optional[Frame]:
+        key, frame = self._queue.popleft()
+        WS_QUEUE_DEPTH.dec()
+        if key is not None:
+            pending = self._conflated.pop(key, None)
+            if pending is None:
+                return None
+            payload, frame = pending
+            if frame is None:
+                frame = self.codec.encode(payload)
+        return frame
+
+    async def _write_loop(self, on_failure: Callable[["ClientConnection"], None]):
+        try:
+            while not self.closed:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                frame = self._next()
+                if frame is None:
+                    continue
+                if isinstance(frame, bytes):
+                    send = self.websocket.send_bytes(frame)
+                else:
+                    send = self.websocket.send_text(frame)
+                with WS_SEND_DURATION.time():
+                    await asyncio.wait_for(send, timeout=self.send_timeout)
+                WS_MESSAGES_SENT.inc()
+                WS_BYTES_SENT.inc(len(frame), protocol=self.codec.name)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Conexión {self.id} de {self.user_id} no acepta mensajes, se cierra: {e}")
+            on_failure(self)
+
+    def close(self):
+        self.closed = True
+        if self._queue:
+            WS_MESSAGES_DROPPED.inc(len(self._queue), reason="closed")
+            WS_QUEUE_DEPTH.dec(len(self._queue))
+        self._queue.clear()
+        self._conflated.clear()
+        if self._writer and not self._writer.done():
+            self._writer.cancel()
+
+
+class SseConnection(ClientConnection):
+    """
+    Cliente Server-Sent Events: misma cola acotada y conflación que un
+    WebSocket, pero el escritor es el generador que consume StreamingResponse
+    """
+
+    def __init__(self, user_id: str, max_queue: int, heartbeat_seconds: float, retry_ms: int):
+        super().__init__(None, user_id, max_queue, send_timeout=0.0, codec=SSE_CODEC)
+        self.heartbeat_seconds = heartbeat_seconds
+        self.retry_ms = retry_ms
+
+    def start(self, on_failure: Callable[["ClientConnection"], None]):
+        """Sin tarea escritora: los frames salen desde stream()"""
+
+    async def stream(self) -> AsyncIterator[str]:
+        yield f"retry: {self.retry_ms}\n\n"
+        while not self.closed:
+            if not self._queue:
+                self._ready.clear()
+                try:
+                    await asyncio.wait_for(self._ready.wait(), timeout=self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield ": ping\n\n"
+                continue
+            frame = self._next()
+            if frame is None:
+                continue
+            yield frame
+            WS_MESSAGES_SENT.inc()
+            WS_BYTES_SENT.inc(len(frame), protocol=SSE)
+
+
+class ConnectionManager:
+    """Conexiones WebSocket y SSE por usuario (varias pestañas por usuario) con envío concurrente"""
+
+    def __init__(self,
+                 max_queue: int = 256,
+                 send_timeout: float = 5.0,
+                 sse_heartbeat_seconds: float = 15.0,
+                 sse_retry_ms: int = 3000):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.sse_heartbeat_seconds = sse_heartbeat_seconds
+        self.sse_retry_ms = sse_retry_ms
+        self.user_connections: Dict[str, Dict[str, ClientConnection]] = {}
+        # Por id del socket; las conexiones SSE se indexan por su propio id
+        self._by_socket: Dict[int, ClientConnection] = {}
+
+    @property
+    def active_connections(self) -> List[ClientConnection]:
+        return list(self._by_socket.values())
+
+    async def connect(self, websocket: WebSocket, user_id: str) -> ClientConnection:
+        codec, subprotocol = negotiate(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        connection = ClientConnection(websocket, user_id, self.max_queue, self.send_timeout, codec)
+        self._register(id(websocket), connection)
+        connection.start(self._drop_connection)
+        logger.info(
+            f"Usuario {user_id} conectado via WebSocket ({codec.name}, "
+            f"{len(self.user_connections[user_id])} conexiones)"
+        )
+        return connection
+
+    def connect_stream(self, user_id: str) -> SseConnection:
+        """Conexión SSE: recibe los mismos mensajes que los WebSocket del usuario"""
+        connection = SseConnection(user_id, self.max_queue, self.sse_heartbeat_seconds, self.sse_retry_ms)
+        self._register(id(connection), connection)
+        logger.info(f"Usuario {user_id} conectado via SSE ({len(self.user_connections[user_id])} conexiones)")
+        return connection
+
+    def _register(self, key: int, connection: ClientConnection):
+        self.user_connections.setdefault(connection.user_id, {})[connection.id] = connection
+        self._by_socket[key] = connection
+        self._update_gauge()
+
+    def get(self, websocket: WebSocket) -> Optional[ClientConnection]:
+        return self._by_socket.get(id(websocket))
+
+    def disconnect(self, websocket: WebSocket, user_id: str) -> bool:
+        """Cierra la conexión; devuelve True si el usuario todavía tiene otras abiertas"""
+        return self._unregister(id(websocket), user_id)
+
+    def disconnect_stream(self, connection: SseConnection) -> bool:
+        return self._unregister(id(connection), connection.user_id)
+
+    def _unregister(self, key: int, user_id: str) -> bool:
+        connection = self._by_socket.pop(key, None)
+        if connection is not None:
+            connection.close()
+            user_conns = self.user_connections.get(user_id, {})
+            user_conns.pop(connection.id, None)
+            if not user_conns:
+                self.user_connections.pop(user_id, None)
+        self._update_gauge()
+        logger.info(f"Usuario {user_id} desconectado")
+        return user_id in self.user_connections
+
+    def _drop_connection(self, connection: ClientConnection):
+        """El escritor falló (timeout o socket roto): se cierra el socket para liberar al lector"""
+        asyncio.create_task(self._close_socket(connection.websocket))
+
+    async def _close_socket(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def _update_gauge(self):
+        per_protocol: Dict[str, int] = {}
+        for connection in self._by_socket.values():
+            per_protocol[connection.codec.name] = per_protocol.get(connection.codec.name, 0) + 1
+        for name in [*CODECS, SSE]:
+            WS_CONNECTIONS.set(per_protocol.get(name, 0), protocol=name)
+
+    async def send_personal_message(self,
+                                    message: Payload,
+                                    user_id: str,
+                                    conflate_key: Optional[str] = None,
+                                    merge: Optional[MergeFn] = None):
+        await self.send_to_users(message, [user_id], conflate_key, merge)
+
+    async def send_to_users(self,
+                            message: Payload,
+                            user_ids: Iterable[str],
+                            conflate_key: Optional[str] = None,
+                            merge: Optional[MergeFn] = None):
+        """
+        Encola el mismo mensaje para varios usuarios codificándolo una sola vez
+        por protocolo. Acepta texto JSON ya serializado o un dict.
+        """
+        cache = EncodingCache(message)
+        for user_id in user_ids:
+            for connection in list(self.user_connections.get(user_id, {}).values()):
+                connection.enqueue(cache, conflate_key, merge)
+
+    async def send_to_connection(self, connection: ClientConnection, message: Payload):
+        """Mensaje para una sola conexión (respuestas a comandos de esa pestaña)"""
+        connection.enqueue(EncodingCache(message))
+
+    async def broadcast(self, message: Payload, conflate_key: Optional[str] = None, merge: Optional[MergeFn] = None):
+        cache = EncodingCache(message)
+        for connection in self.active_connections:
+            connection.enqueue(cache, conflate_key, merge)
+
+    def stats(self) -> Dict:
+        return {
+            "connections": len(self._by_socket),
+            "users": len(self.user_connections),
+            "queues": [
+                {"connection_id": c.id, "user_id": c.user_id, "protocol": c.codec.name, "depth": c.depth}
+                for c in sorted(self._by_socket.values(), key=lambda c: c.depth, reverse=True)
+            ],
+        }
+
+
+def create_connection_manager() -> ConnectionManager:
+    """Manager configurado desde settings"""
+    return ConnectionManager(
+        max_queue=settings.websocket_send_queue_size,
+        send_timeout=settings.websocket_send_timeout,
+        sse_heartbeat_seconds=settings.sse_heartbeat_seconds,
+        sse_retry_ms=settings.sse_retry_ms,
+    )
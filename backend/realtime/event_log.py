@@ -0,0 +1,135 @@
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config import settings
+from monitoring.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+EVENTS_APPENDED = registry.counter(
+    "trading_ai_event_log_appended_total",
+    "Eventos de usuario guardados para reenvío",
+)
+EVENTS_RESUMES = registry.counter(
+    "trading_ai_event_log_resumes_total",
+    "Reanudaciones de sesión por resultado",
+    ["result"],
+)
+EVENTS_REPLAYED = registry.counter(
+    "trading_ai_event_log_replayed_total",
+    "Eventos reenviados a clientes que reanudaron la sesión",
+)
+
+
+class EventLog:
+    """
+    Ring buffer acotado de eventos por usuario (señales, órdenes, estado de
+    sesión). Cada evento lleva un cursor "epoch:id"; un cliente que reconecta
+    pide lo posterior a su cursor en lugar de recargar todo por REST. El epoch
+    cambia con cada arranque del proceso, así un cursor viejo pide resync.
+    """
+
+    def __init__(self, max_events: int = 200, idle_ttl_seconds: float = 900.0):
+        self.max_events = max_events
+        self.idle_ttl = idle_ttl_seconds
+        self.epoch = uuid.uuid4().hex[:8]
+        # Ids globales y monótonos: un cursor nunca se reutiliza aunque se olvide un usuario
+        self._last_id = 0
+        self._events: Dict[str, Deque[Tuple[int, Dict[str, Any]]]] = {}
+        # Por usuario, el buffer tiene todos sus eventos con id > horizonte
+        self._horizon: Dict[str, int] = {}
+        self._touched: Dict[str, float] = {}
+        self._last_prune = time.monotonic()
+
+    def cursor(self, event_id: int) -> str:
+        return f"{self.epoch}:{event_id}"
+
+    def parse_cursor(self, cursor: str) -> Optional[int]:
+        """Id del cursor si pertenece a este proceso, si no None"""
+        epoch, _, event_id = str(cursor or "").partition(":")
+        if epoch != self.epoch or not event_id.isdigit():
+            return None
+        return int(event_id)
+
+    def _user_events(self, user_id: str) -> Deque[Tuple[int, Dict[str, Any]]]:
+        events = self._events.get(user_id)
+        if events is None:
+            events = self._events[user_id] = deque(maxlen=self.max_events)
+            self._horizon[user_id] = self._last_id
+        return events
+
+    def append(self, user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Guarda el evento y lo devuelve con su cursor"""
+        # Un solo espacio de claves aunque llegue el ObjectId del usuario
+        user_id = str(user_id)
+        events = self._user_events(user_id)
+        self._last_id += 1
+        event = {**payload, "cursor": self.cursor(self._last_id)}
+        if len(events) == events.maxlen:
+            # El evento que sale del buffer ya no se puede reenviar
+            self._horizon[user_id] = events[0][0]
+        events.append((self._last_id, event))
+        self._touch(user_id)
+        EVENTS_APPENDED.inc()
+        return event
+
+    def latest_cursor(self, user_id: str) -> str:
+        """Cursor desde el que un cliente recién conectado puede reanudar"""
+        user_id = str(user_id)
+        self._user_events(user_id)
+        self._touch(user_id)
+        return self.cursor(self._last_id)
+
+    def since(self, user_id: str, cursor: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Eventos posteriores al cursor, o None si no se puede reanudar (otro
+        proceso, cursor desconocido o eventos ya descartados del buffer)
+        """
+        user_id = str(user_id)
+        event_id = self.parse_cursor(cursor)
+        if event_id is None or event_id > self._last_id or user_id not in self._events:
+            EVENTS_RESUMES.inc(result="resync")
+            return None
+        self._touch(user_id)
+
+        if event_id < self._horizon[user_id]:
+            EVENTS_RESUMES.inc(result="gap")
+            return None
+
+        missed = [event for stored_id, event in self._events[user_id] if stored_id > event_id]
+        EVENTS_RESUMES.inc(result="resumed")
+        EVENTS_REPLAYED.inc(len(missed))
+        return missed
+
+    def _touch(self, user_id: str):
+        now = time.monotonic()
+        self._touched[user_id] = now
+        if now - self._last_prune >= 60.0:
+            self._last_prune = now
+            self.prune(now)
+
+    def prune(self, now: Optional[float] = None):
+        """Olvida los buffers de usuarios inactivos más allá del TTL"""
+        now = time.monotonic() if now is None else now
+        for user_id in [u for u, touched in self._touched.items() if now - touched > self.idle_ttl]:
+            self._events.pop(user_id, None)
+            self._horizon.pop(user_id, None)
+            self._touched.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "epoch": self.epoch,
+            "users": len(self._events),
+            "events": sum(len(events) for events in self._events.values()),
+        }
+
+
+def create_event_log() -> EventLog:
+    """Buffer configurado desde settings"""
+    return EventLog(
+        max_events=settings.realtime_event_buffer_size,
+        idle_ttl_seconds=settings.realtime_event_buffer_ttl_seconds,
+    )
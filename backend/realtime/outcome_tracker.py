@@ -0,0 +1,401 @@
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import numpy as np
+from bson import ObjectId
+
+from config import settings
+from database.performance import BREAKEVEN, LOSS, PROFIT
+from database.signal_feed import close_signals
+from monitoring.metrics import registry
+from realtime.subscriptions import OUTCOMES, SubscriptionRegistry
+from realtime.tick_hub import TickListener
+
+logger = logging.getLogger(__name__)
+
+# Suscriptor interno con el que el tracker pide al hub los ticks de sus símbolos
+OUTCOMES_SUBSCRIBER = "__outcomes__"
+
+OPEN_SIGNALS = registry.gauge(
+    "trading_ai_outcome_open_signals",
+    "Señales ACTIVE seguidas por el tracker de resultados",
+)
+SIGNALS_CLOSED = registry.counter(
+    "trading_ai_outcome_signals_closed_total",
+    "Señales cerradas por el tracker según el nivel alcanzado",
+    ["exit"],
+)
+OUTCOME_PROCESS_SECONDS = registry.histogram(
+    "trading_ai_outcome_process_seconds",
+    "Duración de una pasada del tracker sobre los símbolos con ticks nuevos",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5),
+)
+
+NotifyFn = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+# Proyección mínima para cargar las señales abiertas
+TRACKED_FIELDS = {
+    "user_id": 1, "symbol": 1, "timeframe": 1, "signal_type": 1,
+    "entry_price": 1, "stop_loss": 1, "take_profit": 1, "max_profit": 1, "max_loss": 1,
+}
+
+
+def pip_size(symbol: str, price: float) -> float:
+    """Tamaño del pip: 0.01 en pares JPY y precios altos, 0.1 en oro, 0.0001 en el resto"""
+    symbol = symbol.upper()
+    if symbol.startswith("XAU"):
+        return 0.1
+    if "JPY" in symbol or price >= 20:
+        return 0.01
+    return 0.0001
+
+
+class SymbolSignals:
+    """
+    Señales abiertas de un símbolo en columnas de NumPy: un tick se evalúa
+    contra todas con unas pocas operaciones vectorizadas. Las altas se
+    acumulan y se incorporan en la siguiente pasada.
+    """
+
+    def __init__(self):
+        self.ids: List[ObjectId] = []
+        self.user_ids: List[str] = []
+        self.timeframes: List[str] = []
+        self.direction = np.empty(0, dtype=np.float64)
+        self.entry = np.empty(0, dtype=np.float64)
+        self.stop_loss = np.empty(0, dtype=np.float64)
+        self.take_profit = np.empty(0, dtype=np.float64)
+        self.pip = np.empty(0, dtype=np.float64)
+        # Excursiones en pips: máxima a favor (>= 0) y peor en contra (<= 0)
+        self.max_profit = np.empty(0, dtype=np.float64)
+        self.max_loss = np.empty(0, dtype=np.float64)
+        # Excursiones que cambiaron desde la última escritura
+        self.dirty = np.empty(0, dtype=bool)
+        self._incoming: List[Dict[str, Any]] = []
+        # Extremos de bid/ask desde la última pasada
+        self.window: Optional[List[float]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self._incoming)
+
+    def add(self, row: Dict[str, Any]):
+        self._incoming.append(row)
+
+    def on_tick(self, bid: float, ask: float):
+        if self.window is None:
+            self.window = [bid, bid, ask, ask]
+        else:
+            window = self.window
+            window[0] = max(window[0], bid)
+            window[1] = min(window[1], bid)
+            window[2] = max(window[2], ask)
+            window[3] = min(window[3], ask)
+
+    def merge_incoming(self):
+        if not self._incoming:
+            return
+        rows, self._incoming = self._incoming, []
+        self.ids.extend(row["_id"] for row in rows)
+        self.user_ids.extend(row["user_id"] for row in rows)
+        self.timeframes.extend(row["timeframe"] for row in rows)
+
+        def column(name):
+            return np.asarray([row[name] for row in rows], dtype=np.float64)
+
+        self.direction = np.concatenate([self.direction, column("direction")])
+        self.entry = np.concatenate([self.entry, column("entry")])
+        self.stop_loss = np.concatenate([self.stop_loss, column("stop_loss")])
+        self.take_profit = np.concatenate([self.take_profit, column("take_profit")])
+        self.pip = np.concatenate([self.pip, column("pip")])
+        self.max_profit = np.concatenate([self.max_profit, column("max_profit")])
+        self.max_loss = np.concatenate([self.max_loss, column("max_loss")])
+        self.dirty = np.concatenate([self.dirty, np.zeros(len(rows), dtype=bool)])
+
+    def keep(self, mask: np.ndarray):
+        """Se queda con las filas marcadas (quita cerradas o borradas)"""
+        self.ids = [value for value, kept in zip(self.ids, mask) if kept]
+        self.user_ids = [value for value, kept in zip(self.user_ids, mask) if kept]
+        self.timeframes = [value for value, kept in zip(self.timeframes, mask) if kept]
+        for name in ("direction", "entry", "stop_loss", "take_profit", "pip", "max_profit", "max_loss", "dirty"):
+            setattr(self, name, getattr(self, name)[mask])
+
+    def remove(self, signal_id: ObjectId) -> bool:
+        before = len(self)
+        self._incoming = [row for row in self._incoming if row["_id"] != signal_id]
+        if signal_id in self.ids:
+            self.keep(np.asarray([value != signal_id for value in self.ids], dtype=bool))
+        return len(self) < before
+
+    def process(self) -> List[Dict[str, Any]]:
+        """
+        Aplica la ventana de precios a todas las señales: excursiones y
+        toques de SL/TP. Devuelve los cierres y quita esas filas. Las altas
+        entran después: la ventana puede ser anterior a su creación.
+        """
+        window, self.window = self.window, None
+        closes = self._apply(window) if window is not None and self.ids else []
+        self.merge_incoming()
+        return closes
+
+    def _apply(self, window: List[float]) -> List[Dict[str, Any]]:
+        bid_high, bid_low, ask_high, ask_low = window
+
+        # Las compras se cierran al bid y las ventas al ask
+        buy = self.direction > 0
+        favorable = np.where(buy, bid_high, ask_low)
+        adverse = np.where(buy, bid_low, ask_high)
+        profit = (favorable - self.entry) * self.direction / self.pip
+        loss = (adverse - self.entry) * self.direction / self.pip
+
+        max_profit = np.maximum(self.max_profit, profit)
+        max_loss = np.minimum(self.max_loss, loss)
+        self.dirty |= (max_profit != self.max_profit) | (max_loss != self.max_loss)
+        self.max_profit, self.max_loss = max_profit, max_loss
+
+        with np.errstate(invalid="ignore"):
+            sl_hit = (adverse - self.stop_loss) * self.direction <= 0
+            tp_hit = (favorable - self.take_profit) * self.direction >= 0
+        # NaN (sin nivel) nunca compara como cierto; con los dos en la misma ventana manda el SL
+        closed = sl_hit | tp_hit
+        if not closed.any():
+            return []
+
+        exit_price = np.where(sl_hit, self.stop_loss, self.take_profit)
+        pips = np.round((exit_price - self.entry) * self.direction / self.pip, 1)
+        closes = []
+        for index in np.flatnonzero(closed):
+            result = PROFIT if pips[index] > 0 else LOSS if pips[index] < 0 else BREAKEVEN
+            closes.append({
+                "_id": self.ids[index],
+                "user_id": self.user_ids[index],
+                "timeframe": self.timeframes[index],
+                "status": "CLOSED",
+                "exit": "sl" if sl_hit[index] else "tp",
+                "exit_price": float(exit_price[index]),
+                "result": result,
+                "pips_result": float(pips[index]),
+                "max_profit": float(np.round(self.max_profit[index], 1)),
+                "max_loss": float(np.round(self.max_loss[index], 1)),
+            })
+        self.keep(~closed)
+        return closes
+
+
+class OutcomeTracker(TickListener):
+    """
+    Sigue todas las señales ACTIVE con los ticks del hub. Los ticks sólo
+    amplían la ventana de extremos del símbolo; en cada flush del hub cada
+    símbolo con ticks nuevos se procesa una vez para todas sus señales. Los
+    cierres se escriben en un bulk_write y las excursiones por la cola diferida.
+    """
+
+    def __init__(self,
+                 subscriptions: SubscriptionRegistry,
+                 get_db: Callable[[], Any],
+                 write,
+                 notify: NotifyFn,
+                 samples=None,
+                 persist_interval_seconds: float = 5.0,
+                 sample_interval_seconds: float = 60.0):
+        self.subscriptions = subscriptions
+        self.get_db = get_db
+        self.write = write
+        self.notify = notify
+        self.samples = samples
+        self.persist_interval = persist_interval_seconds
+        self.sample_interval = sample_interval_seconds
+        self._symbols: Dict[str, SymbolSignals] = {}
+        self._owner: Dict[ObjectId, str] = {}
+        self._ticked: Set[str] = set()
+        self._latest: Dict[str, Dict] = {}
+        # Cierres cuya escritura falló: se reintentan en el próximo flush
+        self._retry: List[Dict[str, Any]] = []
+        self._last_persist = time.monotonic()
+        self._last_sample = 0.0
+
+    async def load(self):
+        """Carga las señales abiertas de Mongo (una pasada con proyección mínima)"""
+        cursor = self.get_db().trading_signals.find({"status": "ACTIVE"}, TRACKED_FIELDS).batch_size(5000)
+        loaded = 0
+        async for doc in cursor:
+            if self.add(doc):
+                loaded += 1
+        logger.info(f"Tracker de resultados: {loaded} señales abiertas cargadas")
+
+    def add(self, signal: Dict[str, Any]) -> bool:
+        """Empieza a seguir una señal BUY/SELL con _id y precio de entrada"""
+        signal_type = str(getattr(signal.get("signal_type"), "value", signal.get("signal_type"))).upper()
+        if signal_type not in ("BUY", "SELL") or not signal.get("entry_price") or "_id" not in signal:
+            return False
+        symbol = str(signal["symbol"]).upper()
+        entry = float(signal["entry_price"])
+        book = self._symbols.get(symbol)
+        if book is None:
+            book = self._symbols[symbol] = SymbolSignals()
+            self.subscriptions.subscribe(OUTCOMES_SUBSCRIBER, symbol, OUTCOMES)
+        book.add({
+            "_id": signal["_id"],
+            "user_id": str(signal["user_id"]),
+            "timeframe": signal.get("timeframe"),
+            "direction": 1.0 if signal_type == "BUY" else -1.0,
+            "entry": entry,
+            "stop_loss": float(signal["stop_loss"]) if signal.get("stop_loss") else np.nan,
+            "take_profit": float(signal["take_profit"]) if signal.get("take_profit") else np.nan,
+            "pip": pip_size(symbol, entry),
+            "max_profit": float(signal.get("max_profit") or 0.0),
+            "max_loss": float(signal.get("max_loss") or 0.0),
+        })
+        self._owner[signal["_id"]] = symbol
+        OPEN_SIGNALS.set(len(self._owner))
+        return True
+
+    def remove(self, signal_id: ObjectId):
+        """Deja de seguir una señal (borrada por el usuario)"""
+        symbol = self._owner.pop(signal_id, None)
+        if symbol is None:
+            return
+        book = self._symbols.get(symbol)
+        if book is not None:
+            book.remove(signal_id)
+            self._release_symbol(symbol)
+        OPEN_SIGNALS.set(len(self._owner))
+
+    def _release_symbol(self, symbol: str):
+        book = self._symbols.get(symbol)
+        if book is not None and len(book) == 0:
+            del self._symbols[symbol]
+            self._ticked.discard(symbol)
+            self._latest.pop(symbol, None)
+            self.subscriptions.unsubscribe(OUTCOMES_SUBSCRIBER, symbol, OUTCOMES)
+
+    # Ticks del hub
+
+    def on_tick(self, symbol: str, tick: Dict):
+        book = self._symbols.get(symbol)
+        bid, ask = tick.get("bid"), tick.get("ask")
+        if book is None or not bid or not ask:
+            return
+        book.on_tick(float(bid), float(ask))
+        self._ticked.add(symbol)
+        self._latest[symbol] = tick
+
+    async def flush(self):
+        """Procesa cada símbolo con ticks nuevos, cierra las señales alcanzadas y persiste excursiones"""
+        closes: List[Dict[str, Any]] = []
+        if self._ticked:
+            started = time.perf_counter()
+            ticked, self._ticked = self._ticked, set()
+            for symbol in ticked:
+                book = self._symbols.get(symbol)
+                if book is None:
+                    continue
+                for close in book.process():
+                    close["symbol"] = symbol
+                    closes.append(close)
+            OUTCOME_PROCESS_SECONDS.observe(time.perf_counter() - started)
+
+        if closes:
+            self._untrack(closes)
+        closes, self._retry = self._retry + closes, []
+        if closes:
+            await self._close(closes)
+
+        now = time.monotonic()
+        if now - self._last_persist >= self.persist_interval:
+            self._last_persist = now
+            await self._persist_excursions()
+        if self.samples is not None and self.sample_interval > 0 and now - self._last_sample >= self.sample_interval:
+            self._last_sample = now
+            await self._sample()
+
+    def _untrack(self, closes: List[Dict[str, Any]]):
+        for close in closes:
+            self._owner.pop(close["_id"], None)
+            SIGNALS_CLOSED.inc(exit=close["exit"])
+        for symbol in {close["symbol"] for close in closes}:
+            self._release_symbol(symbol)
+        OPEN_SIGNALS.set(len(self._owner))
+
+    async def _close(self, closes: List[Dict[str, Any]]):
+        try:
+            # Señales recién creadas pueden seguir en la cola diferida
+            if self.write.depth:
+                await self.write.flush()
+            applied = await close_signals(self.get_db(), closes)
+        except Exception as e:
+            logger.error(f"Error cerrando {len(closes)} señales, se reintenta en el próximo flush: {e}")
+            self._retry = closes + self._retry
+            return
+
+        # Sólo se notifican los cierres que cambiaron la señal en Mongo
+        for close in applied:
+            try:
+                await self.notify(close["user_id"], {
+                    "type": "signal_closed",
+                    "signal_id": str(close["_id"]),
+                    "symbol": close["symbol"],
+                    "timeframe": close["timeframe"],
+                    "status": close["status"],
+                    "exit": close["exit"],
+                    "exit_price": close["exit_price"],
+                    "result": close["result"],
+                    "pips_result": close["pips_result"],
+                    "seq": close.get("seq"),
+                })
+            except Exception as e:
+                logger.error(f"Error notificando cierre de la señal {close['_id']}: {e}")
+
+    async def _persist_excursions(self):
+        """Encola $max/$min de las excursiones que cambiaron (idempotente ante reintentos)"""
+        for book in self._symbols.values():
+            rows = np.flatnonzero(book.dirty)
+            for index in rows:
+                await self.write.update(
+                    "trading_signals",
+                    {"_id": book.ids[index]},
+                    {
+                        "$max": {"max_profit": float(np.round(book.max_profit[index], 1))},
+                        "$min": {"max_loss": float(np.round(book.max_loss[index], 1))},
+                    },
+                )
+            book.dirty[rows] = False
+
+    async def _sample(self):
+        """Una muestra de bid/ask por señal abierta con el último tick de su símbolo"""
+        at = datetime.utcnow()
+        rows = []
+        for symbol, book in self._symbols.items():
+            tick = self._latest.get(symbol)
+            if tick is None:
+                continue
+            rows.extend((str(signal_id), at, tick.get("bid"), tick.get("ask")) for signal_id in book.ids)
+        try:
+            await self.samples.append_samples(rows)
+        except Exception as e:
+            logger.error(f"Error guardando muestras de precio de señales: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open": len(self._owner),
+            "retrying": len(self._retry),
+            "symbols": {symbol: len(book) for symbol, book in self._symbols.items()},
+        }
+
+
+def create_outcome_tracker(subscriptions: SubscriptionRegistry,
+                           get_db: Callable[[], Any],
+                           write,
+                           notify: NotifyFn,
+                           samples=None) -> OutcomeTracker:
+    """Tracker configurado desde settings"""
+    return OutcomeTracker(
+        subscriptions,
+        get_db=get_db,
+        write=write,
+        notify=notify,
+        samples=samples,
+        persist_interval_seconds=settings.outcome_persist_interval_seconds,
+        sample_interval_seconds=settings.outcome_sample_interval_seconds,
+    )
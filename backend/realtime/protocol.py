@@ -0,0 +1,143 @@
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple, Union
+
+from fastapi import WebSocket
+
+try:
+    import msgpack  # type: ignore
+except Exception:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+JSON = "json"
+MSGPACK = "msgpack"
+SSE = "sse"
+
+# Subprotocolos que el cliente ofrece en Sec-WebSocket-Protocol
+SUBPROTOCOLS = {
+    "trading.json.v1": JSON,
+    "trading.msgpack.v1": MSGPACK,
+}
+
+Payload = Union[str, Dict[str, Any]]
+Frame = Union[str, bytes]
+
+
+def _default(value: Any) -> Any:
+    """Tipos que no son JSON nativo (fechas, numpy) en los mensajes"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class Codec:
+    """Serialización de los mensajes de una conexión"""
+
+    name = JSON
+    binary = False
+
+    def encode(self, payload: Dict[str, Any]) -> Frame:
+        raise NotImplementedError
+
+    def decode(self, data: Frame) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    name = JSON
+    binary = False
+
+    def encode(self, payload: Dict[str, Any]) -> str:
+        return json.dumps(payload, separators=(",", ":"), default=_default)
+
+    def decode(self, data: Frame) -> Dict[str, Any]:
+        return json.loads(data)
+
+
+class MsgpackCodec(Codec):
+    """Frames binarios: floats de 8 bytes sin texto y sin re-parseo en el cliente"""
+
+    name = MSGPACK
+    binary = True
+
+    def encode(self, payload: Dict[str, Any]) -> bytes:
+        return msgpack.packb(payload, use_bin_type=True, default=_default)
+
+    def decode(self, data: Frame) -> Dict[str, Any]:
+        if isinstance(data, str):
+            return json.loads(data)
+        return msgpack.unpackb(data, raw=False)
+
+
+class SseCodec(Codec):
+    """
+    Eventos text/event-stream. Los eventos reanudables llevan su cursor en
+    `id:`, así el navegador lo reenvía como Last-Event-ID al reconectar.
+    """
+
+    name = SSE
+    binary = False
+
+    def encode(self, payload: Dict[str, Any]) -> str:
+        data = JSON_CODEC.encode(payload)
+        cursor = payload.get("cursor")
+        return f"id: {cursor}\ndata: {data}\n\n" if cursor else f"data: {data}\n\n"
+
+    def decode(self, data: Frame) -> Dict[str, Any]:
+        raise ValueError("SSE es un canal sólo de servidor a cliente")
+
+
+JSON_CODEC = JsonCodec()
+SSE_CODEC = SseCodec()
+CODECS: Dict[str, Codec] = {JSON: JSON_CODEC}
+if msgpack is not None:
+    CODECS[MSGPACK] = MsgpackCodec()
+
+
+def negotiate(websocket: WebSocket) -> Tuple[Codec, Optional[str]]:
+    """
+    Elige el codec de la conexión: primero el subprotocolo ofrecido por el
+    cliente, después `?protocol=`; sin acuerdo se usa JSON como hasta ahora.
+    """
+    for subprotocol in websocket.scope.get("subprotocols", []):
+        name = SUBPROTOCOLS.get(subprotocol)
+        if name in CODECS:
+            return CODECS[name], subprotocol
+
+    requested = websocket.query_params.get("protocol")
+    if requested:
+        if requested in CODECS:
+            return CODECS[requested], None
+        logger.warning(f"Protocolo WebSocket no disponible: {requested}, se usa JSON")
+    return JSON_CODEC, None
+
+
+class EncodingCache:
+    """Codifica un mensaje una sola vez por codec durante un envío a muchas conexiones"""
+
+    def __init__(self, message: Payload):
+        self.message = message
+        self._decoded: Optional[Dict[str, Any]] = None
+        self._frames: Dict[str, Frame] = {}
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        if isinstance(self.message, dict):
+            return self.message
+        if self._decoded is None:
+            self._decoded = json.loads(self.message)
+        return self._decoded
+
+    def frame(self, codec: Codec) -> Frame:
+        if codec.name not in self._frames:
+            if isinstance(self.message, str) and codec.name == JSON:
+                # Los mensajes que ya vienen como texto JSON se envían tal cual
+                self._frames[codec.name] = self.message
+            else:
+                self._frames[codec.name] = codec.encode(self.payload)
+        return self._frames[codec.name]
@@ -0,0 +1,174 @@
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from monitoring.metrics import registry as metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Pseudo-timeframe para suscripciones sólo a precios en vivo
+TICKS = "TICKS"
+# Prefijo de las suscripciones a velas en vivo: "CANDLES:H1"
+CANDLES = "CANDLES"
+# Pseudo-timeframe con el que el motor de alertas pide ticks de sus símbolos
+ALERTS = "ALERTS"
+# Seguimiento de resultados de las señales abiertas
+OUTCOMES = "OUTCOMES"
+
+SubscriptionKey = Tuple[str, str]
+
+SUBSCRIPTION_KEYS = metrics_registry.gauge(
+    "trading_ai_subscription_keys",
+    "Claves (símbolo, timeframe) con al menos un suscriptor",
+    ["timeframe"],
+)
+SUBSCRIPTION_USERS = metrics_registry.gauge(
+    "trading_ai_subscription_users",
+    "Usuarios con al menos una suscripción activa",
+)
+
+
+class SubscriptionListener:
+    """Consumidor del registro (scheduler, hub de ticks): sólo sobreescribe lo que necesita"""
+
+    def on_key_added(self, key: SubscriptionKey):
+        """La clave tiene su primer suscriptor"""
+
+    def on_key_removed(self, key: SubscriptionKey):
+        """La clave se quedó sin suscriptores"""
+
+    def on_subscriber_added(self, key: SubscriptionKey, user_id: str):
+        """Un usuario se sumó a la clave (incluido el primero)"""
+
+
+def make_key(symbol: str, timeframe: str = TICKS) -> SubscriptionKey:
+    return symbol.strip().upper(), timeframe.strip().upper()
+
+
+def candles_timeframe(timeframe: str) -> str:
+    """Pseudo-timeframe de velas en vivo para un timeframe real"""
+    return f"{CANDLES}:{timeframe.strip().upper()}"
+
+
+def split_candles_timeframe(timeframe: str) -> Optional[str]:
+    """Timeframe real de un pseudo-timeframe de velas, o None si no lo es"""
+    prefix, _, real = timeframe.partition(":")
+    return real if prefix == CANDLES and real else None
+
+
+def is_live_timeframe(timeframe: str) -> bool:
+    """Claves que necesitan ticks del terminal (precios, velas en vivo, alertas o resultados)"""
+    return timeframe in (TICKS, ALERTS, OUTCOMES) or split_candles_timeframe(timeframe) is not None
+
+
+class SubscriptionRegistry:
+    """
+    Registro de suscripciones en tiempo real: (símbolo, timeframe) -> usuarios
+    y el índice inverso usuario -> claves para limpiar en O(claves del usuario)
+    al desconectar. Los consumidores sólo calculan lo que alguien está mirando.
+    """
+
+    def __init__(self):
+        self._users_by_key: Dict[SubscriptionKey, Set[str]] = {}
+        self._keys_by_user: Dict[str, Set[SubscriptionKey]] = {}
+        self._listeners: List[SubscriptionListener] = []
+        self._gauge_timeframes: Set[str] = set()
+
+    def add_listener(self, listener: SubscriptionListener):
+        self._listeners.append(listener)
+
+    def subscribe(self, user_id: str, symbol: str, timeframe: str = TICKS) -> bool:
+        """Suscribe al usuario; devuelve False si ya estaba suscrito"""
+        key = make_key(symbol, timeframe)
+        users = self._users_by_key.get(key)
+        if users is not None and user_id in users:
+            return False
+
+        is_new_key = users is None
+        if is_new_key:
+            users = self._users_by_key[key] = set()
+        users.add(user_id)
+        self._keys_by_user.setdefault(user_id, set()).add(key)
+
+        if is_new_key:
+            self._notify("on_key_added", key)
+        self._notify("on_subscriber_added", key, user_id)
+        self._update_gauges()
+        return True
+
+    def unsubscribe(self, user_id: str, symbol: str, timeframe: Optional[str] = None) -> List[SubscriptionKey]:
+        """Quita al usuario de un símbolo (en un timeframe o en todos)"""
+        symbol = symbol.strip().upper()
+        targets = [
+            key for key in self._keys_by_user.get(user_id, ())
+            if key[0] == symbol and (timeframe is None or key[1] == timeframe.strip().upper())
+        ]
+        for key in targets:
+            self._remove(user_id, key)
+        self._update_gauges()
+        return targets
+
+    def unsubscribe_user(self, user_id: str) -> List[SubscriptionKey]:
+        """Quita todas las suscripciones del usuario usando el índice inverso"""
+        keys = list(self._keys_by_user.get(user_id, ()))
+        for key in keys:
+            self._remove(user_id, key)
+        self._update_gauges()
+        return keys
+
+    def _remove(self, user_id: str, key: SubscriptionKey):
+        user_keys = self._keys_by_user.get(user_id)
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[user_id]
+
+        users = self._users_by_key.get(key)
+        if users is None:
+            return
+        users.discard(user_id)
+        if not users:
+            del self._users_by_key[key]
+            self._notify("on_key_removed", key)
+
+    # Consultas
+
+    def subscribers(self, key: SubscriptionKey) -> Set[str]:
+        return set(self._users_by_key.get(key, ()))
+
+    def keys_for(self, user_id: str) -> Set[SubscriptionKey]:
+        return set(self._keys_by_user.get(user_id, ()))
+
+    def keys(self, timeframe: Optional[str] = None) -> List[SubscriptionKey]:
+        return [key for key in self._users_by_key if timeframe is None or key[1] == timeframe]
+
+    def symbols(self, timeframe: Optional[str] = None) -> List[str]:
+        return sorted({key[0] for key in self.keys(timeframe)})
+
+    def live_symbols(self) -> List[str]:
+        return sorted({key[0] for key in self._users_by_key if is_live_timeframe(key[1])})
+
+    def stats(self) -> Dict:
+        return {
+            "users": len(self._keys_by_user),
+            "keys": [
+                {"symbol": key[0], "timeframe": key[1], "subscribers": len(users)}
+                for key, users in sorted(self._users_by_key.items())
+            ],
+        }
+
+    def _notify(self, event: str, *args):
+        for listener in self._listeners:
+            try:
+                getattr(listener, event)(*args)
+            except Exception as e:
+                logger.error(f"Error notificando {event} a {type(listener).__name__}: {e}")
+
+    def _update_gauges(self):
+        per_timeframe: Dict[str, int] = {}
+        for _, timeframe in self._users_by_key:
+            per_timeframe[timeframe] = per_timeframe.get(timeframe, 0) + 1
+        # Los timeframes que quedan vacíos se ponen a 0 en lugar de desaparecer
+        self._gauge_timeframes |= set(per_timeframe)
+        for timeframe in self._gauge_timeframes:
+            SUBSCRIPTION_KEYS.set(per_timeframe.get(timeframe, 0), timeframe=timeframe)
+        SUBSCRIPTION_USERS.set(len(self._keys_by_user))
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from config import settings
+from monitoring.metrics import registry
+from realtime.subscriptions import (
+    TICKS, SubscriptionKey, SubscriptionListener, SubscriptionRegistry, is_live_timeframe,
+)
+
+logger = logging.getLogger(__name__)
+
+TICK_POLLS = registry.counter(
+    "trading_ai_tick_hub_polls_total",
+    "Consultas de tick al terminal hechas por el hub (una por símbolo y ciclo)",
+)
+TICK_MESSAGES = registry.counter(
+    "trading_ai_tick_hub_messages_total",
+    "Mensajes de ticks enviados a clientes",
+)
+TICK_SYMBOLS = registry.gauge(
+    "trading_ai_tick_hub_symbols",
+    "Símbolos sondeados por el hub de ticks (precios o velas en vivo)",
+)
+
+# Campos del tick y su nombre corto en los mensajes
+TICK_FIELDS = {"bid": "b", "ask": "a", "last": "l", "volume": "v"}
+
+PollFn = Callable[[str], Optional[Dict]]
+SendFn = Callable[[str, Dict], Awaitable[None]]
+
+
+def compact_tick(tick: Dict) -> Dict:
+    """Tick de MT5 en formato corto: b/a/l/v y t en milisegundos epoch"""
+    data = {short: tick.get(name) for name, short in TICK_FIELDS.items()}
+    tick_time = tick.get("time")
+    data["t"] = int(tick_time.timestamp() * 1000) if hasattr(tick_time, "timestamp") else tick_time
+    return data
+
+
+class TickListener:
+    """Consumidor de los ticks del hub (velas en vivo): sólo sobreescribe lo que necesita"""
+
+    def on_tick(self, symbol: str, tick: Dict):
+        """Tick nuevo de un símbolo sondeado (sólo cuando cambió)"""
+
+    async def flush(self):
+        """Se llama al ritmo de push del hub para enviar lo acumulado"""
+
+
+def merge_tick_messages(pending: Dict, new: Dict) -> Dict:
+    """Fusiona dos mensajes de ticks pendientes sin perder campos del primero"""
+    data = {symbol: dict(delta) for symbol, delta in pending.get("d", {}).items()}
+    for symbol, delta in new.get("d", {}).items():
+        data.setdefault(symbol, {}).update(delta)
+    return {**pending, "ts": new.get("ts", pending.get("ts")), "d": data}
+
+
+class TickHub(SubscriptionListener):
+    """
+    Hub de precios en vivo. Consulta cada símbolo suscrito una sola vez por
+    ciclo, guarda el último valor en un slot por símbolo y empuja a cada
+    cliente sólo los campos que cambiaron, a una frecuencia máxima.
+    """
+
+    def __init__(self,
+                 subscriptions: SubscriptionRegistry,
+                 poll: PollFn,
+                 send: SendFn,
+                 poll_interval_ms: float = 250.0,
+                 max_push_hz: float = 4.0):
+        self.subscriptions = subscriptions
+        self.poll = poll
+        self.send = send
+        self.poll_interval = poll_interval_ms / 1000.0
+        self.push_interval = 1.0 / max_push_hz if max_push_hz > 0 else 0.0
+        self._latest: Dict[str, Dict] = {}
+        self._pushed: Dict[str, Dict] = {}
+        self._dirty: Set[str] = set()
+        self._last_push = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._tick_listeners: List[TickListener] = []
+        subscriptions.add_listener(self)
+
+    def add_tick_listener(self, listener: TickListener):
+        self._tick_listeners.append(listener)
+
+    # Eventos del registro de suscripciones
+
+    def on_key_added(self, key: SubscriptionKey):
+        if is_live_timeframe(key[1]):
+            TICK_SYMBOLS.set(len(self.subscriptions.live_symbols()))
+            self.start()
+
+    def on_key_removed(self, key: SubscriptionKey):
+        if not is_live_timeframe(key[1]):
+            return
+        symbol = key[0]
+        if key[1] == TICKS:
+            self._pushed.pop(symbol, None)
+        if symbol not in self.subscriptions.live_symbols():
+            self._latest.pop(symbol, None)
+            self._pushed.pop(symbol, None)
+            self._dirty.discard(symbol)
+        TICK_SYMBOLS.set(len(self.subscriptions.live_symbols()))
+
+    def snapshot(self, symbols: List[str]) -> Dict[str, Dict]:
+        """Último valor conocido de cada símbolo (para el mensaje inicial de un cliente)"""
+        return {s.upper(): self._latest[s.upper()] for s in symbols if s.upper() in self._latest}
+
+    def latest(self, symbol: str) -> Optional[Dict]:
+        return self._latest.get(symbol.upper())
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        logger.info("Hub de ticks iniciado")
+        while self.subscriptions.live_symbols():
+            started = time.monotonic()
+            try:
+                await self._poll_all()
+                if self._dirty and started - self._last_push >= self.push_interval:
+                    self._last_push = started
+                    await self._push()
+                    for listener in self._tick_listeners:
+                        await listener.flush()
+            except Exception as e:
+                logger.error(f"Error en hub de ticks: {e}")
+            await asyncio.sleep(max(0.0, self.poll_interval - (time.monotonic() - started)))
+        logger.info("Hub de ticks detenido: sin suscriptores")
+
+    async def _poll_all(self):
+        symbols = self.subscriptions.live_symbols()
+        # Un único salto a un hilo por ciclo para todos los símbolos
+        ticks = await asyncio.to_thread(lambda: [self.poll(symbol) for symbol in symbols])
+        TICK_POLLS.inc(len(symbols))
+        for symbol, tick in zip(symbols, ticks):
+            if tick is None:
+                continue
+            data = compact_tick(tick)
+            if data != self._latest.get(symbol):
+                self._latest[symbol] = data
+                self._dirty.add(symbol)
+                for listener in self._tick_listeners:
+                    try:
+                        listener.on_tick(symbol, tick)
+                    except Exception as e:
+                        logger.error(f"Error en {type(listener).__name__} con tick de {symbol}: {e}")
+
+    def _delta(self, symbol: str) -> Dict:
+        current = self._latest[symbol]
+        previous = self._pushed.get(symbol, {})
+        return {k: v for k, v in current.items() if previous.get(k) != v}
+
+    async def _push(self):
+        deltas = {symbol: self._delta(symbol) for symbol in self._dirty if symbol in self._latest}
+        for symbol in deltas:
+            self._pushed[symbol] = self._latest[symbol]
+        self._dirty.clear()
+
+        # Un mensaje por usuario con todos los símbolos que cambiaron
+        per_user: Dict[str, Dict[str, Dict]] = {}
+        for symbol, delta in deltas.items():
+            for user_id in self.subscriptions.subscribers((symbol, TICKS)):
+                per_user.setdefault(user_id, {})[symbol] = delta
+
+        now_ms = int(time.time() * 1000)
+        await asyncio.gather(*(
+            self.send(user_id, {"type": "ticks", "ts": now_ms, "d": data})
+            for user_id, data in per_user.items()
+        ))
+        TICK_MESSAGES.inc(len(per_user))
+
+
+def create_tick_hub(subscriptions: SubscriptionRegistry, poll: PollFn, send: SendFn) -> TickHub:
+    """Hub configurado desde settings"""
+    return TickHub(
+        subscriptions=subscriptions,
+        poll=poll,
+        send=send,
+        poll_interval_ms=settings.tick_hub_poll_interval_ms,
+        max_push_hz=settings.tick_hub_max_push_hz,
+    )
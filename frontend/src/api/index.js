@@ -378,9 +378,12 @@ export default {
     }
   },
 
-  async getUserOrders() {
+  // Paginado por cursor: next_cursor de la respuesta pide la página siguiente
+  async getUserOrders(cursor = null, limit = 50) {
     try {
-      const response = await api.get("/api/mt5/orders")
+      const response = await api.get("/api/mt5/orders", {
+        params: cursor ? { limit, cursor } : { limit },
+      })
       return response.data
     } catch (error) {
       console.error("❌ Error obteniendo órdenes:", error)
@@ -475,6 +478,7 @@ export default {
       })
       return {
         signals: response.data.signals || response.data.data || response.data || [],
+        seq: response.data.seq,
       }
     } catch (error) {
       console.error("❌ Error obteniendo señales iniciales:", error)
@@ -484,6 +488,22 @@ export default {
     }
   },
 
+  async getSignalsPage(cursor = null, limit = 50, pair = null) {
+    try {
+      const params = { limit }
+      if (cursor) params.cursor = cursor
+      if (pair) params.pair = pair
+      const response = await api.get("/api/signals/signals/", { params })
+      return {
+        signals: response.data.signals || [],
+        nextCursor: response.data.next_cursor || null,
+      }
+    } catch (error) {
+      console.error("❌ Error obteniendo página de señales:", error)
+      return { signals: [], nextCursor: null }
+    }
+  },
+
   async analyzePair(pair, timeframe, config = null) {
     try {
       const strategyMapping = {
@@ -639,6 +659,17 @@ export default {
     }
   },
 
+  // Los listados traen sólo el resumen: el análisis completo se pide al abrir el detalle
+  async getSignalDetail(signalId) {
+    try {
+      const response = await api.get(`/api/signals/signals/${signalId}/detail`)
+      return response.data
+    } catch (error) {
+      console.error("❌ Error obteniendo detalle de señal:", error)
+      return null
+    }
+  },
+
   async getSignals(pair, timeframe, limit = 50) {
     try {
       const response = await api.get(`/signals/${pair}/${timeframe}`, {
@@ -157,8 +157,15 @@ const Charts = () => {
   const chartContainerRef = useRef(null)
   const chartInstanceRef = useRef(null)
   const wsRef = useRef(null)
+  const eventSourceRef = useRef(null)
   const mountedRef = useRef(true)
   const priceUpdateInterval = useRef(null)
+  const tickPairRef = useRef(null)
+  const selectedPairRef = useRef("EURUSD")
+  const candleKeyRef = useRef(null)
+  const signalSeqRef = useRef(null)
+  const eventCursorRef = useRef(null)
+  const timeframeRef = useRef("H1")
   const reconnectTimeoutRef = useRef(null)
 
   // Estados principales
@@ -699,6 +706,9 @@ const handleRiskLocked = (locked) => {
       if (wsRef.current) {
         wsRef.current.close()
       }
+      if (eventSourceRef.current) {
+        eventSourceRef.current.close()
+      }
       if (priceUpdateInterval.current) {
         clearInterval(priceUpdateInterval.current)
       }
@@ -736,6 +746,29 @@ const handleRiskLocked = (locked) => {
     }
   }, [realtimeEnabled, user?.id])
 
+  // Cambiar la suscripción de ticks cuando cambia el par seleccionado
+  useEffect(() => {
+    selectedPairRef.current = selectedPair
+    const ws = wsRef.current
+    if (!ws || ws.readyState !== WebSocket.OPEN || tickPairRef.current === selectedPair) return
+
+    if (tickPairRef.current) {
+      ws.send(JSON.stringify({ type: "unsubscribe_ticks", symbols: [tickPairRef.current] }))
+    }
+    ws.send(JSON.stringify({ type: "subscribe_ticks", symbols: [selectedPair] }))
+    tickPairRef.current = selectedPair
+  }, [selectedPair])
+
+  // La vela en formación llega del servidor: cambiar la suscripción con el par o el timeframe
+  useEffect(() => {
+    timeframeRef.current = timeframe
+    syncCandleSubscription()
+    if (eventSourceRef.current) {
+      // Las suscripciones del stream SSE van en la URL: se reabre con el par y timeframe nuevos
+      connectEventStream()
+    }
+  }, [selectedPair, timeframe])
+
   // ✅ Mejorado: Cargar datos cuando cambie el par o timeframe
   useEffect(() => {
     if (selectedPair && timeframe && mountedRef.current) {
@@ -793,6 +826,7 @@ const handleRiskLocked = (locked) => {
       const response = await api.getInitialSignals(80)
       if (mountedRef.current) {
         setSignals(response.signals || [])
+        trackSignalSeq(response.seq)
       }
     } catch (error) {
       console.error("Error cargando señales:", error)
@@ -1444,7 +1478,17 @@ const analyzeWithAI = async () => {
         setConnectionStatus("connected")
         setReconnectAttempts(0)
         showSnackbar("🟢 Conectado a análisis en tiempo real", "success")
-        startRealTimePriceUpdates()
+        // Los precios llegan por el hub de ticks del servidor: no hace falta sondear
+        stopRealTimePriceUpdates()
+        tickPairRef.current = selectedPairRef.current
+        wsRef.current.send(JSON.stringify({ type: "subscribe_ticks", symbols: [tickPairRef.current] }))
+        syncCandleSubscription()
+        // Al reconectar se reanuda desde el último evento visto en lugar de recargar por REST
+        if (eventCursorRef.current) {
+          wsRef.current.send(JSON.stringify({ type: "resume", cursor: eventCursorRef.current }))
+        } else if (signalSeqRef.current != null) {
+          wsRef.current.send(JSON.stringify({ type: "get_signals", since_seq: signalSeqRef.current }))
+        }
       }
     }
 
@@ -1460,6 +1504,8 @@ const analyzeWithAI = async () => {
     }
 
     wsRef.current.onclose = () => {
+      tickPairRef.current = null
+      candleKeyRef.current = null
       if (mountedRef.current) {
         setConnectionStatus("disconnected")
         stopRealTimePriceUpdates()
@@ -1478,8 +1524,9 @@ const analyzeWithAI = async () => {
             }
           }, realtimeSettings.reconnectDelay)
         } else if (reconnectAttempts >= realtimeSettings.maxRetries) {
-          showSnackbar("❌ Máximo de intentos de reconexión alcanzado", "error")
-          setRealtimeEnabled(false)
+          // Proxies que cortan WebSocket: mismo flujo de eventos por SSE en lugar de sondear por REST
+          showSnackbar("📡 WebSocket no disponible, usando Server-Sent Events", "warning")
+          connectEventStream()
         }
       }
     }
@@ -1493,7 +1540,52 @@ const analyzeWithAI = async () => {
     }
   }, [user?.id, realtimeEnabled, reconnectAttempts, realtimeSettings.maxRetries, realtimeSettings.reconnectDelay])
 
+  // Sin canal de comandos: los símbolos van en la URL y el navegador reanuda solo con Last-Event-ID
+  const connectEventStream = () => {
+    const token = localStorage.getItem("authToken")
+    if (!token || !mountedRef.current) return
+    closeEventStream()
+
+    const pair = selectedPairRef.current
+    const params = new URLSearchParams({ token, symbols: pair, candles: `${pair}:${timeframeRef.current}` })
+    if (eventCursorRef.current) {
+      params.set("cursor", eventCursorRef.current)
+    }
+    eventSourceRef.current = new EventSource(`http://127.0.0.1:8000/api/signals/stream?${params}`)
+
+    eventSourceRef.current.onopen = () => {
+      if (mountedRef.current) {
+        setConnectionStatus("connected")
+        stopRealTimePriceUpdates()
+      }
+    }
+
+    eventSourceRef.current.onmessage = (event) => {
+      if (!mountedRef.current) return
+
+      try {
+        handleWebSocketMessage(JSON.parse(event.data))
+      } catch (error) {
+        console.error("Error procesando evento SSE:", error)
+      }
+    }
+
+    eventSourceRef.current.onerror = () => {
+      if (mountedRef.current) {
+        setConnectionStatus("error")
+      }
+    }
+  }
+
+  const closeEventStream = () => {
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close()
+      eventSourceRef.current = null
+    }
+  }
+
   const disconnectWebSocket = () => {
+    closeEventStream()
     if (wsRef.current) {
       wsRef.current.close()
       wsRef.current = null
@@ -1505,16 +1597,149 @@ const analyzeWithAI = async () => {
     stopRealTimePriceUpdates()
   }
 
+  const syncCandleSubscription = () => {
+    const ws = wsRef.current
+    const pair = selectedPairRef.current
+    const tf = timeframeRef.current
+    if (!ws || ws.readyState !== WebSocket.OPEN || candleKeyRef.current === `${pair}:${tf}`) return
+
+    if (candleKeyRef.current) {
+      const [prevPair, prevTf] = candleKeyRef.current.split(":")
+      ws.send(JSON.stringify({ type: "unsubscribe_candles", pair: prevPair, timeframe: prevTf }))
+    }
+    ws.send(JSON.stringify({ type: "subscribe_candles", pair, timeframe: tf }))
+    candleKeyRef.current = `${pair}:${tf}`
+  }
+
+  // Velas del servidor: [t_ms, o, h, l, c, v]
+  const applyLiveCandles = (candles, replace) => {
+    const digits = selectedPairRef.current.includes("JPY") ? 2 : 5
+    const points = candles.map((c) => ({ x: new Date(c[0]), y: Number.parseFloat(c[4].toFixed(digits)) }))
+    if (replace) {
+      const newChartData = processRealMT5Data({ candles: candles.map((c) => ({ time: c[0], close: c[4] })) })
+      if (newChartData) {
+        setChartData(newChartData)
+        setIsChartReady(true)
+      }
+      return
+    }
+    setChartData((prevData) => {
+      if (!prevData || !prevData.datasets || !prevData.datasets[0]) return prevData
+      const newChartData = JSON.parse(JSON.stringify(prevData))
+      const data = newChartData.datasets[0].data
+      points.forEach((point) => {
+        const last = data[data.length - 1]
+        if (last && new Date(last.x).getTime() === point.x.getTime()) {
+          data[data.length - 1] = point
+        } else if (!last || new Date(last.x).getTime() < point.x.getTime()) {
+          data.push(point)
+        }
+      })
+      newChartData.datasets[0].data = data.slice(-100)
+      newChartData.labels = newChartData.datasets[0].data.map((point) => point.x)
+      return newChartData
+    })
+  }
+
+  const trackSignalSeq = (seq) => {
+    if (seq != null && (signalSeqRef.current == null || seq > signalSeqRef.current)) {
+      signalSeqRef.current = seq
+    }
+  }
+
+  const applySignalsDelta = (delta) => {
+    const signalId = (signal) => signal.id ?? signal._id
+    const deletedIds = new Set((delta.deleted || []).map((item) => item.id))
+    const statusById = new Map((delta.status_changes || []).map((item) => [item.id, item.status]))
+    const incoming = delta.signals || []
+    const incomingIds = new Set(incoming.map(signalId))
+
+    setSignals((prev) => {
+      const kept = prev
+        .filter((signal) => !deletedIds.has(signalId(signal)) && !incomingIds.has(signalId(signal)))
+        .map((signal) =>
+          statusById.has(signalId(signal)) ? { ...signal, status: statusById.get(signalId(signal)) } : signal,
+        )
+      return [...incoming.reverse(), ...kept].slice(0, 50)
+    })
+    trackSignalSeq(delta.seq)
+
+    if (delta.has_more && wsRef.current?.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify({ type: "get_signals", since_seq: delta.seq }))
+    }
+  }
+
+  // Las señales del listado no traen technical_analyses: se cargan al abrir el detalle
+  const openSignalDetails = async (signal) => {
+    setSelectedSignalDetails(signal)
+    setSignalDetailsOpen(true)
+
+    let detailed = signal
+    const id = signal.id ?? signal._id
+    if (!signal.technical_analyses && id) {
+      const detail = await api.getSignalDetail(id)
+      if (!detail || !mountedRef.current) return
+      detailed = { ...signal, ...detail }
+      setSelectedSignalDetails((current) => ((current?.id ?? current?._id) === id ? detailed : current))
+    }
+    if (detailed.symbol === selectedPairRef.current) {
+      createChartAnnotations(detailed)
+    }
+  }
+
   //  Manejo de mensajes WebSocket con señales detalladas
   const handleWebSocketMessage = (data) => {
     if (!mountedRef.current) return
+    if (data.cursor && data.type !== "session") {
+      eventCursorRef.current = data.cursor
+    }
 
     switch (data.type) {
+      case "session":
+        if (!eventCursorRef.current) {
+          eventCursorRef.current = data.cursor
+        }
+        break
+      case "resumed":
+        break
+      case "resync":
+        // El servidor no tiene los eventos perdidos: delta de señales por secuencia o recarga completa
+        eventCursorRef.current = data.cursor
+        if (signalSeqRef.current != null && wsRef.current?.readyState === WebSocket.OPEN) {
+          wsRef.current.send(JSON.stringify({ type: "get_signals", since_seq: signalSeqRef.current }))
+        } else {
+          loadInitialSignals()
+        }
+        break
+      case "order_filled":
+        showSnackbar(`✅ Orden ejecutada: ${data.symbol} ${data.order_type} ${data.volume}`, "success")
+        break
+      case "alert_triggered":
+        showSnackbar(`🔔 Alerta ${data.symbol}: ${data.message || data.value}`, "warning")
+        break
+      case "signal_closed":
+        setSignals((prev) =>
+          prev.map((signal) =>
+            signal.id === data.signal_id
+              ? { ...signal, status: data.status, result: data.result, pips_result: data.pips_result }
+              : signal,
+          ),
+        )
+        trackSignalSeq(data.seq)
+        showSnackbar(
+          `${data.result === "profit" ? "🎯" : "🛑"} ${data.symbol} ${data.timeframe} cerrada por ${data.exit.toUpperCase()}: ${data.pips_result} pips`,
+          data.result === "profit" ? "success" : "warning",
+        )
+        break
+      case "session_status":
+        showSnackbar(data.connected ? "🟢 Sesión MT5 conectada" : "🔴 Sesión MT5 desconectada", "info")
+        break
       case "new_signals":
       case "new_realtime_signals":
         // eslint-disable-next-line no-case-declarations
         const newSignals = data.signals || []
         setSignals((prev) => [...newSignals, ...prev].slice(0, 50))
+        newSignals.forEach((signal) => trackSignalSeq(signal.seq))
 
         if (newSignals.length > 0) {
           const latestSignal = newSignals[0]
@@ -1527,10 +1752,35 @@ const analyzeWithAI = async () => {
         break
       case "signals_update":
         setSignals(data.signals || [])
+        trackSignalSeq(data.seq)
+        break
+      case "signals_delta":
+        applySignalsDelta(data)
         break
       case "price_update":
         updateChartWithRealPrice(data)
         break
+      case "ticks": {
+        const tick = data.d?.[selectedPairRef.current]
+        if (tick && tick.b != null) {
+          const price = Number.parseFloat(tick.b.toFixed(selectedPairRef.current.includes("JPY") ? 2 : 5))
+          // El gráfico lo mueven los mensajes de vela; el tick sólo actualiza el precio mostrado
+          setRealTimePrice(price)
+          setLastPriceUpdate(new Date(tick.t ?? data.ts ?? Date.now()))
+          setTickCount((prev) => prev + 1)
+        }
+        break
+      }
+      case "candles":
+        if (data.symbol === selectedPairRef.current && data.timeframe === timeframeRef.current) {
+          applyLiveCandles(data.candles || [], true)
+        }
+        break
+      case "candle":
+        if (data.symbol === selectedPairRef.current && data.timeframe === timeframeRef.current) {
+          applyLiveCandles([...(data.closed || []), data.c], false)
+        }
+        break
       default:
         console.log("Mensaje WebSocket no manejado:", data)
     }
@@ -3202,13 +3452,7 @@ const analyzeWithAI = async () => {
                               transform: "translateY(-1px)",
                             },
                           }}
-                          onClick={() => {
-                            setSelectedSignalDetails(signal)
-                            setSignalDetailsOpen(true)
-                            if (signal.symbol === selectedPair) {
-                              createChartAnnotations(signal)
-                            }
-                          }}
+                          onClick={() => openSignalDetails(signal)}
                         >
                           <CardContent sx={{ p: 2, "&:last-child": { pb: 2 } }}>
                             <Box sx={{ display: "flex", justifyContent: "space-between", alignItems: "center", mb: 1 }}>